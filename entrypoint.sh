@@ -20,5 +20,6 @@ if [ "${APP_AUTO_RUN:-1}" = "0" ]; then
   tail -f /dev/null
 fi
 
-# поведение по умолчанию
+# поведение по умолчанию: индексы (идемпотентно), затем сбор
+python -m app migrate
 exec python -m app fetch-and-aggregate
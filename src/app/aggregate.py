@@ -1,7 +1,9 @@
 from .db import recompute_lang_distribution
 from .gitlab_client import GitLabClient
 from .gitlab_client_async import AsyncGitLabClient
+from .gitlab_client_graphql import GraphQLGitLabClient
 from .config import SETTINGS
+from .metrics import METRICS, start_metrics_server
 import logging
 import time
 
@@ -9,10 +11,25 @@ log = logging.getLogger(__name__)
 
 def fetch(limit: int | None = None) -> int:
     target = limit or SETTINGS.fetch_limit
+    server = start_metrics_server(SETTINGS.metrics_port) if SETTINGS.metrics_port else None
+    try:
+        return _fetch(target)
+    finally:
+        if SETTINGS.metrics_summary_file:
+            try:
+                METRICS.dump_json(SETTINGS.metrics_summary_file)
+            except OSError as e:
+                # сводка метрик не должна ни подменять ошибку сбора, ни проваливать удачный сбор
+                log.warning("Could not write metrics summary to %s: %s", SETTINGS.metrics_summary_file, e)
+        if server is not None:
+            server.shutdown()
+
+
+def _fetch(target: int) -> int:
     t0 = time.time()
-    if SETTINGS.use_async:
+    if SETTINGS.use_async or SETTINGS.fetch_backend == "graphql":
         async def _run():
-            client = AsyncGitLabClient()
+            client = GraphQLGitLabClient() if SETTINGS.fetch_backend == "graphql" else AsyncGitLabClient()
             try:
                 return await client.fetch_projects_with_metrics(target)
             finally:
@@ -27,10 +44,12 @@ def fetch(limit: int | None = None) -> int:
     else:
         client = GitLabClient(
             base_url=SETTINGS.gitlab_base_url,
-            token=SETTINGS.gitlab_token,
             rps=SETTINGS.requests_per_second,
         )
-        ok_count = client.fetch_projects_with_metrics(target)
+        try:
+            ok_count = client.fetch_projects_with_metrics(target)
+        finally:
+            client.close()
 
     elapsed = time.time() - t0
     log.info("Fetch finished: fetched=%s target=%s in %.1fs (avg_rps=%.2f)",
@@ -2,7 +2,7 @@ import argparse
 import logging
 from .aggregate import fetch as do_fetch, aggregate as do_aggregate
 from .config import SETTINGS
-from .db import get_db
+from .db import get_db, ensure_indexes, backfill_language_ids
 
 def setup_logging():
     logging.basicConfig(
@@ -21,6 +21,84 @@ def cmd_fetch_and_aggregate(args):
     cmd_fetch(args)
     cmd_aggregate(args)
 
+def cmd_migrate(_args):
+    for name in ensure_indexes():
+        print(f"index ok: {name}")
+    print(f"lang_ids backfilled: {backfill_language_ids()} projects")
+
+def cmd_snapshot(args):
+    from .snapshot import export_snapshot
+    path = export_snapshot(out_dir=args.out, rows_per_part=args.rows_per_part)
+    print(f"snapshot: {path}")
+
+def cmd_similar_index(args):
+    from .similar import build_index
+    path = build_index(out_dir=args.out, snapshot=args.snapshot, tables=args.tables, bits=args.bits, seed=args.seed)
+    print(f"similar index: {path}")
+
+def cmd_similar(args):
+    import time
+    from .similar import SimilarIndex
+    index = SimilarIndex(args.index)
+    row = index.row(args.project_id)
+    t0 = time.perf_counter()
+    found = index.exact(args.project_id, args.k) if args.exact else index.query(args.project_id, args.k, args.probes)
+    ms = (time.perf_counter() - t0) * 1000
+    fmt = lambda langs: ", ".join(f"{l} {s:.0%}" for l, s in list(langs.items())[:4])
+    print(f"{args.project_id}: {fmt(index.languages(row))}")
+    for pid, score in found:
+        print(f"  {pid:>12} cos={score:.3f}  {fmt(index.languages(index.row(pid)))}")
+    print(f"{len(found)} projects in {ms:.1f} ms ({'exact' if args.exact else 'lsh'})")
+
+def cmd_worker(args):
+    from .workqueue import run_worker
+    run_worker(owner=args.name, max_units=args.max_units, poll=args.poll)
+
+def cmd_coordinator(args):
+    import math
+    from .workqueue import WorkQueue, coordinate
+    queue = WorkQueue()
+    if args.reset:
+        print(f"units removed: {queue.reset()}")
+    if args.retry_failed:
+        print(f"failed units requeued: {queue.retry_failed()}")
+    end = args.end
+    if end is None and args.kind == "pages":
+        end = args.start + math.ceil(SETTINGS.fetch_limit / 100)  # по 100 проектов на странице
+    if end is not None:
+        print(f"units seeded: {queue.seed(args.kind, args.start, end, args.unit_size)} ({args.kind} {args.start}..{end - 1})")
+    coordinate(queue, interval=args.interval, once=args.once)
+
+def cmd_schedule(args):
+    from .refresh import schedule
+    plan = schedule(requests_per_day=args.requests_per_day)
+    if not plan.get("projects"):
+        print("no projects")
+        return
+    iv = plan["intervals"]
+    print(f"refresh plan: {plan['projects']} projects, {plan['refreshes_per_day']} refreshes/day "
+          f"x {plan['cost_per_refresh']} requests = {plan['requests_per_day']:.0f} requests/day")
+    print(f"intervals p10/p50/p90: {iv[10]}/{iv[50]}/{iv[90]} days, expected weighted freshness {plan['expected_freshness']:.3f}")
+
+def cmd_refresh(args):
+    from .refresh import run_refresh
+    stats = run_refresh(limit=args.limit, batch=args.batch)
+    print(f"refreshed: {stats['refreshed']} ({stats['changed']} changed, {stats['failed']} failed), requests: {stats['requests']}")
+
+def cmd_replay(args):
+    from .journal import replay
+    directory = args.dir or SETTINGS.journal_dir
+    if not directory:
+        raise SystemExit("journal directory is not set (--dir or JOURNAL_DIR)")
+    st = replay(directory, workers=args.workers, batch=args.batch, write_threads=args.write_threads,
+                mode=args.mode, include_open=args.include_open, dry_run=args.dry_run)
+    secs = max(st["seconds"], 1e-9)
+    print(f"replayed {st['segments']} segments: {st['records']} records ({st['skipped']} skipped), "
+          f"{st['projects']} project updates, {st['written']} written")
+    print(f"{secs:.1f}s: {st['records'] / secs:.0f} records/s, {st['projects'] / secs:.0f} projects/s, "
+          f"{st['bytes'] / 2**20 / secs:.1f} MB/s compressed; decode {st['decode_seconds']:.1f} cpu-s, "
+          f"write {st['write_seconds']:.1f}s")
+
 def cmd_report(_args):
     db = get_db()
     items = list(db[SETTINGS.mongo_coll_lang_dist].find().sort("project_count", -1).limit(50))
@@ -51,6 +129,70 @@ def main():
     p_both.add_argument("--limit", type=int, default=None)
     p_both.set_defaults(func=cmd_fetch_and_aggregate)
 
+    p_migrate = sub.add_parser("migrate", help="Создать индексы и словарь языков (один раз перед первым fetch)")
+    p_migrate.set_defaults(func=cmd_migrate)
+
+    p_snap = sub.add_parser("snapshot", help="Выгрузить projects в колоночный снапшот (Parquet)")
+    p_snap.add_argument("--out", type=str, default=None, help="Каталог снапшотов (по умолчанию SNAPSHOT_DIR)")
+    p_snap.add_argument("--rows-per-part", type=int, default=250_000, help="Проектов в одном файле")
+    p_snap.set_defaults(func=cmd_snapshot)
+
+    p_sidx = sub.add_parser("similar-index", help="Построить индекс похожих проектов по долям языков")
+    p_sidx.add_argument("--out", type=str, default=None, help="Каталог индекса (по умолчанию SIMILAR_INDEX_DIR)")
+    p_sidx.add_argument("--snapshot", type=str, default=None, help="Читать из снапшота (путь или latest) вместо Mongo")
+    p_sidx.add_argument("--tables", type=int, default=8, help="Число хеш-таблиц LSH")
+    p_sidx.add_argument("--bits", type=int, default=16, help="Бит (гиперплоскостей) на таблицу, <=32")
+    p_sidx.add_argument("--seed", type=int, default=0)
+    p_sidx.set_defaults(func=cmd_similar_index)
+
+    p_sim = sub.add_parser("similar", help="Проекты с самым похожим набором языков")
+    p_sim.add_argument("project_id", type=int)
+    p_sim.add_argument("--k", type=int, default=20, help="Сколько проектов вернуть")
+    p_sim.add_argument("--probes", type=int, default=4, help="Соседних бакетов на таблицу (больше — точнее и медленнее)")
+    p_sim.add_argument("--exact", action="store_true", help="Полный перебор вместо индекса")
+    p_sim.add_argument("--index", type=str, default=None, help="Каталог индекса (по умолчанию SIMILAR_INDEX_DIR)")
+    p_sim.set_defaults(func=cmd_similar)
+
+    p_worker = sub.add_parser("worker", help="Брать единицы работы из общей очереди в Mongo и собирать их проекты")
+    p_worker.add_argument("--name", type=str, default=None, help="Имя воркера в очереди (по умолчанию host:pid)")
+    p_worker.add_argument("--max-units", type=int, default=0, help="Выйти после N единиц (0 = пока очередь не опустеет)")
+    p_worker.add_argument("--poll", type=float, default=5.0, help="Пауза, когда свободных единиц нет, а чужие ещё в работе, с")
+    p_worker.set_defaults(func=cmd_worker)
+
+    p_coord = sub.add_parser("coordinator", help="Заполнить очередь единиц работы и следить за прогрессом")
+    p_coord.add_argument("--kind", choices=["pages", "ids"], default="pages",
+                         help="pages — страницы списка по звёздам, ids — диапазоны id проектов")
+    p_coord.add_argument("--start", type=int, default=1, help="Первая страница / первый id")
+    p_coord.add_argument("--end", type=int, default=None,
+                         help="Конец диапазона (не включая); для pages по умолчанию из FETCH_LIMIT, без него для ids — только мониторинг")
+    p_coord.add_argument("--unit-size", type=int, default=10, help="Страниц или id в одной единице")
+    p_coord.add_argument("--interval", type=float, default=10.0, help="Период отчёта, с")
+    p_coord.add_argument("--once", action="store_true", help="Один отчёт и выход")
+    p_coord.add_argument("--reset", action="store_true", help="Удалить все единицы перед заполнением")
+    p_coord.add_argument("--retry-failed", action="store_true", help="Вернуть failed единицы в очередь")
+    p_coord.set_defaults(func=cmd_coordinator)
+
+    p_sched = sub.add_parser("schedule", help="Пересчитать скорости изменений и refresh.next_at всех проектов")
+    p_sched.add_argument("--requests-per-day", type=float, default=None,
+                         help="Бюджет запросов в день (по умолчанию REFRESH_REQUESTS_PER_DAY)")
+    p_sched.set_defaults(func=cmd_schedule)
+
+    p_refresh = sub.add_parser("refresh", help="Пересобрать проекты, подошедшие по refresh.next_at, в пределах дневного бюджета")
+    p_refresh.add_argument("--limit", type=int, default=0, help="Максимум проектов за запуск (0 = пока есть бюджет и очередь)")
+    p_refresh.add_argument("--batch", type=int, default=200, help="Проектов за один проход очереди")
+    p_refresh.set_defaults(func=cmd_refresh)
+
+    p_replay = sub.add_parser("replay", help="Загрузить журнал сырых ответов API в projects (без обращений к GitLab)")
+    p_replay.add_argument("--dir", type=str, default=None, help="Каталог журнала (по умолчанию JOURNAL_DIR)")
+    p_replay.add_argument("--workers", type=int, default=SETTINGS.replay_workers, help="Процессов декодирования (0 = по числу CPU)")
+    p_replay.add_argument("--batch", type=int, default=SETTINGS.replay_batch, help="Операций на один bulk_write")
+    p_replay.add_argument("--write-threads", type=int, default=SETTINGS.replay_write_threads, help="Параллельных bulk_write")
+    p_replay.add_argument("--mode", type=str, default=None, choices=["safe", "fast", "unacked"],
+                          help="Write concern записи (по умолчанию MONGO_INGEST_MODE)")
+    p_replay.add_argument("--include-open", action="store_true", help="Читать и незакрытые сегменты (*.open, например после падения)")
+    p_replay.add_argument("--dry-run", action="store_true", help="Только декодировать, без записи в Mongo (замер)")
+    p_replay.set_defaults(func=cmd_replay)
+
     p_report = sub.add_parser("report", help="Вывести топ языков из БД")
     p_report.set_defaults(func=cmd_report)
 
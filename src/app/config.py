@@ -14,11 +14,23 @@ def _get_bool(name: str, default: str = "1") -> bool:
 class Settings:
     gitlab_base_url: str = _get_env("GITLAB_BASE_URL", "https://gitlab.com/api/v4")
     gitlab_token: str | None = _get_env("GITLAB_TOKEN", None)
+    gitlab_tokens: str = _get_env("GITLAB_TOKENS", "")  # несколько токенов через запятую (вместо GITLAB_TOKEN)
 
     mongo_uri: str = _get_env("MONGO_URI", "mongodb://localhost:27017")
     mongo_db: str = _get_env("MONGO_DB", "gitlab_stats")
     mongo_coll_projects: str = _get_env("MONGO_COLL_PROJECTS", "projects")
     mongo_coll_lang_dist: str = _get_env("MONGO_COLL_LANG_DIST", "lang_distribution")
+    mongo_coll_lang_vocab: str = _get_env("MONGO_COLL_LANG_VOCAB", "lang_vocab")
+    mongo_coll_meta: str = _get_env("MONGO_COLL_META", "meta")
+    mongo_coll_work_units: str = _get_env("MONGO_COLL_WORK_UNITS", "work_units")  # очередь app worker / coordinator
+    mongo_max_pool_size: int = int(_get_env("MONGO_MAX_POOL_SIZE", "100"))
+    mongo_min_pool_size: int = int(_get_env("MONGO_MIN_POOL_SIZE", "0"))
+    mongo_compressors: str = _get_env("MONGO_COMPRESSORS", "")  # например "zstd,snappy"
+    mongo_read_preference: str = _get_env("MONGO_READ_PREFERENCE", "primaryPreferred")  # для аналитики
+    mongo_ingest_mode: str = _get_env("MONGO_INGEST_MODE", "safe")  # safe|fast|unacked
+
+    snapshot_dir: str = _get_env("SNAPSHOT_DIR", "/app/cache/snapshots")
+    similar_index_dir: str = _get_env("SIMILAR_INDEX_DIR", "/app/cache/similar")  # индекс похожих проектов (mmap)
 
     fetch_limit: int = int(_get_env("FETCH_LIMIT", "150"))
     log_level: str = _get_env("LOG_LEVEL", "INFO")
@@ -28,6 +40,33 @@ class Settings:
     http_timeout: float = float(_get_env("HTTP_TIMEOUT", "30"))
     retries: int = int(_get_env("RETRIES", "5"))
     use_async: bool = _get_bool("USE_ASYNC", "1")
+    requests_per_second: float = float(_get_env("REQUESTS_PER_SECOND", "2.0"))  # только синхронный клиент, на каждый токен
+    sync_workers: int = int(_get_env("SYNC_WORKERS", "1"))  # потоки синхронного клиента; 1 = по одному проекту
+    upsert_batch: int = int(_get_env("UPSERT_BATCH", "500"))  # документов на один bulk_write при сборе
+    progress_file: str = _get_env("FETCH_PROGRESS_FILE", "/app/cache/fetch_progress.json")
+    work_lease_seconds: float = float(_get_env("WORK_LEASE_SECONDS", "120"))  # аренда единицы работы, продлевается heartbeat
+    work_heartbeat_seconds: float = float(_get_env("WORK_HEARTBEAT_SECONDS", "15"))
+    work_max_attempts: int = int(_get_env("WORK_MAX_ATTEMPTS", "5"))  # захватов единицы, после — failed
+    refresh_requests_per_day: float = float(_get_env("REFRESH_REQUESTS_PER_DAY", "20000"))  # бюджет app refresh
+    refresh_min_interval_hours: float = float(_get_env("REFRESH_MIN_INTERVAL_HOURS", "6"))  # чаще не пересобирать
+    refresh_max_interval_days: float = float(_get_env("REFRESH_MAX_INTERVAL_DAYS", "90"))  # реже не пересобирать
     metrics_mode: str = _get_env("METRICS_MODE", "full")  # full|fast
+    fetch_backend: str = _get_env("FETCH_BACKEND", "rest")  # rest|graphql
+    graphql_url: str | None = _get_env("GITLAB_GRAPHQL_URL", None)  # по умолчанию <GITLAB_BASE_URL без /api/v4>/api/graphql
+    graphql_batch: int = int(_get_env("GRAPHQL_BATCH", "100"))  # максимум проектов на запрос (GitLab отдаёт не больше 100)
+    graphql_sort: str = _get_env("GRAPHQL_SORT", "stars_desc")
+    json_decoder: str = _get_env("JSON_DECODER", "auto")  # auto|msgspec|orjson|stdlib
+    decode_pool: str = _get_env("DECODE_POOL", "none")  # none|thread|process — декодирование вне event loop
+    decode_workers: int = int(_get_env("DECODE_WORKERS", "0"))  # 0 = по числу CPU
+    decode_batch: int = int(_get_env("DECODE_BATCH", "64"))
+    decode_flush_ms: float = float(_get_env("DECODE_FLUSH_MS", "2"))
+    journal_dir: str = _get_env("JOURNAL_DIR", "")  # журнал сырых ответов API для app replay; пусто = не писать
+    journal_segment_mb: float = float(_get_env("JOURNAL_SEGMENT_MB", "256"))  # несжатого JSON на сегмент
+    journal_zstd_level: int = int(_get_env("JOURNAL_ZSTD_LEVEL", "3"))
+    replay_workers: int = int(_get_env("REPLAY_WORKERS", "0"))  # процессы декодирования app replay; 0 = по числу CPU
+    replay_batch: int = int(_get_env("REPLAY_BATCH", "5000"))  # операций на один bulk_write при replay
+    replay_write_threads: int = int(_get_env("REPLAY_WRITE_THREADS", "4"))  # параллельных bulk_write при replay
+    metrics_port: int = int(_get_env("METRICS_PORT", "0"))  # 0 = не поднимать /metrics
+    metrics_summary_file: str = _get_env("METRICS_SUMMARY_FILE", "/app/outputs/fetch_metrics.json")
 
 SETTINGS = Settings()
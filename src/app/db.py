@@ -1,17 +1,56 @@
 from datetime import datetime, timezone
-from typing import Iterable
-from pymongo import MongoClient, UpdateOne, ASCENDING
+from typing import Any, Iterable
+from pymongo import MongoClient, UpdateOne, ASCENDING, ReadPreference, ReturnDocument, WriteConcern
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
 from .config import SETTINGS
+from .metrics import METRICS
 import time
 import logging
 log = logging.getLogger(__name__)
 
 _client = None
 _db = None
+_lang_vocab: dict[str, int] = {}
+
+MAX_LANG_ID = 0xFFFF  # id языков хранятся как uint16
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+# safe — дефолт сервера (w=1 + журнал по настройкам сервера),
+# fast — w=1 без ожидания журнала, unacked — w=0 (только для первичной загрузки)
+INGEST_WRITE_CONCERNS = {
+    "safe": None,
+    "fast": WriteConcern(w=1, j=False),
+    "unacked": WriteConcern(w=0),
+}
+
+
+def client_options(
+    max_pool_size: int | None = None,
+    min_pool_size: int | None = None,
+    compressors: str | None = None,
+) -> dict:
+    """Keyword arguments for MongoClient built from SETTINGS (overridable for benchmarks)."""
+    opts = {
+        "serverSelectionTimeoutMS": 3000,
+        "maxPoolSize": SETTINGS.mongo_max_pool_size if max_pool_size is None else max_pool_size,
+        "minPoolSize": SETTINGS.mongo_min_pool_size if min_pool_size is None else min_pool_size,
+    }
+    compressors = SETTINGS.mongo_compressors if compressors is None else compressors
+    if compressors:
+        opts["compressors"] = compressors
+    return opts
 
 
 def get_db(retries: int = 10, delay: float = 3.0):
-    """Get MongoDB connection (persistent, with retries and indexes)."""
+    """Get MongoDB connection (persistent, with retries). Indexes are created by `app migrate`."""
     global _client, _db
 
     if _db is not None:
@@ -20,18 +59,10 @@ def get_db(retries: int = 10, delay: float = 3.0):
     last_err = None
     for attempt in range(1, retries + 1):
         try:
-            _client = MongoClient(SETTINGS.mongo_uri, serverSelectionTimeoutMS=3000)
+            _client = MongoClient(SETTINGS.mongo_uri, **client_options())
             _client.admin.command("ping")
             _db = _client[SETTINGS.mongo_db]
 
-            # Create indexes once
-            _db[SETTINGS.mongo_coll_projects].create_index(
-                [("project_id", ASCENDING)], unique=True
-            )
-            _db[SETTINGS.mongo_coll_lang_dist].create_index(
-                [("language", ASCENDING)], unique=True
-            )
-
             log.info("Mongo connected: %s (db=%s)", SETTINGS.mongo_uri, SETTINGS.mongo_db)
             return _db
 
@@ -44,8 +75,137 @@ def get_db(retries: int = 10, delay: float = 3.0):
 
     raise last_err
 
-def upsert_projects(project_docs: Iterable[dict]) -> int:
+
+def get_analytics_db():
+    """Same database, but reads go according to MONGO_READ_PREFERENCE (e.g. to secondaries)."""
+    db = get_db()
+    pref = READ_PREFERENCES.get(SETTINGS.mongo_read_preference)
+    if pref is None:
+        raise ValueError(f"Unknown MONGO_READ_PREFERENCE: {SETTINGS.mongo_read_preference}")
+    return db.client.get_database(db.name, read_preference=pref)
+
+
+def ingest_collection(name: str | None = None, mode: str | None = None) -> Collection:
+    """Collection handle with the write concern of the selected ingest mode (MONGO_INGEST_MODE)."""
+    mode = mode or SETTINGS.mongo_ingest_mode
+    if mode not in INGEST_WRITE_CONCERNS:
+        raise ValueError(f"Unknown MONGO_INGEST_MODE: {mode}")
+    coll = get_db()[name or SETTINGS.mongo_coll_projects]
+    wc = INGEST_WRITE_CONCERNS[mode]
+    return coll.with_options(write_concern=wc) if wc is not None else coll
+
+
+def ensure_indexes() -> list[str]:
+    """Create indexes required by the app. Run once via `app migrate`, not on every start."""
+    db = get_db()
+    created = [
+        db[SETTINGS.mongo_coll_projects].create_index(
+            [("project_id", ASCENDING)], unique=True
+        ),
+        # очередь app refresh: просроченные refresh.next_at
+        db[SETTINGS.mongo_coll_projects].create_index(
+            [("refresh.next_at", ASCENDING)], sparse=True
+        ),
+        db[SETTINGS.mongo_coll_lang_dist].create_index(
+            [("language", ASCENDING)], unique=True
+        ),
+        db[SETTINGS.mongo_coll_lang_vocab].create_index(
+            [("language", ASCENDING)], unique=True
+        ),
+        db[SETTINGS.mongo_coll_lang_vocab].create_index(
+            [("lang_id", ASCENDING)], unique=True
+        ),
+        # очередь app worker: захват по порядку диапазонов и поиск истёкших аренд
+        db[SETTINGS.mongo_coll_work_units].create_index(
+            [("status", ASCENDING), ("kind", ASCENDING), ("lo", ASCENDING)]
+        ),
+        db[SETTINGS.mongo_coll_work_units].create_index(
+            [("status", ASCENDING), ("lease_until", ASCENDING)]
+        ),
+    ]
+    log.info("Indexes ensured: %s", ", ".join(created))
+    return created
+
+def load_language_vocab() -> dict[str, int]:
+    """Persisted language -> uint16 id vocabulary (cached in-process, refreshed on misses)."""
+    rows = get_db()[SETTINGS.mongo_coll_lang_vocab].find({}, {"_id": 0, "language": 1, "lang_id": 1})
+    _lang_vocab.update({r["language"]: r["lang_id"] for r in rows})
+    return dict(_lang_vocab)
+
+
+def _allocate_lang_id(language: str) -> int:
+    db = get_db()
+    vocab = db[SETTINGS.mongo_coll_lang_vocab]
+    seq = db[SETTINGS.mongo_coll_meta].find_one_and_update(
+        {"_id": "lang_vocab"}, {"$inc": {"seq": 1}},
+        upsert=True, return_document=ReturnDocument.AFTER,
+    )["seq"] - 1
+    if seq > MAX_LANG_ID:
+        raise OverflowError(f"Language vocabulary is full ({MAX_LANG_ID + 1} ids)")
+    try:
+        vocab.insert_one({"language": language, "lang_id": seq})
+        return seq
+    except DuplicateKeyError:
+        # другой процесс успел добавить этот язык — берём его id (наш seq просто пропадает)
+        return vocab.find_one({"language": language})["lang_id"]
+
+
+def language_ids(languages: Iterable[str]) -> list[int]:
+    ids = []
+    for lang in languages:
+        idx = _lang_vocab.get(lang)
+        if idx is None:
+            load_language_vocab()
+            idx = _lang_vocab.get(lang)
+        if idx is None:
+            idx = _lang_vocab[lang] = _allocate_lang_id(lang)
+        ids.append(idx)
+    return ids
+
+
+def encode_languages(languages: dict | None) -> dict:
+    """{"Python": 82.1, ...} -> parallel arrays lang_ids / lang_pct stored next to `languages`."""
+    languages = languages or {}
+    return {
+        "lang_ids": language_ids(languages.keys()),
+        "lang_pct": [float(v or 0.0) for v in languages.values()],
+    }
+
+
+def language_ids_complete() -> bool:
+    """True once `app migrate` has backfilled lang_ids for the whole collection."""
+    meta = get_db()[SETTINGS.mongo_coll_meta].find_one({"_id": "lang_vocab"}) or {}
+    return bool(meta.get("backfilled"))
+
+
+def backfill_language_ids(batch_size: int = 1000) -> int:
+    """Add lang_ids/lang_pct to projects stored before the vocabulary existed."""
     db = get_db()
+    coll = db[SETTINGS.mongo_coll_projects]
+    target = ingest_collection()
+    ops = []
+    done = 0
+    cursor = coll.find({"lang_ids": {"$exists": False}}, {"_id": 1, "languages": 1}, no_cursor_timeout=True).batch_size(batch_size)
+    try:
+        for doc in cursor:
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": encode_languages(doc.get("languages"))}))
+            if len(ops) >= batch_size:
+                target.bulk_write(ops, ordered=False)
+                done += len(ops)
+                ops = []
+                if done % 100000 == 0:
+                    log.info("Backfilled lang_ids: %s projects", done)
+    finally:
+        cursor.close()
+    if ops:
+        target.bulk_write(ops, ordered=False)
+        done += len(ops)
+    db[SETTINGS.mongo_coll_meta].update_one({"_id": "lang_vocab"}, {"$set": {"backfilled": True}}, upsert=True)
+    log.info("Backfilled lang_ids for %s projects (vocabulary: %s languages)", done, len(_lang_vocab))
+    return done
+
+
+def upsert_projects(project_docs: Iterable[dict]) -> int:
     ops = []
     now = datetime.now(timezone.utc).isoformat()
 
@@ -57,20 +217,40 @@ def upsert_projects(project_docs: Iterable[dict]) -> int:
             continue
 
         doc["fetched_at"] = now
+        if "languages" in doc:
+            doc.update(encode_languages(doc["languages"]))
         ops.append(UpdateOne(
             {"project_id": doc["project_id"]},
-            {"$set": doc},
+            # journal_at — времена ответов, применённых app replay; после сбора их заменяет fetched_at
+            {"$set": doc, "$unset": {"journal_at": ""}},
             upsert=True
         ))
 
     if not ops:
         return 0
 
-    res = db[SETTINGS.mongo_coll_projects].bulk_write(ops, ordered=False)
+    t0 = time.perf_counter()
+    res = ingest_collection().bulk_write(ops, ordered=False)
+    METRICS.observe_flush(time.perf_counter() - t0, len(ops))
+    if not res.acknowledged:
+        # w=0: сервер не возвращает счётчики
+        log.info("Mongo sent %s upserts (unacknowledged)", len(ops))
+        return len(ops)
     log.info("Mongo upserted: %s modified, %s upserted",
              res.modified_count or 0, res.upserted_count or 0)
     return (res.upserted_count or 0) + (res.modified_count or 0)
 
+def known_projects(project_ids: Iterable[int]) -> dict[int, Any]:
+    """
+    project_id -> last_activity_at for already crawled projects that have languages.
+    Used by the fast crawl to skip /languages for projects that did not change.
+    """
+    cur = ingest_collection().find(
+        {"project_id": {"$in": list(project_ids)}, "languages": {"$exists": True}},
+        {"_id": 0, "project_id": 1, "last_activity_at": 1},
+    )
+    return {d["project_id"]: d.get("last_activity_at") for d in cur}
+
 def recompute_lang_distribution() -> list[dict]:
     """
     Efficiently recompute language distribution directly in MongoDB
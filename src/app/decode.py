@@ -0,0 +1,134 @@
+"""
+Decoding of GitLab API responses into the compact project schema.
+
+Detail payloads are several KB of JSON (links, access levels, templates...),
+of which the crawler keeps a couple dozen fields. With msgspec the response is
+decoded straight into a struct holding only those fields, and everything else
+is skipped by the parser without ever becoming Python objects. orjson and the
+stdlib decoder parse the whole payload and are used as fallbacks.
+
+Backend is chosen by JSON_DECODER: auto (msgspec > orjson > stdlib) | msgspec | orjson | stdlib.
+"""
+
+from __future__ import annotations
+import json
+import logging
+from typing import Any, Callable, Dict, List
+
+from .config import SETTINGS
+
+log = logging.getLogger(__name__)
+
+# поля /projects/:id, которые сохраняются в details (statistics — только при правах Reporter+)
+DETAIL_FIELDS = (
+    "id", "name", "path_with_namespace", "web_url", "description", "topics",
+    "star_count", "forks_count", "open_issues_count",
+    "default_branch", "visibility",
+    "created_at", "last_activity_at", "readme_url",
+    "issues_enabled", "merge_requests_enabled", "jobs_enabled", "wiki_enabled", "snippets_enabled",
+    "container_registry_access_level", "package_registry_access_level",
+    "namespace", "license", "repository_storage",
+    "statistics",
+)
+
+# поля элемента списка /projects, которые использует fetch
+LIST_FIELDS = (
+    "id", "name", "path_with_namespace", "web_url",
+    "star_count", "forks_count", "open_issues_count", "visibility",
+    "created_at", "last_activity_at",
+)
+
+
+def _pick(doc: Any, fields) -> Dict[str, Any]:
+    if not isinstance(doc, dict):
+        return {}
+    return {k: doc[k] for k in fields if k in doc}
+
+
+class JsonDecoder:
+    """stdlib / orjson: разбираем весь ответ, потом оставляем нужные поля."""
+
+    name = "stdlib"
+
+    def __init__(self, loads: Callable[[bytes], Any] = json.loads):
+        self.loads = loads
+
+    def details(self, content: bytes) -> Dict[str, Any]:
+        return _pick(self.loads(content or b"null"), DETAIL_FIELDS)
+
+    def listing(self, content: bytes) -> List[Dict[str, Any]]:
+        return [_pick(p, LIST_FIELDS) for p in self.loads(content or b"null") or []]
+
+    def languages(self, content: bytes) -> Dict[str, float]:
+        return self.loads(content or b"null") or {}
+
+
+class OrjsonDecoder(JsonDecoder):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        super().__init__(orjson.loads)
+
+
+class MsgspecDecoder(JsonDecoder):
+    """Декодирует сразу в структуры только с нужными полями; лишние поля парсер пропускает."""
+
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self._unset = msgspec.UNSET
+        self._asdict = msgspec.structs.asdict
+        # Any внутри полей: вложенные объекты (namespace, statistics) остаются словарями, как раньше
+        Details = msgspec.defstruct("Details", [(f, Any, msgspec.UNSET) for f in DETAIL_FIELDS])
+        Listed = msgspec.defstruct("Listed", [(f, Any, msgspec.UNSET) for f in LIST_FIELDS])
+        self._details = msgspec.json.Decoder(Details | None)
+        self._listing = msgspec.json.Decoder(List[Listed] | None)
+        self._languages = msgspec.json.Decoder(Dict[str, float] | None)
+        self._errors = (msgspec.ValidationError, msgspec.DecodeError)
+        super().__init__(msgspec.json.decode)
+
+    def _compact(self, obj) -> Dict[str, Any]:
+        return {k: v for k, v in self._asdict(obj).items() if v is not self._unset}
+
+    def details(self, content: bytes) -> Dict[str, Any]:
+        try:
+            obj = self._details.decode(content or b"null")
+        except self._errors:
+            return super().details(content)
+        return self._compact(obj) if obj is not None else {}
+
+    def listing(self, content: bytes) -> List[Dict[str, Any]]:
+        try:
+            items = self._listing.decode(content or b"null")
+        except self._errors:
+            return super().listing(content)
+        return [self._compact(p) for p in items or []]
+
+    def languages(self, content: bytes) -> Dict[str, float]:
+        try:
+            return self._languages.decode(content or b"null") or {}
+        except self._errors:
+            return super().languages(content)
+
+
+DECODERS = {"stdlib": JsonDecoder, "orjson": OrjsonDecoder, "msgspec": MsgspecDecoder}
+
+
+def get_decoder(name: str | None = None) -> JsonDecoder:
+    name = (name or SETTINGS.json_decoder).lower()
+    if name == "auto":
+        for candidate in ("msgspec", "orjson"):
+            try:
+                return DECODERS[candidate]()
+            except ImportError:
+                continue
+        return JsonDecoder()
+    if name not in DECODERS:
+        raise ValueError(f"Unknown JSON_DECODER: {name}")
+    return DECODERS[name]()
+
+
+DECODER = get_decoder()
@@ -0,0 +1,204 @@
+"""
+Decode + document shaping off the event loop.
+
+With DECODE_POOL=thread|process the async client hands raw response bytes to
+a worker pool instead of decoding them on the loop. Requests are grouped into
+batches (DECODE_BATCH items or DECODE_FLUSH_MS, whichever comes first), so one
+executor round-trip — and, for processes, one pickle — covers many responses.
+Only plain bytes and small dicts cross the process boundary.
+
+The thread pool only helps with decoders that release the GIL; with
+msgspec/orjson (which hold it) the process pool is the one that scales.
+"""
+
+from __future__ import annotations
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import logging
+import multiprocessing
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import SETTINGS
+from .decode import DECODER
+from .metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+# METRICS_MODE=fast: details собираются из элемента списка
+SIMPLE_DETAIL_FIELDS = (
+    "name", "path_with_namespace", "web_url",
+    "star_count", "forks_count", "open_issues_count", "visibility",
+    "created_at", "last_activity_at",
+)
+
+
+def shape_project(p: Dict[str, Any], details_raw: Optional[bytes], languages_raw: Optional[bytes], fast: bool = False) -> Dict[str, Any]:
+    """Документ projects из элемента списка и сырых ответов /projects/:id и /languages (None = запрос не удался)."""
+    if fast:
+        det = {k: p.get(k) for k in SIMPLE_DETAIL_FIELDS}
+    else:
+        det = DECODER.details(details_raw) if details_raw is not None else {}
+    lmap = DECODER.languages(languages_raw) if languages_raw is not None else {}
+    return {
+        "project_id": p["id"],
+        "name": det.get("name") or p.get("name"),
+        "path_with_namespace": det.get("path_with_namespace") or p.get("path_with_namespace"),
+        "web_url": det.get("web_url") or p.get("web_url"),
+        "star_count": det.get("star_count", p.get("star_count")),
+        "forks_count": det.get("forks_count") or p.get("forks_count"),
+        "open_issues_count": det.get("open_issues_count") or p.get("open_issues_count"),
+        "visibility": det.get("visibility") or p.get("visibility"),
+        "created_at": det.get("created_at") or p.get("created_at"),
+        "last_activity_at": det.get("last_activity_at") or p.get("last_activity_at"),
+        "details": det,
+        "languages": lmap,
+    }
+
+
+def _rest_time(ts: Optional[str]) -> Optional[str]:
+    """GraphQL отдаёт 2021-04-06T13:06:07Z, REST — 2021-04-06T13:06:07.000Z; храним как REST (сравнение last_activity_at)."""
+    if ts and ts.endswith("Z") and "." not in ts:
+        return ts[:-1] + ".000Z"
+    return ts
+
+
+def shape_graphql_node(node: Dict[str, Any]) -> Dict[str, Any]:
+    """Узел projects.nodes GraphQL -> документ projects той же схемы, что у REST (gid://gitlab/Project/123 -> 123)."""
+    det = {
+        "id": int(str(node["id"]).rsplit("/", 1)[-1]),
+        "name": node.get("name"),
+        "path_with_namespace": node.get("fullPath"),
+        "web_url": node.get("webUrl"),
+        "description": node.get("description"),
+        "topics": node.get("topics"),
+        "star_count": node.get("starCount"),
+        "forks_count": node.get("forksCount"),
+        "open_issues_count": node.get("openIssuesCount"),
+        "visibility": node.get("visibility"),
+        "created_at": _rest_time(node.get("createdAt")),
+        "last_activity_at": _rest_time(node.get("lastActivityAt")),
+    }
+    det = {k: v for k, v in det.items() if v is not None}
+    return {
+        "project_id": det["id"],
+        **{k: det.get(k) for k in SIMPLE_DETAIL_FIELDS},
+        "details": det,
+        "languages": {lang["name"]: lang["share"] for lang in node.get("languages") or [] if lang.get("name")},
+    }
+
+
+def shape_graphql_page(raw: bytes) -> Dict[str, Any]:
+    """
+    Ответ запроса projects -> {"docs", "page_info", "complexity", "errors"}.
+    Архивные и непубличные проекты отбрасываются (в REST их убирают archived=false и visibility=public;
+    у projects в GraphQL аргумента видимости нет, а с токеном он отдаёт и private/internal проекты владельца).
+    """
+    body = DECODER.loads(raw) or {}
+    projects = (body.get("data") or {}).get("projects") or {}
+    return {
+        "docs": [shape_graphql_node(n) for n in projects.get("nodes") or []
+                 if n and not n.get("archived") and n.get("visibility") == "public"],
+        "page_info": projects.get("pageInfo") or {},
+        "complexity": (body.get("data") or {}).get("queryComplexity"),
+        "errors": [e.get("message", "") for e in body.get("errors") or []],
+    }
+
+
+OPS = {
+    "listing": lambda raw: DECODER.listing(raw),
+    "details": lambda raw: DECODER.details(raw),
+    "languages": lambda raw: DECODER.languages(raw),
+    "project": shape_project,
+    "graphql": shape_graphql_page,
+}
+
+
+def run_op(op: str, *args):
+    return OPS[op](*args)
+
+
+def run_batch(batch: List[Tuple[str, tuple]]) -> List[Tuple[bool, Any]]:
+    """Выполняется в пуле: ошибки одного элемента не роняют весь батч."""
+    out = []
+    for op, args in batch:
+        try:
+            out.append((True, OPS[op](*args)))
+        except Exception as e:
+            out.append((False, e))
+    return out
+
+
+class DecodePool:
+    def __init__(self, kind: str, workers: int, batch_size: int = 64, flush_ms: float = 2.0):
+        if kind == "thread":
+            self.executor: Executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+        elif kind == "process":
+            # spawn: в процессе уже крутятся event loop и потоки, fork их не переживёт
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            raise ValueError(f"Unknown DECODE_POOL: {kind}")
+        self.kind = kind
+        self.batch_size = max(1, batch_size)
+        self.flush_delay = flush_ms / 1000
+        self.pending: List[Tuple[str, tuple, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.inflight = 0
+        log.info("Decode pool: %s x%s, batch=%s", kind, workers, self.batch_size)
+
+    @classmethod
+    def from_settings(cls) -> Optional["DecodePool"]:
+        kind = SETTINGS.decode_pool.lower()
+        if kind in ("", "none", "0"):
+            return None
+        workers = SETTINGS.decode_workers or os.cpu_count() or 2
+        return cls(kind, workers, SETTINGS.decode_batch, SETTINGS.decode_flush_ms)
+
+    async def submit(self, op: str, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.pending.append((op, args, fut))
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_delay, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        loop = asyncio.get_running_loop()
+        self.inflight += 1
+        METRICS.set("decode_pool_inflight_batches", self.inflight)
+        METRICS.inc("decode_pool_batches_total")
+        METRICS.inc("decode_pool_items_total", len(batch))
+        cf = loop.run_in_executor(self.executor, run_batch, [(op, args) for op, args, _ in batch])
+
+        def _deliver(done: asyncio.Future):
+            self.inflight -= 1
+            METRICS.set("decode_pool_inflight_batches", self.inflight)
+            if done.cancelled():
+                for _, _, fut in batch:
+                    fut.cancel()
+                return
+            exc = done.exception()
+            for i, (_, _, fut) in enumerate(batch):
+                if fut.done():
+                    continue
+                if exc is not None:
+                    fut.set_exception(exc)
+                    continue
+                ok, value = done.result()[i]
+                if ok:
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+
+        cf.add_done_callback(_deliver)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -1,70 +1,100 @@
 from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import threading
 import time
 import logging
-from typing import Iterator
+from typing import Any, Iterator
 import requests
+from requests.adapters import HTTPAdapter
 
 from .config import SETTINGS
+from .db import known_projects, upsert_projects
+from .decode import DECODER
+from .decode_pool import SIMPLE_DETAIL_FIELDS
+from .journal import get_journal
+from .metrics import METRICS
+from .tokens import TokenPool
 
 log = logging.getLogger(__name__)
 
+
 class GitLabClient:
-    def __init__(self, base_url: str | None = None, token: str | None = None, rps: float = 2.0):
+    def __init__(self, base_url: str | None = None, token: str | None = None, rps: float = 2.0, workers: int | None = None):
         self.base_url = (base_url or SETTINGS.gitlab_base_url).rstrip("/")
+        self.workers = max(1, workers or SETTINGS.sync_workers)
         self.session = requests.Session()
+        # один хост: по соединению на поток, без ретраев urllib3 (свои ретраи в _request)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, pool_block=True, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         headers = {
             "Accept": "application/json",
             "User-Agent": "gitlab-lang-stats/1.0",
         }
-        if token:
-            headers["PRIVATE-TOKEN"] = token
         self.session.headers.update(headers)
-        self.min_interval = 1.0 / max(rps, 0.1)
-        self._last_ts = 0.0
+        # токен (PRIVATE-TOKEN) ставится на каждый запрос из пула; у каждого токена свой лимит rps и квота
+        self.tokens = TokenPool([token], rps) if token else TokenPool.from_settings(rps)
         self._req_count = 0
+        self._lock = threading.Lock()
+        self.stats = {"details_ok": 0, "details_fail": 0, "langs_ok": 0, "langs_fail": 0, "langs_skipped": 0}
+        # fast: полный элемент списка вместо /projects/:id, отдельно запрашиваются только языки
+        self.fast = SETTINGS.metrics_mode.lower() == "fast"
+        # JOURNAL_DIR: сырые ответы пишутся в журнал для app replay
+        self.journal = get_journal()
 
-    def _throttle(self):
-        dt = time.time() - self._last_ts
-        if dt < self.min_interval:
-            time.sleep(self.min_interval - dt)
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
 
     def _request(self, method: str, path: str, **kwargs) -> requests.Response:
         url = f"{self.base_url}{path}"
         backoff = 1.0
-        for attempt in range(8):
-            self._throttle()
+        attempt = 0
+        while attempt < 8:
+            token = self.tokens.acquire()
             t0 = time.time()
-            resp = self.session.request(method, url, timeout=30, **kwargs)
-            self._last_ts = time.time()
-            self._req_count += 1
+            try:
+                resp = self.session.request(method, url, timeout=30, headers=token.headers(), **kwargs)
+            except requests.RequestException as e:
+                self.tokens.release(token, None)
+                METRICS.observe_request(method, path, type(e).__name__, time.time() - t0)
+                raise
+            verdict = self.tokens.release(token, resp.status_code, resp.headers,
+                                          resp.text if resp.status_code in (401, 403) else "")
+            with self._lock:
+                self._req_count += 1
+            METRICS.observe_request(method, path, resp.status_code, time.time() - t0)
             log.debug("HTTP %s %s [%s] in %.0fms", method, path, resp.status_code, (time.time() - t0) * 1000)
             # 2xx
             if 200 <= resp.status_code < 300:
+                if self.journal is not None:
+                    self.journal.write(method, path, resp.status_code, resp.content)
                 return resp
-            # 429 (rate limit) — уважаем Retry-After если он есть
-            if resp.status_code == 429:
-                retry_after = resp.headers.get("Retry-After")
-                wait = float(retry_after) if retry_after else backoff
-                log.warning("Hit 429, sleeping for %.1fs", wait)
-                time.sleep(wait)
-                backoff = min(backoff * 2, 30.0)
+            # токен отозван / без прав — повторяем тем же запросом с другим токеном (попытка не тратится)
+            if verdict == "dropped":
+                continue
+            attempt += 1
+            # 429 (rate limit) — токен уходит на cooldown (Retry-After), пул отдаст другой или дождётся сброса
+            if verdict == "throttled":
+                log.warning("Hit 429 on token %s (attempt %s/8)", token.name, attempt)
+                METRICS.observe_retry("429", 0.0)
                 continue
             # 5xx — пробуем с бэкофом
             if 500 <= resp.status_code < 600:
                 log.warning("GitLab %s on %s, retrying in %.1fs", resp.status_code, path, backoff)
+                METRICS.observe_retry("5xx", backoff)
                 time.sleep(backoff)
                 backoff = min(backoff * 2, 30.0)
                 continue
             # другое — поднимаем
-            resp.raise_for_status()
             log.error("GitLab API error %s on %s: %s", resp.status_code, path, (resp.text or "")[:400])
             resp.raise_for_status()
         resp.raise_for_status()
         return resp  # для типа
 
-    def iter_projects(self, per_page: int = 100) -> Iterator[dict]:
+    def iter_pages(self, per_page: int = 100) -> Iterator[list[dict]]:
         """
-        Итерируем публичные проекты, отсортированные по звёздам (самые популярные — первыми).
+        Страницы публичных проектов, отсортированных по звёздам (самые популярные — первыми).
         """
         page = 1
         while True:
@@ -73,21 +103,25 @@ class GitLabClient:
                 "page": page,
                 "order_by": "star_count",
                 "sort": "desc",
-                "simple": "true",
                 "visibility": "public",
                 "archived": "false",
             }
+            if not self.fast:
+                params["simple"] = "true"
             log.info("Fetching projects page=%s per_page=%s ...", page, per_page)
             r = self._request("GET", "/projects", params=params)
-            data = r.json()
+            data = DECODER.listing(r.content)
             if not data:
                 log.info("Projects: page=%s is empty, stopping", page)
                 break
             log.info("Projects: page=%s returned %s items", page, len(data))
-            for p in data:
-                yield p
+            yield data
             page += 1
 
+    def iter_projects(self, per_page: int = 100) -> Iterator[dict]:
+        for data in self.iter_pages(per_page):
+            yield from data
+
     def project_details(self, project_id: int, want_stats: bool = True) -> dict:
         """
         Получаем подробные поля проекта. Если есть права (Reporter+) и включено want_stats,
@@ -105,82 +139,131 @@ class GitLabClient:
                 r = self._request("GET", f"/projects/{project_id}")
             else:
                 raise
-        data = r.json() or {}
-        # оставим только полезные и стабильные поля
-        keep = [
-            "name", "path_with_namespace", "web_url", "description", "topics",
-            "star_count", "forks_count", "open_issues_count",
-            "default_branch", "visibility",
-            "created_at", "last_activity_at", "readme_url",
-            "issues_enabled", "merge_requests_enabled", "jobs_enabled", "wiki_enabled", "snippets_enabled",
-            "container_registry_access_level", "package_registry_access_level",
-            "namespace", "license", "repository_storage",
-        ]
-        details = {k: data.get(k) for k in keep if k in data}
-        if "statistics" in data:
-            details["statistics"] = data["statistics"]
-        return details
+        # только полезные и стабильные поля (app.decode.DETAIL_FIELDS), остальное не декодируется
+        return DECODER.details(r.content)
 
 
     def project_languages(self, project_id: int) -> dict[str, float]:
         r = self._request("GET", f"/projects/{project_id}/languages")
         # Формат: {"Python": 82.1, "Shell": 17.9}
-        return r.json() or {}
+        return DECODER.languages(r.content)
 
-    def fetch_projects_with_metrics(self, limit: int) -> list[dict]:
+    def fetch_one(self, p: dict, known: dict[int, Any] | None = None) -> dict:
         """
-        Собираем: подробные поля проекта (+ statistics при наличии прав) и languages.
+        Документ проекта: подробные поля (+ statistics при наличии прав) и languages.
+        В fast-режиме — поля из элемента списка, языки только для новых/изменившихся проектов.
         """
-        collected: list[dict] = []
-        t0 = time.time()
-        pages_seen = 0
-        ok_details = 0
-        fail_details = 0
-        ok_langs = 0
-        fail_langs = 0
-        for p in self.iter_projects(per_page=100):
-            pid = p["id"]
-            try:
+        pid = p["id"]
+        try:
+            if self.fast:
+                details = {k: p[k] for k in SIMPLE_DETAIL_FIELDS if k in p}
+            else:
                 details = self.project_details(pid, want_stats=True)
-                ok_details += 1
-            except requests.HTTPError as e:
-                log.warning("Failed to fetch details for project %s: %s", pid, e)
-                details = {}
-                fail_details += 1
-            langs = {}
-            try:
-                langs = self.project_languages(pid)
-                ok_langs += 1
-            except requests.HTTPError as e:
-                log.warning("Failed to fetch languages for project %s: %s", pid, e)
-                fail_langs += 1
-            doc = {
-                "project_id": pid,
-                # дублируем ключевые метрики наверх для удобной фильтрации/индексации
-                "name": details.get("name") or p.get("name"),
-                "path_with_namespace": details.get("path_with_namespace") or p.get("path_with_namespace"),
-                "web_url": details.get("web_url") or p.get("web_url"),
-                "star_count": details.get("star_count", p.get("star_count")),
-                "forks_count": details.get("forks_count"),
-                "open_issues_count": details.get("open_issues_count"),
-                "visibility": details.get("visibility"),
-                "created_at": details.get("created_at"),
-                "last_activity_at": details.get("last_activity_at"),
-                # полноценный блок деталей
-                "details": details,
-                # языки — как и раньше, для агрегации
-                "languages": langs,
-            }
-            collected.append(doc)
-            n = len(collected)
-            if n % SETTINGS.progress_every == 0:
+            self._count("details_ok")
+        except requests.HTTPError as e:
+            log.warning("Failed to fetch details for project %s: %s", pid, e)
+            details = {}
+            self._count("details_fail")
+        doc = {
+            "project_id": pid,
+            # дублируем ключевые метрики наверх для удобной фильтрации/индексации
+            "name": details.get("name") or p.get("name"),
+            "path_with_namespace": details.get("path_with_namespace") or p.get("path_with_namespace"),
+            "web_url": details.get("web_url") or p.get("web_url"),
+            "star_count": details.get("star_count", p.get("star_count")),
+            "forks_count": details.get("forks_count") or p.get("forks_count"),
+            "open_issues_count": details.get("open_issues_count") or p.get("open_issues_count"),
+            "visibility": details.get("visibility") or p.get("visibility"),
+            "created_at": details.get("created_at") or p.get("created_at"),
+            "last_activity_at": details.get("last_activity_at") or p.get("last_activity_at"),
+            # полноценный блок деталей
+            "details": details,
+        }
+        if known and pid in known and known[pid] == p.get("last_activity_at"):
+            # языки в базе актуальны — документ без languages их не перезапишет
+            self._count("langs_skipped")
+            METRICS.inc("crawler_languages_skipped_total")
+            return doc
+        langs = {}
+        try:
+            langs = self.project_languages(pid)
+            self._count("langs_ok")
+        except requests.HTTPError as e:
+            log.warning("Failed to fetch languages for project %s: %s", pid, e)
+            self._count("langs_fail")
+        # языки — как и раньше, для агрегации
+        doc["languages"] = langs
+        return doc
+
+    def fetch_projects_with_metrics(self, limit: int) -> int:
+        """
+        Пул из SYNC_WORKERS потоков тянет проекты, главный поток читает страницы списка
+        и пишет готовые документы в Mongo пачками по UPSERT_BATCH. В полёте не больше
+        2 * workers проектов, так что память не зависит от limit.
+        """
+        t0 = time.time()
+        max_inflight = 2 * self.workers
+        batch_size = max(1, SETTINGS.upsert_batch)
+        buffer: list[dict] = []
+        inflight: set[Future] = set()
+        submitted = ok = fail = 0
+        last_report = 0
+
+        def _flush():
+            if buffer:
+                cnt = upsert_projects(buffer)
+                log.info("Inserted/updated %s projects", cnt)
+                buffer.clear()
+            METRICS.set("crawler_pending_upsert_docs", 0)
+
+        def _collect(done):
+            nonlocal ok, fail, last_report
+            for fut in done:
+                inflight.discard(fut)
+                try:
+                    buffer.append(fut.result())
+                    ok += 1
+                    METRICS.projects("ok")
+                except Exception as e:
+                    log.warning("Failed project: %s", e)
+                    fail += 1
+                    METRICS.projects("failed")
+            METRICS.set("crawler_pending_upsert_docs", len(buffer))
+            if len(buffer) >= batch_size:
+                _flush()
+            n = ok + fail
+            if n - last_report >= SETTINGS.progress_every:
+                last_report = n
                 elapsed = time.time() - t0
                 rps = n / elapsed if elapsed > 0 else 0.0
                 eta = (limit - n) / rps if rps > 0 and limit > n else 0
+                st = self.stats
                 log.info(
-                    "Progress: %s/%s projects (details ok/fail=%s/%s, langs ok/fail=%s/%s) | req=%s | rps=%.2f | ETA=%.0fs",
-                    n, limit, ok_details, fail_details, ok_langs, fail_langs, self._req_count, rps, eta
+                    "Progress: %s/%s projects (details ok/fail=%s/%s, langs ok/fail/skip=%s/%s/%s) | req=%s | rps=%.2f | ETA=%.0fs",
+                    n, limit, st["details_ok"], st["details_fail"], st["langs_ok"], st["langs_fail"], st["langs_skipped"],
+                    self._req_count, rps, eta,
                 )
-            if n >= limit:
-                break
-        return collected
+                if len(self.tokens) > 1:
+                    log.info("Tokens: %s", self.tokens.summary())
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fetch") as pool:
+            for page in self.iter_pages(per_page=100):
+                page = [p for p in page if p.get("id")][: limit - submitted]
+                known = known_projects([p["id"] for p in page]) if self.fast else None
+                for p in page:
+                    while len(inflight) >= max_inflight:
+                        _collect(wait(inflight, return_when=FIRST_COMPLETED)[0])
+                    inflight.add(pool.submit(self.fetch_one, p, known))
+                    submitted += 1
+                if submitted >= limit:
+                    break
+            while inflight:
+                _collect(wait(inflight, return_when=FIRST_COMPLETED)[0])
+        _flush()
+        log.info("Finished: %s ok, %s failed", ok, fail)
+        return ok
+
+    def close(self):
+        self.session.close()
+        if self.journal is not None:
+            self.journal.flush()
@@ -3,15 +3,20 @@ import asyncio
 import logging
 import math
 import random
-from typing import Any, Dict, List, Tuple
-from .db import upsert_projects
+import time
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from .db import known_projects, upsert_projects
 import os, json
 
 import httpx
 
 from .config import SETTINGS
+from .decode_pool import DecodePool, run_op
+from .journal import get_journal
+from .metrics import METRICS
+from .tokens import TokenPool
 
-PROGRESS_FILE = "/app/cache/fetch_progress.json"
+PROGRESS_FILE = SETTINGS.progress_file
     
 def save_progress(page: int):
     os.makedirs(os.path.dirname(PROGRESS_FILE), exist_ok=True)
@@ -30,13 +35,11 @@ def load_progress() -> int:
 log = logging.getLogger(__name__)
 
 def _headers() -> Dict[str, str]:
-    h = {
+    # PRIVATE-TOKEN не здесь: его ставит пул токенов на каждый запрос
+    return {
         "Accept": "application/json",
         "User-Agent": "gitlab-lang-stats/async-1.0",
     }
-    if SETTINGS.gitlab_token:
-        h["PRIVATE-TOKEN"] = SETTINGS.gitlab_token
-    return h
 
 class AsyncGitLabClient:
     def __init__(self) -> None:
@@ -51,29 +54,65 @@ class AsyncGitLabClient:
             headers=_headers(),
             base_url=self.base_url,
         )
+        # GITLAB_TOKENS: у каждого токена своя квота по RateLimit-* заголовкам
+        self.tokens = TokenPool.from_settings()
+        # fast: только список + языки (и то лишь для новых/изменившихся проектов)
+        self.fast = SETTINGS.metrics_mode.lower() == "fast"
+        # DECODE_POOL=thread|process: декодирование и сборка документов вне event loop
+        self.pool = DecodePool.from_settings()
+        # JOURNAL_DIR: сырые ответы пишутся в журнал для app replay
+        self.journal = get_journal()
+
+    async def _decode(self, op: str, *args) -> Any:
+        if self.pool is None:
+            return run_op(op, *args)
+        return await self.pool.submit(op, *args)
 
     async def _request(self, method: str, path: str, **kw) -> httpx.Response:
-        # обёртка с ретраями и уважением Retry-After
+        # обёртка с ретраями: токен из пула, 429 — cooldown токена и повтор, 5xx — бэкоф
         backoff = 1.0
-        for attempt in range(1, SETTINGS.retries + 1):
+        attempt = 0
+        extra_headers = kw.pop("headers", None) or {}
+        while attempt < SETTINGS.retries:
+            t_wait = time.perf_counter()
+            METRICS.add("gitlab_semaphore_waiters", 1)
             async with self.sem:
-                r = await self.client.request(method, path, **kw)
+                METRICS.add("gitlab_semaphore_waiters", -1)
+                METRICS.observe_wait("semaphore", time.perf_counter() - t_wait)
+                token = await self.tokens.acquire_async()
+                METRICS.add("gitlab_inflight_requests", 1)
+                t0 = time.perf_counter()
+                try:
+                    r = await self.client.request(method, path, headers={**extra_headers, **token.headers()}, **kw)
+                except Exception as e:
+                    self.tokens.release(token, None)
+                    METRICS.observe_request(method, path, type(e).__name__, time.perf_counter() - t0)
+                    raise
+                finally:
+                    METRICS.add("gitlab_inflight_requests", -1)
                 self.req_count += 1
+            verdict = self.tokens.release(token, r.status_code, r.headers,
+                                          r.text if r.status_code in (401, 403) else "")
+            METRICS.observe_request(method, path, r.status_code, time.perf_counter() - t0)
             if 200 <= r.status_code < 300:
+                if self.journal is not None:
+                    self.journal.write(method, path, r.status_code, r.content)
                 return r
-            if r.status_code == 429:
-                ra = r.headers.get("Retry-After")
-                wait = float(ra) if ra else backoff
-                wait += random.uniform(0, 0.25)  # чуть джиттера
-                log.warning("429 on %s %s, sleeping for %.2fs (attempt %s/%s)",
-                            method, path, wait, attempt, SETTINGS.retries)
-                await asyncio.sleep(wait)
-                backoff = min(backoff * 2, 30.0)
+            if verdict == "dropped":
+                # токен выключен из ротации — тот же запрос другим токеном, попытка не тратится
+                continue
+            attempt += 1
+            if verdict == "throttled":
+                # ждать здесь не нужно: пул отдаст другой токен или подождёт конца cooldown
+                log.warning("429 on %s %s with token %s (attempt %s/%s)",
+                            method, path, token.name, attempt, SETTINGS.retries)
+                METRICS.observe_retry("429", 0.0)
                 continue
             if 500 <= r.status_code < 600:
                 log.warning("%s on %s %s, retrying in %.1fs (attempt %s/%s)",
                             r.status_code, method, path, backoff, attempt, SETTINGS.retries)
-                await asyncio.sleep(backoff)
+                METRICS.observe_retry("5xx", backoff)
+                await asyncio.sleep(backoff + random.uniform(0, 0.25))  # чуть джиттера
                 backoff = min(backoff * 2, 30.0)
                 continue
             # иное — сразу ошибка
@@ -83,75 +122,49 @@ class AsyncGitLabClient:
         r.raise_for_status()
         return r
 
-    async def list_projects(self, target: int) -> list[dict[str, Any]]:
-        """Fetch projects and enrich with details concurrently, saving directly to DB."""
-        projects: list[dict[str, Any]] = []
-        page = load_progress()
-        per_page = 100
-
-        if page > 1:
-            log.info("Resuming from page %s (progress file)", page)
-        else:
-            log.info("Starting from first page")
-
-        while len(projects) < target:
-            params = {
-                "per_page": per_page,
-                "page": page,
-                "order_by": "star_count",
-                "sort": "desc",
-                "simple": "true",
-                "visibility": "public",
-                "archived": "false",
-            }
-
-            log.info("Fetching projects page=%s ...", page)
-            r = await self._request("GET", "/projects", params=params)
-            batch = r.json() or []
-            log.info("Projects page=%s: %s items", page, len(batch))
-
-            if not batch:
-                log.info("No more pages — total fetched: %s", len(projects))
-                break
-
-            async def enrich_project(p):
-                pid = p.get("id")
-                if not pid:
-                    return None
-                try:
-                    full = await self.get_details(pid)
-                    full.update({k: v for k, v in p.items() if k not in full})
-                    langs = await self.get_languages(pid)
-                    full["languages"] = langs
-                    return full
-                except Exception as e:
-                    log.warning("Failed to enrich project %s: %s", pid, e)
-                    return None
-
-            sem = asyncio.Semaphore(SETTINGS.concurrency)
-
-            async def sem_task(p):
-                async with sem:
-                    return await enrich_project(p)
-
-            tasks = [asyncio.create_task(sem_task(p)) for p in batch]
-            enriched_batch = [r for r in await asyncio.gather(*tasks) if r]
-
-            if enriched_batch:
-                cnt = upsert_projects(enriched_batch)
-                log.info("Inserted/updated %s projects", cnt)
-
-            projects.extend(enriched_batch)
-            save_progress(page)
-            page += 1
-
-            if len(projects) >= target:
-                break
-
-        return projects
-
+    async def list_page(self, page: int, per_page: int = 100) -> list[dict[str, Any]]:
+        """
+        Одна страница /projects (самые звёздные первыми). В fast-режиме берём полный
+        (не simple) объект списка — там уже есть счётчики и даты, /projects/:id не нужен.
+        """
+        params = {
+            "per_page": per_page,
+            "page": page,
+            "order_by": "star_count",
+            "sort": "desc",
+            "visibility": "public",
+            "archived": "false",
+        }
+        if not self.fast:
+            params["simple"] = "true"
+        log.info("Fetching projects page=%s ...", page)
+        r = await self._request("GET", "/projects", params=params)
+        batch = await self._decode("listing", r.content)
+        log.info("Projects page=%s: %s items", page, len(batch))
+        return batch
+
+    async def list_ids(self, id_after: int, id_before: int, per_page: int = 100) -> list[dict[str, Any]]:
+        """Страница проектов с id в (id_after, id_before) по возрастанию id — keyset, без лимита на offset."""
+        params = {
+            "per_page": per_page,
+            "pagination": "keyset",
+            "order_by": "id",
+            "sort": "asc",
+            "id_after": id_after,
+            "id_before": id_before,
+            "visibility": "public",
+            "archived": "false",
+        }
+        if not self.fast:
+            params["simple"] = "true"
+        log.info("Fetching projects id_after=%s ...", id_after)
+        r = await self._request("GET", "/projects", params=params)
+        return await self._decode("listing", r.content)
 
     async def get_details(self, pid: int, want_stats: bool = True) -> Dict[str, Any]:
+        return await self._decode("details", await self.get_details_raw(pid, want_stats))
+
+    async def get_details_raw(self, pid: int, want_stats: bool = True) -> bytes:
         params = {}
         if want_stats and SETTINGS.include_statistics:
             params["statistics"] = True
@@ -162,116 +175,267 @@ class AsyncGitLabClient:
                 r = await self._request("GET", f"/projects/{pid}")
             else:
                 raise
-        return r.json() or {}
+        return r.content
 
     async def get_languages(self, pid: int) -> Dict[str, float]:
+        return await self._decode("languages", await self.get_languages_raw(pid))
+
+    async def get_languages_raw(self, pid: int) -> bytes:
         r = await self._request("GET", f"/projects/{pid}/languages")
-        return r.json() or {}
+        return r.content
 
-    async def fetch_one(self, p: Dict[str, Any]) -> Dict[str, Any]:
+    async def fetch_one(self, p: Dict[str, Any], known: Dict[int, Any] | None = None) -> Dict[str, Any]:
+        """
+        Документ проекта. full: /projects/:id + /languages. fast: только /languages, и то
+        если проект новый или его last_activity_at изменился (known: project_id -> last_activity_at из Mongo).
+        """
         pid = p["id"]
-        want_details = SETTINGS.metrics_mode.lower() == "full"
-        # параллелим детали и языки
-        tasks: List[asyncio.Task] = []
-        if want_details:
-            tasks.append(asyncio.create_task(self.get_details(pid, want_stats=True)))
-        else:
-            # заглушка — используем simple-объект из списка
-            async def _just_simple() -> Dict[str, Any]:
-                return {
-                    "name": p.get("name"),
-                    "path_with_namespace": p.get("path_with_namespace"),
-                    "web_url": p.get("web_url"),
-                    "star_count": p.get("star_count"),
-                    "forks_count": p.get("forks_count"),
-                    "open_issues_count": p.get("open_issues_count"),
-                    "visibility": p.get("visibility"),
-                    "created_at": p.get("created_at"),
-                    "last_activity_at": p.get("last_activity_at"),
-                }
-            tasks.append(asyncio.create_task(_just_simple()))
-        tasks.append(asyncio.create_task(self.get_languages(pid)))
-
-        details, langs = await asyncio.gather(*tasks, return_exceptions=True)
+        if self.fast:
+            if known and pid in known and known[pid] == p.get("last_activity_at"):
+                # языки в базе актуальны: документ без languages не трогает lang_ids/lang_pct при $set
+                doc = await self._decode("project", p, None, None, True)
+                doc.pop("languages")
+                METRICS.inc("crawler_languages_skipped_total")
+                return doc
+            try:
+                langs = await self.get_languages_raw(pid)
+            except Exception as e:
+                log.warning("Languages failed for %s: %s", pid, e)
+                langs = None
+            return await self._decode("project", p, None, langs, True)
+
+        # параллелим детали и языки; на loop только I/O, разбор — в _decode (при DECODE_POOL — в пуле)
+        details, langs = await asyncio.gather(
+            self.get_details_raw(pid, want_stats=True),
+            self.get_languages_raw(pid),
+            return_exceptions=True,
+        )
         # обработка исключений покомпонентно
-        det: Dict[str, Any] = {}
         if isinstance(details, Exception):
             log.warning("Details failed for %s: %s", pid, details)
-        else:
-            det = details or {}
-
-        lmap: Dict[str, float] = {}
+            details = None
         if isinstance(langs, Exception):
             log.warning("Languages failed for %s: %s", pid, langs)
+            langs = None
+        return await self._decode("project", p, details, langs, False)
+
+    async def iter_pages(self, page: int = 1) -> AsyncIterator[Tuple[int, List[Dict[str, Any]]]]:
+        """(номер страницы, проекты) по порядку; следующая страница запрашивается, пока потребитель занят текущей."""
+        nxt = asyncio.create_task(self.list_page(page))
+        try:
+            while True:
+                items = [p for p in await nxt if p.get("id")]
+                if not items:
+                    return
+                nxt = asyncio.create_task(self.list_page(page + 1))
+                yield page, items
+                page += 1
+        finally:
+            if not nxt.done():
+                nxt.cancel()
+
+    async def refresh_one(self, pid: int, last_activity_at: str | None = None) -> Dict[str, Any]:
+        """
+        Повторный сбор известного проекта (app.refresh): /projects/:id, языки — только если
+        last_activity_at изменился. 1–2 запроса; statistics только вне fast-режима.
+        """
+        details_raw = await self.get_details_raw(pid, want_stats=not self.fast)
+        details = await self._decode("details", details_raw)
+        langs = None
+        if last_activity_at and details.get("last_activity_at") == last_activity_at:
+            METRICS.inc("crawler_languages_skipped_total")
         else:
-            lmap = langs or {}
-
-        doc = {
-            "project_id": pid,
-            "name": det.get("name") or p.get("name"),
-            "path_with_namespace": det.get("path_with_namespace") or p.get("path_with_namespace"),
-            "web_url": det.get("web_url") or p.get("web_url"),
-            "star_count": det.get("star_count", p.get("star_count")),
-            "forks_count": det.get("forks_count") or p.get("forks_count"),
-            "open_issues_count": det.get("open_issues_count") or p.get("open_issues_count"),
-            "visibility": det.get("visibility") or p.get("visibility"),
-            "created_at": det.get("created_at") or p.get("created_at"),
-            "last_activity_at": det.get("last_activity_at") or p.get("last_activity_at"),
-            "details": det,
-            "languages": lmap,
-        }
+            try:
+                langs = await self.get_languages_raw(pid)
+            except Exception as e:
+                log.warning("Languages failed for %s: %s", pid, e)
+        doc = await self._decode("project", {"id": pid}, details_raw, langs, False)
+        if langs is None:
+            # языки не запрашивались или не пришли: документ без languages не трогает сохранённые
+            doc.pop("languages")
         return doc
 
+    async def iter_unit(self, kind: str, lo: int, hi: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Страницы проектов единицы работы (app.workqueue): pages — страницы [lo, hi) списка по звёздам,
+        ids — проекты с id в [lo, hi). Следующая страница запрашивается, пока потребитель занят текущей.
+        """
+        if kind not in ("pages", "ids"):
+            raise ValueError(f"Unknown work unit kind: {kind}")
+
+        async def fetch(cursor: int) -> Tuple[int, List[Dict[str, Any]]]:
+            if kind == "pages":
+                return cursor + 1, [p for p in await self.list_page(cursor) if p.get("id")]
+            items = [p for p in await self.list_ids(cursor, hi) if p.get("id") and cursor < p["id"] < hi]
+            return (items[-1]["id"] if items else hi), items
+
+        # курсор: pages — следующая страница, ids — последний полученный id
+        cursor, end = (lo, hi) if kind == "pages" else (lo - 1, hi - 1)
+        nxt = asyncio.create_task(fetch(cursor)) if cursor < end else None
+        try:
+            while nxt is not None:
+                cursor, items = await nxt
+                if not items:
+                    return
+                nxt = asyncio.create_task(fetch(cursor)) if cursor < end else None
+                yield items
+        finally:
+            if nxt is not None and not nxt.done():
+                nxt.cancel()
+
+    async def fetch_unit(self, kind: str, lo: int, hi: int, stats: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        """
+        Все проекты одной единицы работы; документы пишутся в Mongo постранично.
+        stats (pages, ok, failed, requests) обновляется по ходу — его читает heartbeat воркера.
+        """
+        stats = stats if stats is not None else {}
+        for key in ("pages", "ok", "failed", "requests"):
+            stats.setdefault(key, 0)
+        req0 = self.req_count
+        async for items in self.iter_unit(kind, lo, hi):
+            known = known_projects([p["id"] for p in items]) if self.fast else None
+            docs = await asyncio.gather(*(self.fetch_one(p, known) for p in items), return_exceptions=True)
+            good = []
+            for p, doc in zip(items, docs):
+                if isinstance(doc, Exception):
+                    log.warning("Failed project %s: %s", p.get("id"), doc)
+                    stats["failed"] += 1
+                    METRICS.projects("failed")
+                else:
+                    good.append(doc)
+                    METRICS.projects("ok")
+            if good:
+                upsert_projects(good)
+            stats["ok"] += len(good)
+            stats["pages"] += 1
+            stats["requests"] = self.req_count - req0
+        return stats
 
     async def fetch_projects_with_metrics(self, target: int) -> int:
-        """Fetch projects and directly upsert to MongoDB as we go."""
-        t0 = asyncio.get_event_loop().time()
-        projects = await self.list_projects(target)
-        n = len(projects)
-        if n == 0:
-            return 0
-
-        log.info("Fetched %s project references, starting details+languages...", n)
-
-        ok = 0
-        fail = 0
-        batch: list[dict] = []
-        BATCH_SIZE = 100
-
-        async def _wrap(p):
-            nonlocal ok, fail, batch
+        """
+        Конвейер с ограниченной памятью: страницы списка -> очередь -> CONCURRENCY воркеров
+        (fetch_one) -> очередь -> запись в Mongo пачками по UPSERT_BATCH.
+        Одновременно в памяти O(CONCURRENCY + UPSERT_BATCH) проектов, сколько бы ни было target.
+        Прогресс сохраняется по странице, все проекты которой уже записаны.
+        """
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        start = load_progress()
+        if start > 1:
+            log.info("Resuming from page %s (progress file)", start)
+        else:
+            log.info("Starting from first page")
+
+        n_workers = max(1, SETTINGS.concurrency)
+        batch_size = max(1, SETTINGS.upsert_batch)
+        todo: asyncio.Queue = asyncio.Queue(maxsize=n_workers)
+        results: asyncio.Queue = asyncio.Queue(maxsize=n_workers)
+        page_total: Dict[int, int] = {}  # страница -> сколько проектов с неё взято
+        page_done: Dict[int, int] = {}   # страница -> сколько из них записано
+
+        async def produce():
+            listed = 0
             try:
-                doc = await self.fetch_one(p)
-                batch.append(doc)
-                ok += 1
-                if len(batch) >= BATCH_SIZE:
-                    upsert_projects(batch)
-                    log.info("Uploaded %s projects so far...", ok)
-                    batch.clear()
-            except Exception as e:
-                fail += 1
-                log.warning("Failed project %s: %s", p.get("id"), e)
+                async for page, items in self.iter_pages(start):
+                    full = len(items)
+                    items = items[: target - listed]
+                    # недобранная страница не считается пройденной: при следующем запуске начнём с неё
+                    page_total[page] = len(items) + (len(items) < full)
+                    known = known_projects([p["id"] for p in items]) if self.fast else None
+                    for p in items:
+                        await todo.put((page, p, known))
+                    listed += len(items)
+                    METRICS.set("crawler_listed_projects", listed)
+                    if listed >= target:
+                        break
+                else:
+                    log.info("No more pages — listed: %s", listed)
+            finally:
+                for _ in range(n_workers):
+                    await todo.put(None)
+
+        async def work():
+            while (item := await todo.get()) is not None:
+                page, p, known = item
+                try:
+                    doc = await self.fetch_one(p, known)
+                except Exception as e:
+                    log.warning("Failed project %s: %s", p.get("id"), e)
+                    doc = None
+                await results.put((page, doc))
+            await results.put(None)
+
+        producer = asyncio.create_task(produce())
+        workers = [asyncio.create_task(work()) for _ in range(n_workers)]
+
+        ok = fail = 0
+        progress = start
+        buffer: List[Dict[str, Any]] = []
+        flushed: List[int] = []  # страницы документов из buffer
+
+        def flush():
+            nonlocal progress
+            if buffer:
+                cnt = upsert_projects(buffer)
+                log.info("Inserted/updated %s projects", cnt)
+            for page in flushed:
+                page_done[page] = page_done.get(page, 0) + 1
+            buffer.clear()
+            flushed.clear()
+            # продвигаем прогресс только по полностью записанным страницам подряд
+            moved = False
+            while progress in page_total and page_done.get(progress, 0) >= page_total[progress]:
+                page_total.pop(progress)
+                page_done.pop(progress, None)
+                progress += 1
+                moved = True
+            if moved:
+                save_progress(progress)
 
             done = ok + fail
-            if done % SETTINGS.progress_every == 0 or done == n:
-                elapsed = asyncio.get_event_loop().time() - t0
-                rps = done / elapsed if elapsed > 0 else 0.0
-                eta = (n - done) / rps if rps > 0 else 0.0
-                log.info("Progress: %s/%s ok=%s fail=%s | req=%s | rps=%.2f | ETA=%.0fs",
-                         done, n, ok, fail, self.req_count, rps, eta)
-
-        await asyncio.gather(*[self._limited(_wrap, p) for p in projects[:target]])
+            elapsed = loop.time() - t0
+            rps = done / elapsed if elapsed > 0 else 0.0
+            eta = (target - done) / rps if rps > 0 else 0.0
+            log.info("Progress: %s/%s ok=%s fail=%s | req=%s | rps=%.2f | ETA=%.0fs",
+                     done, target, ok, fail, self.req_count, rps, eta)
+            if len(self.tokens) > 1:
+                log.info("Tokens: %s", self.tokens.summary())
+            METRICS.set("crawler_projects_remaining", max(target - done, 0))
 
-        # Flush last batch
-        if batch:
-            upsert_projects(batch)
+        try:
+            running = n_workers
+            while running:
+                item = await results.get()
+                if item is None:
+                    running -= 1
+                    continue
+                page, doc = item
+                if doc is None:
+                    fail += 1
+                    METRICS.projects("failed")
+                    # неудачный проект тоже закрывает свою позицию на странице
+                    page_done[page] = page_done.get(page, 0) + 1
+                else:
+                    ok += 1
+                    METRICS.projects("ok")
+                    buffer.append(doc)
+                    flushed.append(page)
+                METRICS.set("crawler_pending_upsert_docs", len(buffer))
+                if len(buffer) >= batch_size:
+                    flush()
+            flush()
+            await producer  # ошибки списка проектов (после всех ретраев) — наружу
+        finally:
+            for t in (producer, *workers):
+                if not t.done():
+                    t.cancel()
 
         log.info("Finished: %s ok, %s failed", ok, fail)
         return ok
 
-    async def _limited(self, coro_func, *args, **kwargs):
-        # просто обёртка чтобы не съезжали стеки ошибок
-        return await coro_func(*args, **kwargs)
-
     async def aclose(self):
         await self.client.aclose()
+        if self.journal is not None:
+            self.journal.flush()
+        if self.pool is not None:
+            self.pool.close()
@@ -0,0 +1,180 @@
+"""
+GraphQL backend: one POST /api/graphql returns a whole page of projects with
+counters, dates and languages, instead of 1-2 REST round trips per project.
+
+Pagination is cursor based (pageInfo.endCursor). The page size is adapted to
+GitLab's query complexity limit: every response carries queryComplexity
+{limit score}, the per-project cost is derived from it and the next page asks
+for as many projects as fit under the limit (capped by GRAPHQL_BATCH). A
+"Query has complexity of X, which exceeds max complexity of Y" error or a
+server-side timeout shrinks the batch and retries the same cursor.
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .config import SETTINGS
+from .db import upsert_projects
+from .gitlab_client_async import PROGRESS_FILE, AsyncGitLabClient
+from .metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+PROJECTS_QUERY = """
+query($first: Int!, $after: String, $sort: String) {
+  queryComplexity { limit score }
+  projects(first: $first, after: $after, sort: $sort) {
+    pageInfo { hasNextPage endCursor }
+    nodes {
+      id name fullPath webUrl description topics
+      starCount forksCount openIssuesCount visibility archived
+      createdAt lastActivityAt
+      languages { name share }
+    }
+  }
+}
+"""
+
+_COMPLEXITY_ERROR = re.compile(r"complexity of (\d+), which exceeds max complexity of (\d+)")
+# запас до лимита: стоимость узла может немного плавать (длина списка языков не влияет, но лимит бывает ниже у анонимов)
+COMPLEXITY_HEADROOM = 0.9
+
+
+def graphql_url() -> str:
+    if SETTINGS.graphql_url:
+        return SETTINGS.graphql_url
+    base = SETTINGS.gitlab_base_url.rstrip("/")
+    return re.sub(r"/api/v4$", "", base) + "/api/graphql"
+
+
+def save_cursor(cursor: Optional[str]):
+    """Курсор GraphQL хранится в том же файле прогресса, что и страница REST."""
+    state = {}
+    if os.path.exists(PROGRESS_FILE):
+        try:
+            with open(PROGRESS_FILE) as f:
+                state = json.load(f)
+        except json.JSONDecodeError:
+            state = {}
+    state["graphql_cursor"] = cursor
+    os.makedirs(os.path.dirname(PROGRESS_FILE), exist_ok=True)
+    with open(PROGRESS_FILE, "w") as f:
+        json.dump(state, f)
+
+
+def load_cursor() -> Optional[str]:
+    if os.path.exists(PROGRESS_FILE):
+        try:
+            with open(PROGRESS_FILE) as f:
+                return json.load(f).get("graphql_cursor")
+        except json.JSONDecodeError:
+            return None
+    return None
+
+
+class GraphQLGitLabClient(AsyncGitLabClient):
+    """Тот же интерфейс, что у AsyncGitLabClient (fetch_projects_with_metrics / aclose); ретраи и метрики — из _request."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.url = graphql_url()
+        self.max_batch = max(1, min(SETTINGS.graphql_batch, 100))
+        self.batch = self.max_batch
+
+    def _resize(self, complexity: Optional[Dict[str, Any]], first: int):
+        """Подгоняем размер следующей страницы под лимит сложности по фактической стоимости текущей."""
+        if not complexity or not complexity.get("limit") or not complexity.get("score") or first <= 0:
+            return
+        per_node = complexity["score"] / first
+        fit = int(complexity["limit"] * COMPLEXITY_HEADROOM / per_node)
+        new = max(1, min(self.max_batch, fit))
+        if new != self.batch:
+            log.info("GraphQL batch %s -> %s (complexity %s/%s)", self.batch, new, complexity["score"], complexity["limit"])
+            self.batch = new
+        METRICS.set("graphql_batch_size", self.batch)
+
+    async def fetch_page(self, after: Optional[str]) -> Dict[str, Any]:
+        """Одна страница projects; при превышении сложности или таймауте уменьшает batch и повторяет тот же курсор."""
+        while True:
+            first = self.batch
+            payload = {"query": PROJECTS_QUERY, "variables": {"first": first, "after": after, "sort": SETTINGS.graphql_sort}}
+            try:
+                r = await self._request("POST", self.url, json=payload)
+            except (httpx.TimeoutException, httpx.HTTPStatusError) as e:
+                # тяжёлый запрос мог упереться в таймаут GitLab (или 5xx после всех ретраев) — пробуем страницу поменьше
+                if first == 1 or (isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500):
+                    raise
+                self.batch = max(1, first // 2)
+                log.warning("GraphQL page failed with first=%s (%s), retrying with %s", first, e, self.batch)
+                continue
+            res = await self._decode("graphql", r.content)
+            for msg in res["errors"]:
+                m = _COMPLEXITY_ERROR.search(msg)
+                if m:
+                    score, limit = int(m.group(1)), int(m.group(2))
+                    self._resize({"score": score, "limit": limit}, first)
+                    if self.batch >= first:
+                        self.batch = max(1, first // 2)
+                    METRICS.inc("graphql_complexity_rejections_total")
+                    break
+            else:
+                if res["errors"] and not res["docs"]:
+                    raise RuntimeError(f"GraphQL errors: {'; '.join(res['errors'])[:400]}")
+                self._resize(res["complexity"], first)
+                return res
+            if first == 1:
+                raise RuntimeError(f"GraphQL query too complex even for one project: {res['errors']}")
+
+    async def fetch_projects_with_metrics(self, target: int) -> int:
+        """Страницы по курсору -> документы -> upsert пачками по UPSERT_BATCH; курсор сохраняется после записи."""
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        cursor = load_cursor()
+        if cursor:
+            log.info("Resuming GraphQL crawl from cursor %s", cursor)
+
+        batch_size = max(1, SETTINGS.upsert_batch)
+        buffer: List[Dict[str, Any]] = []
+        ok = 0
+
+        def flush(next_cursor: Optional[str]):
+            if buffer:
+                cnt = upsert_projects(buffer)
+                log.info("Inserted/updated %s projects", cnt)
+                buffer.clear()
+            save_cursor(next_cursor)
+            elapsed = loop.time() - t0
+            rps = ok / elapsed if elapsed > 0 else 0.0
+            eta = (target - ok) / rps if rps > 0 else 0.0
+            log.info("Progress: %s/%s | req=%s | batch=%s | rps=%.2f | ETA=%.0fs",
+                     ok, target, self.req_count, self.batch, rps, eta)
+            if len(self.tokens) > 1:
+                log.info("Tokens: %s", self.tokens.summary())
+            METRICS.set("crawler_projects_remaining", max(target - ok, 0))
+
+        while ok < target:
+            res = await self.fetch_page(cursor)
+            docs = res["docs"][: target - ok]
+            ok += len(docs)
+            buffer.extend(docs)
+            METRICS.projects("ok", len(docs))
+            METRICS.set("crawler_pending_upsert_docs", len(buffer))
+            info = res["page_info"]
+            # курсор сдвигаем только по целой странице — недобранная будет перечитана при следующем запуске
+            if len(docs) == len(res["docs"]):
+                cursor = info.get("endCursor")
+            if len(buffer) >= batch_size or not info.get("hasNextPage") or ok >= target:
+                flush(cursor)
+            if not info.get("hasNextPage"):
+                log.info("No more pages — total fetched: %s", ok)
+                break
+
+        log.info("Finished: %s ok", ok)
+        return ok
@@ -0,0 +1,381 @@
+"""
+Raw response journal and replay ingest.
+
+With JOURNAL_DIR set, every successful GitLab response (REST listing, details,
+languages, GraphQL pages) is appended to a zstd-compressed NDJSON segment before
+it is decoded. One record per response:
+
+    {"t": 1697040000.123, "m": "GET", "p": "/projects/42", "s": 200, "b": <response body as is>}
+
+The body is embedded verbatim (it is JSON already), so writing costs no
+re-encoding and replay can hand the exact bytes to the same decoder the crawler
+uses. A segment is open as `<name>.ndjson.zst.open` and sealed by renaming it
+once it reaches JOURNAL_SEGMENT_MB of raw JSON or the process exits; sealed
+segments are listed in `index.ndjson` (records, sizes, time range, records per
+endpoint). Segment names start with a UTC timestamp and carry host and pid, so
+several crawlers can share one directory.
+
+`app replay` rebuilds `projects` from the journal without the API: segments are
+decoded and shaped in a spawn process pool (JSON parsing is the expensive part),
+and the main process applies each segment as large unordered bulk writes from
+several threads. Within a segment only the last response per project and
+endpoint is kept. Across segments the newer response wins whatever the segment
+order (names from several crawlers interleave): every write is an update
+pipeline that overwrites the project fields and the languages only if their
+response is newer than the one already applied; an older response only fills
+fields the document lacks. Those times are kept per project in
+`journal_at` ({"project", "languages"}, ISO like `fetched_at`); a document the
+crawler wrote has no `journal_at` and is compared by its `fetched_at`.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import zstandard
+from pymongo import UpdateOne
+
+from .config import SETTINGS
+from .decode import DECODER
+from .decode_pool import shape_graphql_page, shape_project
+from .metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+SUFFIX = ".ndjson.zst"
+OPEN_SUFFIX = SUFFIX + ".open"
+INDEX_FILE = "index.ndjson"
+
+# путь запроса -> эндпоинт; остальные ответы (например, проверка токена) при replay пропускаются
+_ENDPOINTS = (
+    ("languages", re.compile(r"/projects/(\d+)/languages$")),
+    ("details", re.compile(r"/projects/(\d+)$")),
+    ("listing", re.compile(r"/projects$")),
+    ("graphql", re.compile(r"/graphql$")),
+)
+# так заканчивается заголовок записи; в заголовке этой последовательности быть не может
+_BODY_MARK = b',"b":'
+
+
+def endpoint(path: str) -> Tuple[Optional[str], Optional[int]]:
+    """Эндпоинт и project_id (для /projects/:id и /languages) по пути запроса."""
+    path = path.split("?", 1)[0].rstrip("/")
+    for name, rx in _ENDPOINTS:
+        m = rx.search(path)
+        if m:
+            return name, int(m.group(1)) if m.groups() else None
+    return None, None
+
+
+class Journal:
+    """Потокобезопасная запись сегментов; один на процесс (get_journal)."""
+
+    def __init__(self, directory: str, segment_mb: float = 256, level: int = 3):
+        self.dir = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segment_bytes = max(1, int(segment_mb * 1024 * 1024))
+        self.cctx = zstandard.ZstdCompressor(level=level)
+        self.prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self.seq = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer = None
+
+    def _open(self):
+        self.seq += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self.name = f"{stamp}-{self.prefix}-{self.seq:05d}{SUFFIX}"
+        self._file = open(os.path.join(self.dir, self.name + ".open"), "wb")
+        # closefd=False: файл закрываем сами, после финального кадра zstd
+        self._writer = self.cctx.stream_writer(self._file, closefd=False)
+        self.records = 0
+        self.raw_bytes = 0
+        self.first_t = self.last_t = None
+        self.endpoints: Dict[str, int] = {}
+
+    def write(self, method: str, path: str, status: int, body: bytes, t: Optional[float] = None):
+        t = time.time() if t is None else t
+        head = json.dumps({"t": round(t, 3), "m": method, "p": path, "s": status}, separators=(",", ":"))
+        # перевод строки внутри JSON возможен только как пробельный символ — NDJSON не ломаем
+        body = (body or b"null").replace(b"\n", b" ").replace(b"\r", b" ")
+        line = head[:-1].encode() + _BODY_MARK + body + b"}\n"
+        ep = endpoint(path)[0] or "other"
+        with self._lock:
+            if self._writer is None:
+                self._open()
+            self._writer.write(line)
+            self.records += 1
+            self.raw_bytes += len(line)
+            self.first_t = self.first_t or t
+            self.last_t = t
+            self.endpoints[ep] = self.endpoints.get(ep, 0) + 1
+            if self.raw_bytes >= self.segment_bytes:
+                self._seal()
+        METRICS.inc("journal_records_total")
+        METRICS.inc("journal_raw_bytes_total", len(line))
+
+    def _seal(self):
+        self._writer.close()
+        size = self._file.tell()
+        self._file.close()
+        path = os.path.join(self.dir, self.name)
+        os.replace(path + ".open", path)
+        entry = {
+            "segment": self.name, "records": self.records, "raw_bytes": self.raw_bytes, "bytes": size,
+            "first_t": self.first_t, "last_t": self.last_t, "endpoints": self.endpoints,
+        }
+        # одна короткая строка с O_APPEND — несколько процессов могут дописывать индекс одновременно
+        with open(os.path.join(self.dir, INDEX_FILE), "a") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        log.info("Journal segment sealed: %s (%s records, %.1f MB -> %.1f MB)",
+                 self.name, self.records, self.raw_bytes / 2**20, size / 2**20)
+        self._file = self._writer = None
+
+    def flush(self):
+        """Дописать буфер zstd в открытый сегмент (данные переживут падение процесса)."""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush(zstandard.FLUSH_BLOCK)
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._seal()
+
+
+_journal: Optional[Journal] = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> Optional[Journal]:
+    """Журнал процесса; None, если JOURNAL_DIR не задан."""
+    global _journal
+    if not SETTINGS.journal_dir:
+        return None
+    with _journal_lock:
+        if _journal is None:
+            _journal = Journal(SETTINGS.journal_dir, SETTINGS.journal_segment_mb, SETTINGS.journal_zstd_level)
+            atexit.register(_journal.close)
+            log.info("Journal: %s (segments of %s MB)", SETTINGS.journal_dir, SETTINGS.journal_segment_mb)
+    return _journal
+
+
+# ---------------------------------------------------------------- replay
+
+def segments(directory: str, include_open: bool = False) -> List[Dict[str, Any]]:
+    """Сегменты журнала в порядке записи (имя начинается со времени открытия) и их записи из индекса."""
+    index: Dict[str, Dict[str, Any]] = {}
+    path = os.path.join(directory, INDEX_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    index[entry["segment"]] = entry
+    found = []
+    for name in os.listdir(directory):
+        if name.endswith(SUFFIX) or (include_open and name.endswith(OPEN_SUFFIX)):
+            seg = dict(index.get(name) or {"segment": name})
+            seg["path"] = os.path.join(directory, name)
+            found.append(seg)
+    return sorted(found, key=lambda s: s["segment"])
+
+
+def read_records(path: str) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+    """(заголовок, сырое тело) каждой записи сегмента; оборванный хвост (.open после падения) отбрасывается."""
+    dctx = zstandard.ZstdDecompressor()
+    tail = b""
+    with open(path, "rb") as f:
+        reader = dctx.stream_reader(f, read_size=1 << 20)
+        while True:
+            try:
+                chunk = reader.read1(1 << 20)
+            except zstandard.ZstdError:
+                log.warning("Truncated journal segment %s", os.path.basename(path))
+                break
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                i = line.find(_BODY_MARK)
+                if i < 0 or not line.endswith(b"}"):
+                    continue
+                yield DECODER.loads(line[:i] + b"}"), line[i + len(_BODY_MARK):-1]
+
+
+def _iso(t: float) -> str:
+    return datetime.fromtimestamp(t, timezone.utc).isoformat()
+
+
+def decode_segment(path: str) -> Dict[str, Any]:
+    """
+    Выполняется в пуле: сегмент -> {"docs": [(project_id, поля, {"project": t, "languages": t})], "records",
+    "skipped", "seconds"}; t — ISO-время самого нового ответа группы полей (None — группы нет).
+    Из нескольких ответов одного эндпоинта по проекту берётся последний.
+    """
+    t0 = time.perf_counter()
+    listed: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+    details: Dict[int, Tuple[float, bytes]] = {}
+    languages: Dict[int, Tuple[float, bytes]] = {}
+    full: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+    records = skipped = 0
+    for head, body in read_records(path):
+        records += 1
+        ep, pid = endpoint(head.get("p") or "")
+        t = head.get("t") or 0.0
+        if ep == "details":
+            details[pid] = (t, body)
+        elif ep == "languages":
+            languages[pid] = (t, body)
+        elif ep == "listing":
+            for item in DECODER.listing(body):
+                if item.get("id") is not None:
+                    listed[item["id"]] = (t, item)
+        elif ep == "graphql":
+            for doc in shape_graphql_page(body)["docs"]:
+                full[doc["project_id"]] = (t, doc)
+        else:
+            skipped += 1
+
+    docs = []
+    for pid in listed.keys() | details.keys() | languages.keys() | full.keys():
+        times = []
+        t_lang = None
+        doc: Dict[str, Any] = {}
+        if pid in full:
+            t, doc = full[pid]
+            times.append(t)
+            t_lang = t
+        if pid in details:
+            t, raw = details[pid]
+            shaped = shape_project(listed[pid][1] if pid in listed else {"id": pid}, raw, None)
+            shaped.pop("languages")
+            if pid not in listed:
+                # элемент списка остался в другом сегменте: его поля (например, forks_count = 0) не затираем
+                shaped = {k: v for k, v in shaped.items() if v is not None}
+            doc.update(shaped)
+            times.append(t)
+        elif pid in listed:
+            # только элемент списка (fast-режим или /projects/:id в другом сегменте): details не затираем,
+            # а дополняем полями списка, как их собирает fast-режим
+            t, item = listed[pid]
+            shaped = shape_project(item, None, None, fast=True)
+            shaped.pop("languages")
+            for k, v in shaped.pop("details").items():
+                if v is not None:
+                    shaped[f"details.{k}"] = v
+            doc.update({k: v for k, v in shaped.items() if v is not None})
+            times.append(t)
+        if pid in languages and (t_lang is None or languages[pid][0] >= t_lang):
+            t_lang, raw = languages[pid]
+            doc["languages"] = DECODER.languages(raw)
+        doc.pop("project_id", None)
+        doc.pop("fetched_at", None)
+        docs.append((pid, doc, {"project": _iso(max(times)) if times else None,
+                                "languages": _iso(t_lang) if t_lang is not None else None}))
+    return {"docs": docs, "records": records, "skipped": skipped, "seconds": time.perf_counter() - t0}
+
+
+_LANG_FIELDS = ("languages", "lang_ids", "lang_pct")
+
+
+def _replay_update(doc: Dict[str, Any], stamps: Dict[str, Optional[str]]) -> List[Dict[str, Any]]:
+    """
+    Update pipeline: поля группы перезаписываются, только если ответ новее уже применённого (journal_at,
+    а у документа краулера — fetched_at); более старый ответ лишь заполняет отсутствующие поля.
+    Одна операция на проект: upsert без гонок за вставку.
+    """
+    applied = {g: {"$ifNull": [f"$journal_at.{g}", {"$ifNull": ["$fetched_at", ""]}]} for g in stamps}
+    fields: Dict[str, Any] = {}
+    for g, t in stamps.items():
+        if t is None:
+            fields[f"journal_at.{g}"] = f"$_replay.{g}"
+            continue
+        newer = {"$gt": [t, f"$_replay.{g}"]}
+        for k, v in doc.items():
+            if (k in _LANG_FIELDS) == (g == "languages"):
+                # новее — null и значение из ответа; старше — прежнее, если оно есть.
+                # $literal: строка с "$" в начале иначе станет ссылкой на поле
+                fields[k] = {"$ifNull": [{"$cond": [newer, None, f"${k}"]}, {"$literal": v}]}
+        fields[f"journal_at.{g}"] = {"$max": [f"$_replay.{g}", t]}
+    fields["fetched_at"] = {"$max": ["$fetched_at"] + [t for t in stamps.values() if t is not None]}
+    return [{"$set": {"_replay": applied}}, {"$set": fields}, {"$project": {"_replay": 0}}]
+
+
+def replay(directory: str, workers: int = 0, batch: int = 5000, write_threads: int = 4,
+           mode: Optional[str] = None, include_open: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+    """Загрузить журнал в projects. dry_run: только декодирование (замер без Mongo)."""
+    from .db import encode_languages, ingest_collection
+
+    segs = segments(directory, include_open)
+    if not segs:
+        log.warning("No journal segments in %s", directory)
+    coll = None if dry_run else ingest_collection(mode=mode)
+    workers = workers or os.cpu_count() or 2
+    stats = {"segments": 0, "records": 0, "skipped": 0, "projects": 0, "written": 0,
+             "raw_bytes": 0, "bytes": 0, "decode_seconds": 0.0, "write_seconds": 0.0}
+    t_start = time.perf_counter()
+
+    def write(ops: List[UpdateOne]) -> int:
+        t0 = time.perf_counter()
+        res = coll.bulk_write(ops, ordered=False)
+        METRICS.observe_flush(time.perf_counter() - t0, len(ops))
+        if not res.acknowledged:
+            return len(ops)
+        return (res.upserted_count or 0) + (res.modified_count or 0)
+
+    def apply(result: Dict[str, Any]):
+        stats["projects"] += len(result["docs"])
+        if coll is None:
+            return
+        ops = []
+        for pid, doc, stamps in result["docs"]:
+            if "languages" in doc:
+                doc.update(encode_languages(doc["languages"]))
+            ops.append(UpdateOne({"project_id": pid}, _replay_update(doc, stamps), upsert=True))
+        if not ops:
+            return
+        # внутри сегмента проекты уникальны — пачки независимы и пишутся параллельно
+        t0 = time.perf_counter()
+        chunks = [ops[i:i + batch] for i in range(0, len(ops), batch)]
+        stats["written"] += sum(writers.map(write, chunks))
+        stats["write_seconds"] += time.perf_counter() - t0
+
+    ctx = multiprocessing.get_context("spawn")
+    # окно в 2 сегмента на процесс: декодирование идёт впереди записи, но не копит весь журнал в памяти
+    window = max(2, workers * 2)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool, \
+            ThreadPoolExecutor(max_workers=max(1, write_threads), thread_name_prefix="replay") as writers:
+        pending = {}
+        nxt = done = 0
+        while done < len(segs):
+            while nxt < len(segs) and nxt - done < window:
+                pending[nxt] = pool.submit(decode_segment, segs[nxt]["path"])
+                nxt += 1
+            # сегменты применяются по одному: внутри сегмента проекты уникальны, между сегментами решает время ответа
+            fut = pending.pop(done)
+            result = fut.result()
+            seg = segs[done]
+            done += 1
+            stats["segments"] += 1
+            stats["records"] += result["records"]
+            stats["skipped"] += result["skipped"]
+            stats["decode_seconds"] += result["seconds"]
+            stats["raw_bytes"] += seg.get("raw_bytes") or 0
+            stats["bytes"] += os.path.getsize(seg["path"])
+            apply(result)
+            log.info("Replayed %s/%s %s: %s records, %s projects",
+                     done, len(segs), seg["segment"], result["records"], len(result["docs"]))
+    stats["seconds"] = time.perf_counter() - t_start
+    return stats
@@ -0,0 +1,259 @@
+"""
+In-process crawler metrics shared by the sync and async GitLab clients.
+
+Everything lives in one registry (METRICS): per-endpoint request latency
+histograms, status-code counters, retry/backoff sleep time, time spent waiting
+for a concurrency slot or the sync throttle, Mongo flush latency and queue
+depths. It is exposed in Prometheus text format on METRICS_PORT (/metrics) and
+dumped as JSON at the end of `fetch`, so a long crawl can be classified as
+API-bound, Mongo-bound or CPU-bound.
+"""
+
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import json
+import logging
+import os
+import re
+import resource
+import threading
+import time
+from typing import Dict, Iterable, Tuple
+
+log = logging.getLogger(__name__)
+
+# секунды; покрывают и локальный mock (~мс), и медленные ответы gitlab.com
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def endpoint_of(path: str) -> str:
+    """/projects/123/languages -> /projects/:id/languages (bounded label cardinality)."""
+    return _ID_SEGMENT.sub("/:id", path.split("?", 1)[0])
+
+
+def _labels(**kw) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in kw.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = list(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Оценка квантиля по бакетам (линейная интерполяция, как histogram_quantile)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters: Dict[str, Dict[Labels, float]] = {}
+            self.gauges: Dict[str, Dict[Labels, float]] = {}
+            self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+            self.started = time.time()
+
+    # --- примитивы ---
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_labels(**labels)] = value
+
+    def add(self, name: str, delta: float, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            series = self.gauges.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + delta
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    # --- события краулера ---
+
+    def observe_request(self, method: str, path: str, status: int | str, seconds: float):
+        endpoint = endpoint_of(path)
+        self.observe("gitlab_request_seconds", seconds, endpoint=endpoint)
+        self.inc("gitlab_responses_total", endpoint=endpoint, status=status)
+        self.inc("gitlab_request_busy_seconds_total", seconds)
+
+    def observe_retry(self, reason: str, wait: float):
+        self.inc("gitlab_retries_total", reason=reason)
+        self.inc("gitlab_backoff_seconds_total", wait, reason=reason)
+
+    def observe_wait(self, kind: str, seconds: float):
+        """kind: semaphore (async) | throttle (sync rps limiter)."""
+        self.observe("gitlab_wait_seconds", seconds, kind=kind)
+        self.inc("gitlab_wait_seconds_total", seconds, kind=kind)
+
+    def observe_flush(self, seconds: float, docs: int):
+        self.observe("mongo_flush_seconds", seconds)
+        self.inc("mongo_flush_seconds_total", seconds)
+        self.inc("mongo_flushed_docs_total", docs)
+
+    def projects(self, outcome: str, n: int = 1):
+        self.inc("crawler_projects_total", n, outcome=outcome)
+
+    # --- вывод ---
+
+    def _process(self) -> Dict[str, float]:
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        return {
+            "process_cpu_seconds_total": ru.ru_utime + ru.ru_stime,
+            "process_max_rss_bytes": ru.ru_maxrss * 1024,
+            "process_uptime_seconds": time.time() - self.started,
+        }
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines += [f"{name}{_fmt_labels(k)} {v:g}" for k, v in series.items()]
+            for name, series in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines += [f"{name}{_fmt_labels(k)} {v:g}" for k, v in series.items()]
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for k, h in series.items():
+                    cum = 0
+                    for bound, c in zip(h.bounds + ["+Inf"], h.counts):
+                        cum += c
+                        lines.append(f"{name}_bucket{_fmt_labels(k, [('le', str(bound))])} {cum}")
+                    lines.append(f"{name}_sum{_fmt_labels(k)} {h.sum:g}")
+                    lines.append(f"{name}_count{_fmt_labels(k)} {h.count}")
+        for name, value in self._process().items():
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Сводка для JSON: квантили, счётчики и доли времени (API / ожидание / Mongo / CPU)."""
+        proc = self._process()
+        wall = proc["process_uptime_seconds"]
+
+        def flat(series: Dict[Labels, float]) -> Dict[str, float]:
+            return {",".join(f"{k}={v}" for k, v in key) or "total": round(val, 3) for key, val in series.items()}
+
+        with self._lock:
+            out = {
+                "wall_seconds": round(wall, 1),
+                "cpu_seconds": round(proc["process_cpu_seconds_total"], 1),
+                "max_rss_mb": round(proc["process_max_rss_bytes"] / 2**20, 1),
+                "counters": {name: flat(s) for name, s in self.counters.items()},
+                "gauges": {name: flat(s) for name, s in self.gauges.items()},
+                "histograms": {
+                    name: {
+                        ",".join(f"{k}={v}" for k, v in key) or "total": {
+                            "count": h.count,
+                            "mean": round(h.sum / h.count, 4) if h.count else None,
+                            "p50": h.quantile(0.5),
+                            "p90": h.quantile(0.9),
+                            "p99": h.quantile(0.99),
+                        }
+                        for key, h in series.items()
+                    }
+                    for name, series in self.histograms.items()
+                },
+            }
+            mongo = sum(self.counters.get("mongo_flush_seconds_total", {}).values())
+            backoff = sum(self.counters.get("gitlab_backoff_seconds_total", {}).values())
+            waits = sum(self.counters.get("gitlab_wait_seconds_total", {}).values())
+            busy = sum(self.counters.get("gitlab_request_busy_seconds_total", {}).values())
+
+        # грубая классификация: Mongo-запись синхронная и блокирует цикл, поэтому её доля — честная;
+        # backoff суммируется по задачам и при высокой конкуренции может быть > 1
+        if wall > 0:
+            out["share_of_wall"] = {
+                "cpu": round(proc["process_cpu_seconds_total"] / wall, 3),
+                "mongo_flush": round(mongo / wall, 3),
+                "backoff_sleep": round(backoff / wall, 3),
+            }
+            # среднее число запросов «в полёте»: близко к CONCURRENCY — упираемся в API
+            out["avg_inflight_requests"] = round(busy / wall, 2)
+        out["wait_seconds_total"] = round(waits, 1)
+        return out
+
+    def dump_json(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        log.info("Crawler metrics summary written to %s", path)
+
+
+METRICS = Metrics()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == "/metrics":
+            body = METRICS.render_prometheus().encode()
+            ctype = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?", 1)[0] == "/metrics.json":
+            body = json.dumps(METRICS.summary()).encode()
+            ctype = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # не засоряем лог краулера
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread (does not touch the event loop)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("Metrics endpoint: http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,410 @@
+"""
+Adaptive refresh scheduler: re-crawl projects in proportion to how fast they change.
+
+A stored project goes stale when its `last_activity_at` or `star_count` changes.
+Both are modelled as Poisson processes per project:
+
+* activity rate: every re-fetch is a check that either saw `last_activity_at`
+  change or not. With n checks, X of them with a change, over T days, the
+  bias-reduced estimator for censored observations is
+  -ln((n - X + 0.5) / (n + 0.5)) / (T / n). Until a project has been re-checked,
+  the prior is 1 / (days since its last activity).
+* star velocity: new stars per day over the observed time. The lifetime average
+  stars / age is its prior, weighted as PRIOR_DAYS of observation.
+
+A project with change rate λ refreshed at frequency f is fresh for a share
+(f / λ)(1 - e^(-λ/f)) of the time. The planner maximises the star-weighted sum
+of that share under a daily request budget. The Lagrange condition
+w·g(λ/f) / λ = μ with g(x) = 1 - (1 + x)e^(-x) gives f for a given μ, and μ is
+found by bisection. Projects that change faster than the budget can follow get
+less attention, not more. Intervals are clipped to
+[REFRESH_MIN_INTERVAL_HOURS, REFRESH_MAX_INTERVAL_DAYS].
+
+`app schedule` folds new observations into each project's `refresh` state and
+sets `refresh.next_at`. `app refresh` takes due projects from a priority queue
+(weight × probability of being stale) while today's budget lasts, re-fetches
+them and reschedules them with the last plan's μ.
+"""
+
+from __future__ import annotations
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+
+from .config import SETTINGS
+from .db import get_db, ingest_collection, upsert_projects
+from .gitlab_client_async import AsyncGitLabClient
+
+log = logging.getLogger(__name__)
+
+PRIOR_DAYS = 30.0     # вес априорной скорости звёзд, в днях наблюдения
+PRIOR_CHECKS = 2.0    # вес априорной скорости активности, в проверках
+HOURS = 1.0 / 24
+
+PROJECTION = {"_id": 0, "project_id": 1, "star_count": 1, "created_at": 1, "last_activity_at": 1,
+              "fetched_at": 1, "refresh": 1}
+
+# x = λ / f -> g(x) = 1 - (1 + x)e^(-x) (возрастает от 0 до 1), обратная функция — интерполяцией
+_X = np.logspace(-4, 3, 4000)
+_G = -np.expm1(-_X) - _X * np.exp(-_X)
+
+
+# ---------- модель (numpy, общая с bench.refresh) ----------
+
+def activity_rate(checks: np.ndarray, changed: np.ndarray, observed_days: np.ndarray, idle_days: np.ndarray) -> np.ndarray:
+    """Изменений last_activity_at в день: оценка по проверкам, смешанная с априорной 1 / простой."""
+    prior = 1.0 / (np.maximum(idle_days, 0.0) + 1.0)
+    n = np.asarray(checks, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        est = -np.log((n - changed + 0.5) / (n + 0.5)) / (observed_days / n)
+    est = np.where((n > 0) & (observed_days > 0), est, prior)
+    return (n * est + PRIOR_CHECKS * prior) / (n + PRIOR_CHECKS)
+
+
+def star_velocity(stars_gained: np.ndarray, observed_days: np.ndarray, stars: np.ndarray, age_days: np.ndarray) -> np.ndarray:
+    """Новых звёзд в день: наблюдения + средняя за жизнь проекта как априорная."""
+    prior = np.maximum(stars, 0) / np.maximum(age_days, 1.0)
+    return (np.maximum(stars_gained, 0) + PRIOR_DAYS * prior) / (np.maximum(observed_days, 0.0) + PRIOR_DAYS)
+
+
+def weights(stars: np.ndarray) -> np.ndarray:
+    """Важность проекта для свежести: популярные проекты смотрят чаще."""
+    return 1.0 + np.log1p(np.maximum(stars, 0))
+
+
+def freshness(rate: np.ndarray, freq: np.ndarray) -> np.ndarray:
+    """Доля времени, когда копия актуальна, при пересборе с частотой freq (в день)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = rate / freq
+        f = -np.expm1(-x) / x
+    return np.where(rate > 0, np.where(freq > 0, f, 0.0), 1.0)
+
+
+def frequencies(rate: np.ndarray, weight: np.ndarray, mu: float,
+                min_interval: float, max_interval: float) -> np.ndarray:
+    """Частоты пересбора (в день) при множителе Лагранжа mu: w·g(λ/f)/λ = mu, в пределах интервалов."""
+    lo, hi = 1.0 / max_interval, 1.0 / min_interval
+    y = mu * rate / weight
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.interp(y, _G, _X, left=_X[0], right=np.inf)
+        f = np.where(rate > 0, rate / x, 0.0)
+    return np.clip(np.nan_to_num(f, nan=lo), lo, hi)
+
+
+def plan(rate: np.ndarray, weight: np.ndarray, budget: float,
+         min_interval: float, max_interval: float, iters: int = 60) -> Tuple[np.ndarray, float]:
+    """Частоты с суммой budget (пересборов в день), максимизирующие Σ w·freshness. -> (частоты, mu)."""
+    lo_f, hi_f = 1.0 / max_interval, 1.0 / min_interval
+    n = len(rate)
+    if not n:
+        return np.zeros(0), 0.0
+    if budget <= n * lo_f:
+        return np.full(n, lo_f), np.inf
+    if budget >= n * hi_f:
+        return np.full(n, hi_f), 0.0
+    # сумма частот убывает по mu: бисекция по log mu
+    a, b = -30.0, 30.0
+    for _ in range(iters):
+        m = (a + b) / 2
+        total = frequencies(rate, weight, np.exp(m), min_interval, max_interval).sum()
+        if total > budget:
+            a = m
+        else:
+            b = m
+            if total > budget * (1 - 1e-4):
+                break
+    mu = float(np.exp(b))
+    return frequencies(rate, weight, mu, min_interval, max_interval), mu
+
+
+def plan_requests(activity: np.ndarray, stars: np.ndarray, weight: np.ndarray, requests_per_day: float,
+                  min_interval: float, max_interval: float) -> Tuple[np.ndarray, float, float, float]:
+    """
+    План под бюджет запросов: пересбор стоит 1 запрос (/projects/:id) + 1 (/languages), если сменился
+    last_activity_at. Средняя цена уточняется двумя итерациями.
+    -> (freq — частоты пересбора в день, mu — множитель Лагранжа, cost — запросов на пересбор,
+        max_iv — итоговый максимальный интервал в днях).
+    """
+    rate = activity + stars
+    cost = 1.5
+    for _ in range(2):
+        # бюджета не хватает, чтобы обойти всех за max_interval: пол частот — четверть бюджета
+        max_iv = max(max_interval, 4.0 * len(rate) * cost / requests_per_day)
+        freq, mu = plan(rate, weight, requests_per_day / cost, min_interval, max_iv)
+        cost = 1.0 + float(np.sum(freq * -np.expm1(-activity / freq)) / max(freq.sum(), 1e-12))
+    return freq, mu, cost, max_iv
+
+
+def stale_priority(rate: np.ndarray, weight: np.ndarray, since_days: np.ndarray) -> np.ndarray:
+    """Вес × вероятность, что копия уже устарела — порядок в очереди на пересбор."""
+    return weight * -np.expm1(-rate * np.maximum(since_days, 0.0))
+
+
+# ---------- Mongo ----------
+
+def _days(values: Iterable[Any]) -> np.ndarray:
+    """ISO-строки / datetime -> дни от эпохи (NaN для пустых)."""
+    out = []
+    for v in values:
+        if v is None:
+            out.append("NaT")
+        elif isinstance(v, datetime):
+            if v.tzinfo is not None:
+                v = v.astimezone(timezone.utc).replace(tzinfo=None)  # pymongo по умолчанию отдаёт naive UTC
+            out.append(v.isoformat()[:19])
+        else:
+            out.append(str(v)[:19])
+    ms = np.array(out, dtype="datetime64[ms]")
+    days = ms.astype(np.int64) / 86_400_000.0
+    return np.where(np.isnat(ms), np.nan, days)
+
+
+def _now_days() -> float:
+    return time.time() / 86_400.0
+
+
+def _datetime(days: float) -> datetime:
+    return datetime.fromtimestamp(days * 86_400.0, tz=timezone.utc)
+
+
+class _Batch:
+    """Колонки проектов + их состояние refresh; fold() добавляет наблюдения с прошлого планирования."""
+
+    def __init__(self, docs: List[Dict[str, Any]]):
+        st = [d.get("refresh") or {} for d in docs]
+        self.pids = [d["project_id"] for d in docs]
+        self.activity_raw = [d.get("last_activity_at") for d in docs]
+        self.stars = np.array([d.get("star_count") or 0 for d in docs], dtype=float)
+        self.created = _days(d.get("created_at") for d in docs)
+        self.activity = _days(self.activity_raw)
+        self.fetched = _days(d.get("fetched_at") for d in docs)
+        self.seen_at = _days(s.get("seen_at") for s in st)
+        self.seen_activity = [s.get("seen_activity") for s in st]
+        self.seen_stars = np.array([s.get("seen_stars", 0) for s in st], dtype=float)
+        self.checks = np.array([s.get("checks", 0) for s in st], dtype=float)
+        self.changed = np.array([s.get("changed", 0) for s in st], dtype=float)
+        self.observed = np.array([s.get("observed_days", 0.0) for s in st], dtype=float)
+        self.gained = np.array([s.get("stars_gained", 0) for s in st], dtype=float)
+
+    def fold(self) -> int:
+        """Новый fetched_at после seen_at — ещё одна проверка: изменился ли last_activity_at, сколько новых звёзд."""
+        fresh = ~np.isnan(self.fetched) & ~(self.fetched <= self.seen_at)  # seen_at NaN — первое наблюдение
+        check = fresh & ~np.isnan(self.seen_at)
+        moved = np.array([a != s for a, s in zip(self.activity_raw, self.seen_activity)])
+        self.checks += check
+        self.changed += check & moved
+        self.observed += np.where(check, self.fetched - self.seen_at, 0.0)
+        self.gained += np.where(check, np.maximum(self.stars - self.seen_stars, 0.0), 0.0)
+        self.seen_at = np.where(fresh, self.fetched, self.seen_at)
+        self.seen_stars = np.where(fresh, self.stars, self.seen_stars)
+        self.seen_activity = [a if f else s for a, s, f in zip(self.activity_raw, self.seen_activity, fresh)]
+        return int(check.sum())
+
+    def rates(self, now: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(скорость активности, скорость звёзд, вес) на проект, в изменениях в день."""
+        idle = np.nan_to_num(now - self.activity, nan=365.0)
+        age = np.nan_to_num(now - self.created, nan=365.0)
+        act = activity_rate(self.checks, self.changed, self.observed, idle)
+        stars = star_velocity(self.gained, self.observed, self.stars, age)
+        return act, stars, weights(self.stars)
+
+    def updates(self, act: np.ndarray, stars: np.ndarray, weight: np.ndarray, freq: np.ndarray,
+                now: float) -> List[UpdateOne]:
+        interval = 1.0 / freq
+        base = np.where(np.isnan(self.seen_at), now, self.seen_at)
+        next_at = base + interval
+        ops = []
+        for i, pid in enumerate(self.pids):
+            seen = self.seen_at[i]
+            ops.append(UpdateOne({"project_id": pid}, {"$set": {"refresh": {
+                "seen_at": None if np.isnan(seen) else _datetime(seen),
+                "seen_activity": self.seen_activity[i],
+                "seen_stars": int(self.seen_stars[i]),
+                "checks": int(self.checks[i]),
+                "changed": int(self.changed[i]),
+                "observed_days": round(float(self.observed[i]), 4),
+                "stars_gained": int(self.gained[i]),
+                "rate": round(float(act[i] + stars[i]), 6),
+                "activity_rate": round(float(act[i]), 6),
+                "star_rate": round(float(stars[i]), 6),
+                "weight": round(float(weight[i]), 4),
+                "interval_days": round(float(interval[i]), 4),
+                "next_at": _datetime(next_at[i]),
+            }}}))
+        return ops
+
+
+def _plan_meta() -> Dict[str, Any]:
+    return get_db()[SETTINGS.mongo_coll_meta].find_one({"_id": "refresh_plan"}) or {}
+
+
+def _write(ops: List[UpdateOne], batch_size: int = 1000) -> None:
+    target = ingest_collection()
+    for i in range(0, len(ops), batch_size):
+        target.bulk_write(ops[i:i + batch_size], ordered=False)
+
+
+def schedule(requests_per_day: Optional[float] = None, batch_size: int = 50_000) -> Dict[str, Any]:
+    """
+    Полный проход: наблюдения с прошлого раза, скорости изменений, план под бюджет и refresh.next_at
+    для всех проектов. Множитель mu сохраняется в meta для app refresh.
+    """
+    budget = requests_per_day or SETTINGS.refresh_requests_per_day
+    min_iv, max_iv = SETTINGS.refresh_min_interval_hours * HOURS, SETTINGS.refresh_max_interval_days
+    now = _now_days()
+    db = get_db()
+    t0 = time.perf_counter()
+    cursor = db[SETTINGS.mongo_coll_projects].find({}, PROJECTION).batch_size(batch_size)
+    batches, checks = [], 0
+    chunk: List[Dict[str, Any]] = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= batch_size:
+            batches.append(_Batch(chunk))
+            chunk = []
+    if chunk:
+        batches.append(_Batch(chunk))
+    if not batches:
+        log.info("No projects to schedule")
+        return {"projects": 0}
+
+    parts = []
+    for b in batches:
+        checks += b.fold()
+        parts.append(b.rates(now))
+    act, stars, weight = (np.concatenate(p) for p in zip(*parts))
+    freq, mu, cost, max_iv = plan_requests(act, stars, weight, budget, min_iv, max_iv)
+
+    offset = 0
+    for b in batches:
+        n = len(b.pids)
+        sl = slice(offset, offset + n)
+        _write(b.updates(act[sl], stars[sl], weight[sl], freq[sl], now))
+        offset += n
+
+    expected = float(np.average(freshness(act + stars, freq), weights=weight))
+    plan_doc = {
+        "mu": mu, "max_interval_days": max_iv, "requests_per_day": budget, "cost_per_refresh": round(cost, 3),
+        "refreshes_per_day": round(float(freq.sum()), 1), "projects": len(freq), "new_checks": checks,
+        "expected_freshness": round(expected, 4), "planned_at": datetime.now(timezone.utc),
+    }
+    db[SETTINGS.mongo_coll_meta].update_one({"_id": "refresh_plan"}, {"$set": plan_doc}, upsert=True)
+    log.info("Refresh plan: %s projects, %.0f refreshes/day (%.2f requests each), expected weighted freshness %.3f "
+             "(%s new checks) in %.1fs", len(freq), freq.sum(), cost, expected, checks, time.perf_counter() - t0)
+    plan_doc["intervals"] = {q: round(float(np.percentile(1.0 / freq, q)), 2) for q in (10, 50, 90)}
+    return plan_doc
+
+
+def reschedule(project_ids: List[int]) -> int:
+    """Пересчёт refresh для только что пересобранных проектов с mu последнего плана."""
+    meta = _plan_meta()
+    if not project_ids or "mu" not in meta:
+        return 0
+    docs = list(get_db()[SETTINGS.mongo_coll_projects].find({"project_id": {"$in": project_ids}}, PROJECTION))
+    if not docs:
+        return 0
+    now = _now_days()
+    b = _Batch(docs)
+    b.fold()
+    act, stars, weight = b.rates(now)
+    freq = frequencies(act + stars, weight, meta["mu"], SETTINGS.refresh_min_interval_hours * HOURS,
+                       meta.get("max_interval_days", SETTINGS.refresh_max_interval_days))
+    _write(b.updates(act, stars, weight, freq, now))
+    return len(docs)
+
+
+def postpone(project_ids: List[int], days: float) -> None:
+    """Проекты, которые не удалось пересобрать, уходят из очереди на days (иначе они всегда первые)."""
+    if project_ids:
+        ingest_collection().update_many({"project_id": {"$in": project_ids}},
+                                        {"$set": {"refresh.next_at": _datetime(_now_days() + days)}})
+
+
+def due(limit: int, scan: int = 10) -> List[Dict[str, Any]]:
+    """
+    Очередь с приоритетом: из просроченных (refresh.next_at <= сейчас, до scan × limit самых давних)
+    берутся limit с наибольшим весом × вероятностью устаревания.
+    """
+    now = datetime.now(timezone.utc)
+    cur = get_db()[SETTINGS.mongo_coll_projects].find(
+        {"refresh.next_at": {"$lte": now}},
+        {"_id": 0, "project_id": 1, "last_activity_at": 1, "fetched_at": 1, "refresh.rate": 1, "refresh.weight": 1},
+    ).sort("refresh.next_at", ASCENDING).limit(limit * scan)
+    docs = list(cur)
+    if not docs:
+        return []
+    since = _now_days() - np.nan_to_num(_days(d.get("fetched_at") for d in docs), nan=0.0)
+    rate = np.array([d["refresh"].get("rate", 0.0) for d in docs])
+    weight = np.array([d["refresh"].get("weight", 1.0) for d in docs])
+    prio = stale_priority(rate, weight, since)
+    top = heapq.nlargest(limit, range(len(docs)), key=prio.__getitem__)
+    return [docs[i] for i in top]
+
+
+def spent_today() -> int:
+    day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    doc = get_db()[SETTINGS.mongo_coll_meta].find_one({"_id": f"refresh_budget:{day}"}) or {}
+    return int(doc.get("requests", 0))
+
+
+def spend(requests: int) -> None:
+    day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    get_db()[SETTINGS.mongo_coll_meta].update_one({"_id": f"refresh_budget:{day}"},
+                                                  {"$inc": {"requests": requests}}, upsert=True)
+
+
+async def _refresh(limit: int, batch: int) -> Dict[str, int]:
+    client = AsyncGitLabClient()
+    budget = int(SETTINGS.refresh_requests_per_day)
+    stats = {"refreshed": 0, "failed": 0, "requests": 0, "changed": 0}
+    try:
+        while not limit or stats["refreshed"] + stats["failed"] < limit:
+            remaining = budget - spent_today()
+            if remaining <= 0:
+                log.info("Daily refresh budget spent (%s requests)", budget)
+                break
+            # на проект 1–2 запроса: берём не больше, чем влезает в остаток
+            n = min(batch, max(remaining // 2, 1), limit - stats["refreshed"] - stats["failed"] if limit else batch)
+            picks = due(n)
+            if not picks:
+                log.info("No projects due for refresh")
+                break
+            req0 = client.req_count
+            results = await asyncio.gather(
+                *(client.refresh_one(d["project_id"], d.get("last_activity_at")) for d in picks),
+                return_exceptions=True,
+            )
+            docs, failed = [], []
+            for d, res in zip(picks, results):
+                if isinstance(res, Exception):
+                    log.warning("Refresh failed for %s: %s", d["project_id"], res)
+                    failed.append(d["project_id"])
+                else:
+                    docs.append(res)
+                    stats["changed"] += res.get("last_activity_at") != d.get("last_activity_at")
+            if docs:
+                upsert_projects(docs)
+                reschedule([d["project_id"] for d in docs])
+            postpone(failed, 1.0)
+            used = client.req_count - req0
+            spend(used)
+            stats["refreshed"] += len(docs)
+            stats["failed"] += len(failed)
+            stats["requests"] += used
+            log.info("Refresh: %s projects (%s changed, %s failed), %s requests; today %s/%s",
+                     stats["refreshed"], stats["changed"], stats["failed"], stats["requests"], spent_today(), budget)
+    finally:
+        await client.aclose()
+    return stats
+
+
+def run_refresh(limit: int = 0, batch: int = 200) -> Dict[str, int]:
+    if "mu" not in _plan_meta():
+        raise RuntimeError("No refresh plan yet: run `app schedule` first")
+    return asyncio.run(_refresh(limit, batch))
@@ -0,0 +1,280 @@
+"""
+"Similar projects" index over language mixes.
+
+Every project is a sparse vector lang_id -> share (projects.lang_ids/lang_pct or
+the languages table of a snapshot), L2-normalized, so similarity is cosine.
+The ANN part is random-projection LSH (SimHash): `tables` independent hashes of
+`bits` hyperplanes each; a project lands in one bucket per table. Vectors are
+centred on the mean mix before hashing, otherwise all of them sit in the
+positive orthant and most hyperplanes never split them.
+
+A query probes its own bucket and the buckets reached by flipping the least
+certain bits (multi-probe), then reranks the union of candidates by exact
+cosine. Everything is stored as plain .npy files and opened with mmap, so a
+query touches a few pages of the index instead of loading 4M vectors.
+
+Layout (<SIMILAR_INDEX_DIR>/):
+    meta.json        — sizes, hash parameters, source, language names
+    project_ids.npy  — int64[n], sorted; row -> project_id
+    indptr.npy       — int64[n+1] CSR of normalized vectors
+    lang_ids.npy     — uint16[nnz]
+    weights.npy      — float32[nnz]
+    planes.npy       — float32[tables*bits, width]
+    offset.npy       — float32[tables*bits] = planes @ mean vector
+    codes.npy        — uint32[tables, n], each table sorted
+    order.npy        — int32[tables, n], rows in the order of codes
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from .config import SETTINGS
+from .db import get_analytics_db, language_ids_complete, load_language_vocab
+
+log = logging.getLogger(__name__)
+
+ARRAYS = ("project_ids", "indptr", "lang_ids", "weights", "planes", "offset", "codes", "order")
+HASH_CHUNK = 200_000
+
+
+class _Rows:
+    """Накопитель CSR-строк кусками (без списков Python на каждый проект)."""
+
+    def __init__(self):
+        self.pids, self.lens, self.ids, self.pct = [], [], [], []
+
+    def add(self, pids, lens, ids, pct):
+        self.pids.append(np.asarray(pids, np.int64))
+        self.lens.append(np.asarray(lens, np.int64))
+        self.ids.append(np.asarray(ids, np.uint16))
+        self.pct.append(np.asarray(pct, np.float32))
+
+    def build(self):
+        cat = lambda parts, dt: np.concatenate(parts) if parts else np.zeros(0, dt)
+        return cat(self.pids, np.int64), cat(self.lens, np.int64), cat(self.ids, np.uint16), cat(self.pct, np.float32)
+
+
+def _read_mongo(batch_size: int = 10_000):
+    if not language_ids_complete():
+        raise RuntimeError("lang_ids are not backfilled yet. Run: python -m app migrate")
+    coll = get_analytics_db()[SETTINGS.mongo_coll_projects]
+    rows = _Rows()
+    pids, lens, ids, pct = [], [], [], []
+    cursor = coll.find({"lang_ids.0": {"$exists": True}}, {"_id": 0, "project_id": 1, "lang_ids": 1, "lang_pct": 1},
+                       no_cursor_timeout=True).batch_size(batch_size)
+    try:
+        for doc in cursor:
+            pids.append(doc["project_id"])
+            lens.append(len(doc["lang_ids"]))
+            ids.extend(doc["lang_ids"])
+            pct.extend(doc["lang_pct"])
+            if len(pids) >= HASH_CHUNK:
+                rows.add(pids, lens, ids, pct)
+                pids, lens, ids, pct = [], [], [], []
+    finally:
+        cursor.close()
+    rows.add(pids, lens, ids, pct)
+    return rows.build(), load_language_vocab(), {"mongo": f"{SETTINGS.mongo_db}.{SETTINGS.mongo_coll_projects}"}
+
+
+def _read_snapshot(path: str):
+    import pyarrow.parquet as pq
+    from .snapshot import latest_snapshot
+
+    root = latest_snapshot() if path == "latest" else Path(path)
+    rows = _Rows()
+    for part in sorted((root / "languages").glob("part-*.parquet")):
+        t = pq.read_table(part, columns=["project_id", "lang_id", "pct"])
+        pid = t.column("project_id").to_numpy()
+        if not len(pid):
+            continue
+        # строки одного проекта идут подряд (см. app.snapshot)
+        starts = np.flatnonzero(np.r_[True, pid[1:] != pid[:-1]])
+        rows.add(pid[starts], np.diff(np.r_[starts, len(pid)]),
+                 t.column("lang_id").to_numpy(), t.column("pct").to_numpy())
+    with open(root / "vocab.json") as f:
+        vocab = json.load(f)
+    return rows.build(), vocab, {"snapshot": str(root)}
+
+
+def _normalize(indptr: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    row = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    norm = np.sqrt(np.bincount(row, weights=weights.astype(np.float64) ** 2, minlength=len(indptr) - 1))
+    return (weights / np.maximum(norm, 1e-12)[row]).astype(np.float32)
+
+
+def _pack(bits: np.ndarray, tables: int, nbits: int) -> np.ndarray:
+    """(m, tables*nbits) bool -> (tables, m) uint32."""
+    shifts = np.arange(nbits, dtype=np.uint32)
+    b = bits.reshape(len(bits), tables, nbits).astype(np.uint32)
+    return (b << shifts).sum(axis=2, dtype=np.uint32).T
+
+
+def build_index(out_dir: str | None = None, snapshot: str | None = None,
+                tables: int = 8, bits: int = 16, seed: int = 0) -> Path:
+    """Read language vectors (Mongo, or a snapshot: path or "latest"), hash them and publish the index atomically."""
+    if not 1 <= bits <= 32:
+        raise ValueError("bits must be in 1..32")
+    t0 = time.time()
+    (pids, lens, ids, pct), vocab, source = _read_snapshot(snapshot) if snapshot else _read_mongo()
+    keep = lens > 0
+    indptr = np.r_[0, np.cumsum(lens)]
+    # проекты без языков похожих не имеют; дубликаты project_id (не бывает, но всё же) — по первому вхождению
+    order = np.argsort(pids, kind="stable")
+    order = order[keep[order]]
+    order = order[np.r_[True, pids[order][1:] != pids[order][:-1]]] if len(order) else order
+    lens = lens[order]
+    pos = (np.repeat(indptr[order] - np.r_[0, np.cumsum(lens)[:-1]], lens) + np.arange(lens.sum())) if len(order) else np.zeros(0, np.int64)
+    pids, ids, pct = pids[order], ids[pos], pct[pos]
+    indptr = np.r_[0, np.cumsum(lens)].astype(np.int64)
+    weights = _normalize(indptr, np.maximum(pct, 0))
+    n = len(pids)
+    width = int(ids.max()) + 1 if len(ids) else 1
+    log.info("Similar index: %s projects, %s language entries, %s languages (read in %.1fs)", n, len(ids), width, time.time() - t0)
+
+    X = sp.csr_matrix((weights, ids, indptr), shape=(n, width))
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((tables * bits, width)).astype(np.float32)
+    mean = np.asarray(X.mean(axis=0), dtype=np.float32).ravel()
+    offset = planes @ mean
+    codes = np.empty((tables, n), np.uint32)
+    for lo in range(0, n, HASH_CHUNK):
+        proj = X[lo: lo + HASH_CHUNK] @ planes.T
+        codes[:, lo: lo + HASH_CHUNK] = _pack(proj > offset, tables, bits)
+    rows = np.argsort(codes, axis=1, kind="stable").astype(np.int32)
+    codes = np.take_along_axis(codes, rows, axis=1)
+
+    root = Path(out_dir or SETTINGS.similar_index_dir)
+    tmp = root.with_name(f".{root.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        arrays = {"project_ids": pids, "indptr": indptr, "lang_ids": ids, "weights": weights,
+                  "planes": planes, "offset": offset, "codes": codes, "order": rows}
+        for name in ARRAYS:
+            np.save(tmp / f"{name}.npy", arrays[name])
+        names = [""] * width
+        for lang, idx in vocab.items():
+            if idx < width:
+                names[idx] = lang
+        meta = {
+            "created_at": datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+            "projects": n, "nnz": int(len(ids)), "width": width,
+            "tables": tables, "bits": bits, "seed": seed,
+            "buckets_used": [int(np.count_nonzero(np.diff(c)) + 1) if n else 0 for c in codes],
+            "source": source, "languages": names,
+        }
+        with open(tmp / "meta.json", "w") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        # подмена целиком: читатели видят либо старый индекс, либо новый
+        old = root.with_name(f".{root.name}.old")
+        shutil.rmtree(old, ignore_errors=True)
+        if root.exists():
+            os.replace(root, old)
+        os.replace(tmp, root)
+        shutil.rmtree(old, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    log.info("Similar index %s: %s projects, %s tables x %s bits in %.1fs", root, n, tables, bits, time.time() - t0)
+    return root
+
+
+class SimilarIndex:
+    """Read-only index opened with mmap; cheap to open, queries touch only the pages they need."""
+
+    def __init__(self, path: str | None = None):
+        self.root = Path(path or SETTINGS.similar_index_dir)
+        if not (self.root / "meta.json").exists():
+            raise FileNotFoundError(f"No similar index in {self.root}. Run: python -m app similar-index")
+        with open(self.root / "meta.json") as f:
+            self.meta = json.load(f)
+        for name in ARRAYS:
+            setattr(self, name, np.load(self.root / f"{name}.npy", mmap_mode="r"))
+        self.tables, self.bits = self.meta["tables"], self.meta["bits"]
+        self.names = self.meta["languages"]
+        # плоскости маленькие (tables*bits x width) — держим в памяти
+        self.planes = np.asarray(self.planes)
+        self.offset = np.asarray(self.offset)
+
+    def __len__(self):
+        return len(self.project_ids)
+
+    def row(self, project_id: int) -> int:
+        i = int(np.searchsorted(self.project_ids, project_id))
+        if i >= len(self) or self.project_ids[i] != project_id:
+            raise KeyError(project_id)
+        return i
+
+    def vector(self, row: int) -> tuple[np.ndarray, np.ndarray]:
+        lo, hi = self.indptr[row], self.indptr[row + 1]
+        return np.asarray(self.lang_ids[lo:hi]), np.asarray(self.weights[lo:hi])
+
+    def languages(self, row: int) -> dict[str, float]:
+        ids, w = self.vector(row)
+        share = w / max(float(w.sum()), 1e-12)  # L2-нормировка сохраняет пропорции долей
+        return {self.names[i] or str(i): float(s) for i, s in sorted(zip(ids, share), key=lambda x: -x[1])}
+
+    def _probe_codes(self, margin: np.ndarray, probes: int) -> np.ndarray:
+        """(tables, 1 + probes) кодов: свой бакет и соседи через переворот самых неуверенных битов."""
+        m = margin.reshape(self.tables, self.bits)
+        base = _pack((m > 0).reshape(1, -1), self.tables, self.bits)[:, 0]
+        if probes <= 0:
+            return base[:, None]
+        flip = np.argsort(np.abs(m), axis=1)[:, :probes].astype(np.uint32)
+        return np.concatenate([base[:, None], base[:, None] ^ (np.uint32(1) << flip)], axis=1)
+
+    def candidates(self, ids: np.ndarray, w: np.ndarray, probes: int = 4, max_bucket: int = 2000) -> np.ndarray:
+        margin = self.planes[:, ids] @ w - self.offset
+        out = []
+        for t, codes in enumerate(self._probe_codes(margin, probes)):
+            lo = np.searchsorted(self.codes[t], codes, side="left")
+            hi = np.searchsorted(self.codes[t], codes, side="right")
+            for a, b in zip(lo, hi):
+                # огромные бакеты (сотни тысяч «100% Python») режем: внутри них векторы почти одинаковы
+                if b > a:
+                    out.append(np.asarray(self.order[t, a: min(b, a + max_bucket)]))
+        return np.unique(np.concatenate(out)) if out else np.zeros(0, np.int32)
+
+    def scores(self, rows: np.ndarray, ids: np.ndarray, w: np.ndarray) -> np.ndarray:
+        """Косинус запроса с каждой из rows по CSR (векторы уже нормированы)."""
+        q = np.zeros(len(self.names), np.float32)
+        q[ids] = w
+        start = np.asarray(self.indptr[rows])
+        lens = np.asarray(self.indptr[rows + 1]) - start
+        pos = np.repeat(start - np.r_[0, np.cumsum(lens)[:-1]], lens) + np.arange(lens.sum())
+        vals = np.asarray(self.weights[pos]) * q[np.asarray(self.lang_ids[pos])]
+        return np.bincount(np.repeat(np.arange(len(rows)), lens), weights=vals, minlength=len(rows))
+
+    def _top(self, rows: np.ndarray, score: np.ndarray, k: int, exclude: int) -> list[tuple[int, float]]:
+        keep = rows != exclude
+        rows, score = rows[keep], score[keep]
+        if len(rows) > k:
+            part = np.argpartition(-score, k)[:k]
+            rows, score = rows[part], score[part]
+        best = np.lexsort((rows, -score))
+        return [(int(self.project_ids[r]), float(score[i])) for i, r in zip(best, rows[best])]
+
+    def query(self, project_id: int, k: int = 20, probes: int = 4, max_bucket: int = 2000) -> list[tuple[int, float]]:
+        """k ближайших (project_id, cosine) по LSH-кандидатам; сам проект не возвращается."""
+        row = self.row(project_id)
+        ids, w = self.vector(row)
+        rows = self.candidates(ids, w, probes, max_bucket)
+        return self._top(rows, self.scores(rows, ids, w), k, row)
+
+    def exact(self, project_id: int, k: int = 20) -> list[tuple[int, float]]:
+        """Точный ответ полным перебором (для проверки recall и --exact)."""
+        row = self.row(project_id)
+        ids, w = self.vector(row)
+        X = sp.csr_matrix((self.weights, self.lang_ids, self.indptr), shape=(len(self), len(self.names)))
+        q = np.zeros(len(self.names), np.float32)
+        q[ids] = w
+        return self._top(np.arange(len(self)), X @ q, k, row)
@@ -0,0 +1,212 @@
+"""
+Columnar snapshot of the projects collection (Parquet).
+
+Layout of one snapshot (<SNAPSHOT_DIR>/<ts>/):
+    projects/part-00000.parquet   — project_id, scalar metrics, dates, lang_count
+    languages/part-00000.parquet  — exploded languages: project_id, language, lang_id, pct
+    vocab.json                    — language -> lang_id vocabulary (app.db) at export time
+                                    (omitted if ids allocated during the export clash)
+    meta.json                     — row counts and creation time
+
+Parts of both tables are aligned: languages of projects/part-N are in
+languages/part-N, in the same project order (lang_count rows per project).
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+import logging
+import os
+import shutil
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .config import SETTINGS
+from .db import get_analytics_db, load_language_vocab
+
+log = logging.getLogger(__name__)
+
+METRIC_FIELDS = ("star_count", "forks_count", "open_issues_count")
+DATE_FIELDS = ("created_at", "last_activity_at")
+
+PROJECTS_SCHEMA = pa.schema(
+    [("project_id", pa.int64())]
+    + [(f, pa.int64()) for f in METRIC_FIELDS]
+    + [(f, pa.timestamp("ms", tz="UTC")) for f in DATE_FIELDS]
+    + [("lang_count", pa.int16())]
+)
+LANGUAGES_SCHEMA = pa.schema([
+    ("project_id", pa.int64()),
+    ("language", pa.dictionary(pa.int16(), pa.string())),
+    ("lang_id", pa.uint16()),
+    ("pct", pa.float32()),
+])
+
+
+def _metric(v):
+    return int(v) if isinstance(v, (int, float)) and v >= 0 else None
+
+
+def _dates(values: list) -> pa.Array:
+    ts = pd.to_datetime(pd.Series(values, dtype="object"), utc=True, errors="coerce", format="ISO8601")
+    return pa.array(ts.dt.floor("ms"), type=pa.timestamp("ms", tz="UTC"))
+
+
+class _PartWriter:
+    def __init__(self, root: Path, vocab: dict):
+        self.root = root
+        # id языков: сохранённые в проектах lang_ids, для остальных — словарь на момент экспорта.
+        # Экспорт только читает: новых id в lang_vocab не выделяет
+        self.vocab = dict(vocab)
+        self.names = {i: name for name, i in vocab.items()}
+        self.next_id = max(vocab.values(), default=-1) + 1
+        self.consistent = True
+        self.part = 0
+        self.rows = 0
+        self.lang_rows = 0
+        (root / "projects").mkdir(parents=True)
+        (root / "languages").mkdir(parents=True)
+        self._reset()
+
+    def _reset(self):
+        self.cols = {name: [] for name in PROJECTS_SCHEMA.names}
+        self.langs = {name: [] for name in LANGUAGES_SCHEMA.names}
+
+    def add(self, doc: dict):
+        pid = doc.get("project_id")
+        if pid is None:
+            return
+        langs = doc.get("languages") or {}
+        names, ids, pcts = self._languages(langs, doc.get("lang_ids"), doc.get("lang_pct"))
+        self.cols["project_id"].append(int(pid))
+        for f in METRIC_FIELDS:
+            self.cols[f].append(_metric(doc.get(f)))
+        for f in DATE_FIELDS:
+            self.cols[f].append(doc.get(f))
+        self.cols["lang_count"].append(len(names))
+        for lang, lang_id, pct in zip(names, ids, pcts):
+            self.langs["project_id"].append(int(pid))
+            self.langs["language"].append(lang)
+            self.langs["lang_id"].append(lang_id)
+            self.langs["pct"].append(float(pct or 0.0))
+
+    def _languages(self, langs: dict, lang_ids, lang_pct):
+        """(названия, id, доли) языков проекта."""
+        if lang_ids is not None and (not langs or len(langs) == len(lang_ids)):
+            names = list(langs) or [self.names.get(i, f"#{i}") for i in lang_ids]
+            pcts = lang_pct if lang_pct is not None and len(lang_pct) == len(lang_ids) else list(langs.values())
+            for name, i in zip(names, lang_ids):
+                self._bind(name, int(i))
+            return names, [int(i) for i in lang_ids], pcts or [0.0] * len(lang_ids)
+        ids = []
+        for name in langs:
+            i = self.vocab.get(name)
+            if i is None:
+                # язык ещё без id (проект до `app migrate`): локальный id после известных
+                i = self.next_id
+                self._bind(name, i)
+            ids.append(i)
+        return list(langs), ids, list(langs.values())
+
+    def _bind(self, name: str, i: int):
+        known = self.names.get(i)
+        if name.startswith("#"):
+            # заглушка для id без названия (проект без languages) — в словарь не попадает
+            self.next_id = max(self.next_id, i + 1)
+        elif known is None:
+            self.names[i] = name
+            self.vocab.setdefault(name, i)
+            self.next_id = max(self.next_id, i + 1)
+        elif known != name:
+            # локальный id совпал с выделенным параллельно сбором — колонка lang_id снапшота ненадёжна
+            self.consistent = False
+
+    def __len__(self):
+        return len(self.cols["project_id"])
+
+    def flush(self):
+        if not len(self):
+            return
+        arrays = [pa.array(self.cols["project_id"], pa.int64())]
+        arrays += [pa.array(self.cols[f], pa.int64()) for f in METRIC_FIELDS]
+        arrays += [_dates(self.cols[f]) for f in DATE_FIELDS]
+        arrays += [pa.array(self.cols["lang_count"], pa.int16())]
+        projects = pa.Table.from_arrays(arrays, schema=PROJECTS_SCHEMA)
+        languages = pa.Table.from_arrays([
+            pa.array(self.langs["project_id"], pa.int64()),
+            pa.array(self.langs["language"], pa.string()).dictionary_encode().cast(LANGUAGES_SCHEMA.field("language").type),
+            pa.array(self.langs["lang_id"], pa.uint16()),
+            pa.array(self.langs["pct"], pa.float32()),
+        ], schema=LANGUAGES_SCHEMA)
+
+        name = f"part-{self.part:05d}.parquet"
+        pq.write_table(projects, self.root / "projects" / name, compression="zstd")
+        pq.write_table(languages, self.root / "languages" / name, compression="zstd")
+        self.rows += projects.num_rows
+        self.lang_rows += languages.num_rows
+        self.part += 1
+        self._reset()
+
+
+def export_snapshot(out_dir: str | None = None, rows_per_part: int = 250_000, batch_size: int = 5000) -> Path:
+    """Stream `projects` into a new snapshot directory; returns its path."""
+    root = Path(out_dir or SETTINGS.snapshot_dir)
+    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    tmp = root / f".tmp-{ts}"
+    final = root / ts
+
+    coll = get_analytics_db()[SETTINGS.mongo_coll_projects]
+    projection = {"_id": 0, "project_id": 1, "languages": 1, "lang_ids": 1, "lang_pct": 1,
+                  **{f: 1 for f in METRIC_FIELDS + DATE_FIELDS}}
+
+    t0 = time.time()
+    writer = _PartWriter(tmp, load_language_vocab())
+    try:
+        # сортировка по project_id — детерминированный порядок, снапшоты сравнимы между собой
+        cursor = coll.find({}, projection, no_cursor_timeout=True).sort("project_id", 1).batch_size(batch_size)
+        try:
+            for doc in cursor:
+                writer.add(doc)
+                if len(writer) >= rows_per_part:
+                    writer.flush()
+                    log.info("Snapshot: %s projects written (%s parts)", writer.rows, writer.part)
+        finally:
+            cursor.close()
+        writer.flush()
+
+        meta = {
+            "created_at": ts,
+            "projects": writer.rows,
+            "languages": writer.lang_rows,
+            "parts": writer.part,
+            "source": {"uri": SETTINGS.mongo_uri, "db": SETTINGS.mongo_db, "collection": SETTINGS.mongo_coll_projects},
+        }
+        if writer.consistent:
+            with open(tmp / "vocab.json", "w") as f:
+                json.dump(writer.vocab, f, ensure_ascii=False)
+        else:
+            # без vocab.json читатели строят словарь по колонке language
+            log.warning("Snapshot: language ids changed during export, vocab.json not written")
+        with open(tmp / "meta.json", "w") as f:
+            json.dump(meta, f, indent=2)
+        # атомарно публикуем: читатели никогда не видят недописанный снапшот
+        os.replace(tmp, final)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    log.info("Snapshot %s: %s projects, %s language rows, %s parts in %.1fs",
+             final, writer.rows, writer.lang_rows, writer.part, time.time() - t0)
+    return final
+
+
+def latest_snapshot(root: str | None = None) -> Path:
+    """Most recent finished snapshot under SNAPSHOT_DIR."""
+    base = Path(root or SETTINGS.snapshot_dir)
+    done = sorted(p for p in base.glob("*") if p.is_dir() and not p.name.startswith(".") and (p / "meta.json").exists())
+    if not done:
+        raise FileNotFoundError(f"No snapshots in {base}. Run: python -m app snapshot")
+    return done[-1]
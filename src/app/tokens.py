@@ -0,0 +1,230 @@
+"""
+Pool of GitLab API tokens shared by the crawler clients.
+
+Each token has its own rate bucket fed by GitLab's RateLimit-* response headers
+(RateLimit-Remaining / RateLimit-Reset): a token is handed out only while it has
+quota left after the requests already in flight, otherwise the pool waits for the
+earliest reset. A 429 puts the token on cooldown (Retry-After), a 401 or a
+token-level 403 (revoked, expired, insufficient scope) takes it out of rotation.
+Requests go to the least busy token with quota, so N tokens give roughly N times
+one user's quota.
+
+Tokens come from GITLAB_TOKENS (comma separated) or GITLAB_TOKEN; without tokens
+the pool has a single anonymous slot.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from .config import SETTINGS
+from .metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+# признаки 403 из-за самого токена (а не закрытого проекта / statistics без прав)
+_TOKEN_403 = ("insufficient_scope", "invalid_token", "revoked", "expired")
+MIN_WAIT = 0.05
+
+
+def settings_tokens() -> List[Optional[str]]:
+    tokens = [t.strip() for t in (SETTINGS.gitlab_tokens or "").split(",") if t.strip()]
+    if not tokens and SETTINGS.gitlab_token:
+        tokens = [SETTINGS.gitlab_token]
+    # порядок сохраняем, дубликаты убираем: один токен — одна квота
+    return list(dict.fromkeys(tokens)) or [None]
+
+
+class RateLimiter:
+    """
+    Лимит запросов в секунду: каждый вызов бронирует следующий свободный слот
+    под замком и спит до него уже без замка.
+    """
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / max(rps, 0.1)
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class TokenState:
+    def __init__(self, token: Optional[str], rps: Optional[float] = None, index: int = 0):
+        self.token = token
+        self.index = index
+        self.limiter = RateLimiter(rps) if rps else None
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None  # None — квота неизвестна (ещё не было ответа) или окно сброшено
+        self.probing = False                  # окно только что сброшено: один пробный запрос, пока не узнаем новую квоту
+        self.reset_at = 0.0                   # unix time сброса окна (RateLimit-Reset)
+        self.cooldown_until = 0.0
+        self.inflight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.disabled: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        # номер в пуле и хвост токена: префикс у всех glpat-, а сам токен в логи и метрики не попадает
+        return f"#{self.index}…{self.token[-4:]}" if self.token else "anonymous"
+
+    def headers(self) -> Dict[str, str]:
+        return {"PRIVATE-TOKEN": self.token} if self.token else {}
+
+    def ready_at(self, now: float) -> float:
+        """Когда токен можно отдать (<= now — прямо сейчас)."""
+        at = self.cooldown_until
+        if self.probing and self.inflight:
+            # RateLimit-Reset округлён до секунды: залп по «сброшенному» окну может целиком уйти в 429
+            return max(at, now + MIN_WAIT)
+        if self.remaining is not None and self.remaining - self.inflight <= 0:
+            at = max(at, self.reset_at if self.reset_at > now else now)
+        return at
+
+
+class TokenPool:
+    """Выдача токенов для sync (acquire) и async (acquire_async) клиентов; после ответа — release."""
+
+    def __init__(self, tokens: List[Optional[str]], rps: Optional[float] = None):
+        self.states = [TokenState(t, rps, i) for i, t in enumerate(tokens or [None])]
+        self._lock = threading.Lock()
+        METRICS.set("gitlab_tokens_active", len(self.states))
+
+    @classmethod
+    def from_settings(cls, rps: Optional[float] = None) -> "TokenPool":
+        return cls(settings_tokens(), rps)
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    @property
+    def active(self) -> int:
+        return sum(s.disabled is None for s in self.states)
+
+    def _pick(self) -> Tuple[Optional[TokenState], float]:
+        now = time.time()
+        with self._lock:
+            alive = [s for s in self.states if s.disabled is None]
+            if not alive:
+                raise RuntimeError("No usable GitLab tokens left: " + ", ".join(f"{s.name} ({s.disabled})" for s in self.states))
+            for s in alive:
+                # окно сброшено — квота снова неизвестна до следующего ответа
+                if s.remaining is not None and s.reset_at and now >= s.reset_at:
+                    s.remaining = None
+                    s.probing = True
+            ready = [s for s in alive if s.ready_at(now) <= now]
+            if not ready:
+                return None, max(min(s.ready_at(now) for s in alive) - now, MIN_WAIT)
+            # свободнее всего: ближайший слот rps, меньше запросов в полёте, больше остаток квоты
+            best = min(ready, key=lambda s: (
+                s.limiter._next if s.limiter else 0.0,
+                s.inflight,
+                -(s.remaining if s.remaining is not None else float("inf")),
+            ))
+            best.inflight += 1
+            best.requests += 1
+        METRICS.inc("gitlab_token_requests_total", token=best.name)
+        return best, 0.0
+
+    def acquire(self) -> TokenState:
+        t0 = time.perf_counter()
+        while True:
+            state, delay = self._pick()
+            if state is not None:
+                break
+            time.sleep(delay)
+        if state.limiter is not None:
+            state.limiter.acquire()
+        waited = time.perf_counter() - t0
+        if waited > 0:
+            METRICS.observe_wait("token", waited)
+        return state
+
+    async def acquire_async(self) -> TokenState:
+        t0 = time.perf_counter()
+        while True:
+            state, delay = self._pick()
+            if state is not None:
+                break
+            await asyncio.sleep(delay)
+        waited = time.perf_counter() - t0
+        if waited > 0:
+            METRICS.observe_wait("token", waited)
+        return state
+
+    def release(self, state: TokenState, status: Optional[int], headers: Mapping[str, str] | None = None, body: str = "") -> str:
+        """
+        Учитывает ответ: обновляет квоту из RateLimit-*, на 429 ставит cooldown, на 401/403 токена — выключает.
+        Возвращает "ok", "throttled" (повторить, можно другим токеном) или "dropped" (повторить другим токеном).
+        status=None — запрос не дошёл (исключение), только освобождаем слот.
+        """
+        headers = headers or {}
+        now = time.time()
+        verdict = "ok"
+        with self._lock:
+            state.inflight = max(state.inflight - 1, 0)
+            remaining, reset = _int(headers.get("RateLimit-Remaining")), _int(headers.get("RateLimit-Reset"))
+            if headers.get("RateLimit-Limit"):
+                state.limit = _int(headers.get("RateLimit-Limit"))
+            if remaining is not None:
+                state.probing = False
+                if reset is not None and reset != int(state.reset_at):
+                    state.remaining, state.reset_at = remaining, float(reset)
+                else:
+                    # ответы приходят не по порядку: в пределах окна верим меньшему остатку
+                    state.remaining = remaining if state.remaining is None else min(state.remaining, remaining)
+            if status == 429:
+                retry_after = _float(headers.get("Retry-After"))
+                if retry_after is None:
+                    retry_after = max(state.reset_at - now, 1.0) if state.reset_at > now else 1.0
+                state.cooldown_until = max(state.cooldown_until, now + retry_after)
+                state.throttled += 1
+                verdict = "throttled"
+            elif state.token and (status == 401 or (status == 403 and any(m in body for m in _TOKEN_403))):
+                state.disabled = f"HTTP {status}"
+                verdict = "dropped"
+        if verdict == "dropped":
+            log.error("Token %s returned %s — removed from rotation (%s/%s tokens left)", state.name, status, self.active, len(self))
+            METRICS.set("gitlab_tokens_active", self.active)
+        elif verdict == "throttled":
+            METRICS.inc("gitlab_token_throttled_total", token=state.name)
+        return verdict
+
+    def summary(self) -> str:
+        """Короткая строка для логов прогресса: запросы / остаток квоты / 429 по каждому токену."""
+        parts = []
+        now = time.time()
+        for s in self.states:
+            if s.disabled:
+                parts.append(f"{s.name}:off")
+                continue
+            rem = "?" if s.remaining is None else f"{s.remaining}/{s.limit or '?'}"
+            cool = " cool" if s.cooldown_until > now else ""
+            parts.append(f"{s.name}:req={s.requests} rem={rem} 429={s.throttled}{cool}")
+        return "; ".join(parts)
+
+
+def _int(v) -> Optional[int]:
+    try:
+        return int(float(v))
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(v) -> Optional[float]:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
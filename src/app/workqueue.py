@@ -0,0 +1,286 @@
+"""
+Distributed crawl work queue in MongoDB.
+
+The crawl is split into work units: ranges of listing pages (`pages`, most starred
+first) or of project ids (`ids`, keyset pagination). Each unit is one document in
+MONGO_COLL_WORK_UNITS, so crawler containers on any number of hosts can share one
+crawl through the database instead of a local FETCH_PROGRESS_FILE.
+
+`app worker` claims a unit with findOneAndUpdate (a single atomic step, so a unit
+has at most one live owner) and gets a lease of WORK_LEASE_SECONDS. The worker
+extends the lease with a heartbeat every WORK_HEARTBEAT_SECONDS. A unit whose
+lease ran out (its worker died or hung) can be claimed again, up to
+WORK_MAX_ATTEMPTS claims; after that it is marked failed. Every unit keeps its own
+stats (pages, projects ok/failed, requests, seconds, owner). `app coordinator`
+seeds the units and reports progress until the queue drains.
+
+Project upserts are idempotent: a unit crawled twice after a lost lease costs
+requests, not data.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.collection import Collection
+
+from .config import SETTINGS
+from .db import get_db
+from .gitlab_client_async import AsyncGitLabClient
+from .metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+KINDS = ("pages", "ids")
+STAT_FIELDS = ("pages", "ok", "failed", "requests", "seconds")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """Операции над коллекцией единиц работы; все переходы статуса — одним атомарным запросом."""
+
+    def __init__(self, coll: Collection | None = None, lease_seconds: float | None = None, max_attempts: int | None = None):
+        self.coll = coll if coll is not None else get_db()[SETTINGS.mongo_coll_work_units]
+        self.lease = timedelta(seconds=lease_seconds or SETTINGS.work_lease_seconds)
+        self.max_attempts = max_attempts or SETTINGS.work_max_attempts
+
+    def seed(self, kind: str, start: int, end: int, size: int) -> int:
+        """Единицы [start, end) по size страниц/id. Повторный seed того же диапазона ничего не меняет."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown work unit kind: {kind}")
+        now = _now()
+        ops = []
+        for lo in range(start, end, max(1, size)):
+            hi = min(lo + size, end)
+            ops.append(UpdateOne({"_id": f"{kind}:{lo}-{hi}"}, {"$setOnInsert": {
+                "kind": kind, "lo": lo, "hi": hi, "status": PENDING, "attempts": 0,
+                "created_at": now, "stats": {k: 0 for k in STAT_FIELDS},
+            }}, upsert=True))
+        if not ops:
+            return 0
+        return self.coll.bulk_write(ops, ordered=False).upserted_count or 0
+
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        """Следующая свободная единица (или с истёкшей арендой) по порядку диапазонов; None — брать нечего."""
+        now = _now()
+        return self.coll.find_one_and_update(
+            {
+                "$or": [{"status": PENDING}, {"status": LEASED, "lease_until": {"$lt": now}}],
+                "attempts": {"$lt": self.max_attempts},
+            },
+            {
+                "$set": {"status": LEASED, "owner": owner, "lease": uuid.uuid4().hex,
+                         "lease_until": now + self.lease, "heartbeat_at": now, "started_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("kind", ASCENDING), ("lo", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _owned(self, unit: Dict[str, Any]) -> Dict[str, Any]:
+        # аренда — случайный id захвата: после перезахвата прежний владелец уже ничего не запишет
+        return {"_id": unit["_id"], "lease": unit["lease"], "status": LEASED}
+
+    def heartbeat(self, unit: Dict[str, Any], stats: Dict[str, Any]) -> bool:
+        """Продлевает аренду и сохраняет промежуточные stats; False — аренда потеряна."""
+        now = _now()
+        res = self.coll.update_one(self._owned(unit), {"$set": {
+            "lease_until": now + self.lease, "heartbeat_at": now, "stats": _stats(stats)}})
+        return res.matched_count == 1
+
+    def complete(self, unit: Dict[str, Any], stats: Dict[str, Any]) -> bool:
+        res = self.coll.update_one(self._owned(unit), {
+            "$set": {"status": DONE, "finished_at": _now(), "stats": _stats(stats)},
+            "$unset": {"lease_until": "", "error": ""},
+        })
+        return res.matched_count == 1
+
+    def fail(self, unit: Dict[str, Any], error: str, stats: Dict[str, Any]) -> str:
+        """Ошибка единицы: обратно в pending, после WORK_MAX_ATTEMPTS захватов — failed. Возвращает новый статус."""
+        status = FAILED if unit.get("attempts", 0) >= self.max_attempts else PENDING
+        self.coll.update_one(self._owned(unit), {
+            "$set": {"status": status, "error": error[:500], "stats": _stats(stats)},
+            "$unset": {"lease_until": ""},
+        })
+        return status
+
+    def expire(self) -> Dict[str, int]:
+        """Единицы с истёкшей арендой: в pending, а исчерпавшие попытки — в failed."""
+        now = _now()
+        stale = {"status": LEASED, "lease_until": {"$lt": now}}
+        failed = self.coll.update_many(
+            {**stale, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": FAILED, "error": "lease expired"}, "$unset": {"lease_until": ""}},
+        ).modified_count
+        requeued = self.coll.update_many(
+            stale, {"$set": {"status": PENDING}, "$unset": {"lease_until": ""}, "$inc": {"expired": 1}},
+        ).modified_count
+        if failed or requeued:
+            log.warning("Expired leases: %s requeued, %s failed", requeued, failed)
+        return {"requeued": requeued, "failed": failed}
+
+    def retry_failed(self) -> int:
+        return self.coll.update_many({"status": FAILED}, {"$set": {"status": PENDING, "attempts": 0}}).modified_count
+
+    def reset(self) -> int:
+        return self.coll.delete_many({}).deleted_count
+
+    def active(self) -> int:
+        """Сколько единиц ещё не завершено (pending + leased)."""
+        return self.coll.count_documents({"status": {"$in": [PENDING, LEASED]}})
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """status -> {units, pages, ok, failed, requests, seconds}."""
+        group: Dict[str, Any] = {"_id": "$status", "units": {"$sum": 1}}
+        group.update({k: {"$sum": f"$stats.{k}"} for k in STAT_FIELDS})
+        return {r.pop("_id"): r for r in self.coll.aggregate([{"$group": group}])}
+
+    def leases(self) -> List[Dict[str, Any]]:
+        return list(self.coll.find({"status": LEASED}, {"owner": 1, "lease_until": 1, "heartbeat_at": 1,
+                                                         "attempts": 1, "stats": 1}).sort("lo", ASCENDING))
+
+    def by_owner(self) -> List[Dict[str, Any]]:
+        """Итоги завершённых единиц по воркерам."""
+        group: Dict[str, Any] = {"_id": "$owner", "units": {"$sum": 1}}
+        group.update({k: {"$sum": f"$stats.{k}"} for k in STAT_FIELDS})
+        return list(self.coll.aggregate([{"$match": {"status": DONE}}, {"$group": group}, {"$sort": {"_id": 1}}]))
+
+
+def _stats(stats: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: stats.get(k, 0) for k in STAT_FIELDS}
+
+
+# ---------- воркер ----------
+
+async def _run_unit(queue: WorkQueue, client: AsyncGitLabClient, unit: Dict[str, Any]) -> str:
+    """Обработка одной единицы с heartbeat. Возвращает done / failed / pending / lost."""
+    uid = unit["_id"]
+    log.info("Claimed %s (attempt %s)", uid, unit["attempts"])
+    stats: Dict[str, Any] = {}
+    t0 = time.perf_counter()
+    task = asyncio.create_task(client.fetch_unit(unit["kind"], unit["lo"], unit["hi"], stats))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=SETTINGS.work_heartbeat_seconds)
+        stats["seconds"] = round(time.perf_counter() - t0, 3)
+        if done:
+            break
+        if not queue.heartbeat(unit, stats):
+            # аренду забрал другой воркер (мы не успели продлить) — бросаем, он пройдёт единицу заново
+            log.warning("Lease on %s lost, abandoning it", uid)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return "lost"
+    try:
+        task.result()
+    except Exception as e:
+        status = queue.fail(unit, f"{type(e).__name__}: {e}", stats)
+        log.error("Unit %s failed (%s): %s", uid, status, e)
+        return status
+    if not queue.complete(unit, stats):
+        log.warning("Unit %s finished after its lease was lost (documents are written anyway)", uid)
+        return "lost"
+    rate = stats["ok"] / stats["seconds"] if stats["seconds"] else 0.0
+    log.info("Unit %s done: %s pages, %s ok, %s failed, %s requests in %.1fs (%.1f projects/s)",
+             uid, stats["pages"], stats["ok"], stats["failed"], stats["requests"], stats["seconds"], rate)
+    return DONE
+
+
+async def work(queue: WorkQueue, owner: str, max_units: int = 0, poll: float = 5.0) -> Dict[str, int]:
+    """
+    Цикл воркера: захватить единицу, пройти, отметить. Выходит, когда в очереди не осталось
+    незавершённых единиц (или после max_units). Пока чужие аренды не истекли — ждёт poll секунд.
+    """
+    client = AsyncGitLabClient()
+    outcomes: Dict[str, int] = {}
+    try:
+        while not max_units or sum(outcomes.values()) < max_units:
+            unit = queue.claim(owner)
+            if unit is None:
+                queue.expire()
+                if not queue.active():
+                    log.info("Queue drained")
+                    break
+                await asyncio.sleep(poll)
+                continue
+            outcome = await _run_unit(queue, client, unit)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            METRICS.inc("work_units_total", outcome=outcome)
+            if outcome != DONE:
+                await asyncio.sleep(min(poll, 1.0))
+            if len(client.tokens) > 1:
+                log.info("Tokens: %s", client.tokens.summary())
+    finally:
+        await client.aclose()
+    log.info("Worker %s finished: %s", owner, outcomes)
+    return outcomes
+
+
+def run_worker(owner: str | None = None, max_units: int = 0, poll: float = 5.0) -> Dict[str, int]:
+    import uvloop
+    try:
+        uvloop.install()
+    except Exception:
+        pass
+    return asyncio.run(work(WorkQueue(), owner or default_owner(), max_units, poll))
+
+
+# ---------- координатор ----------
+
+def report(queue: WorkQueue, prev: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Одна строка прогресса (+ активные аренды). Возвращает итоги для расчёта скорости в следующий раз."""
+    summary = queue.summary()
+    total = {k: sum(s.get(k, 0) for s in summary.values()) for k in ("units", "ok", "failed", "requests")}
+    total["t"] = time.time()
+    units = lambda st: int(summary.get(st, {}).get("units", 0))
+    rate = ""
+    if prev:
+        dt = total["t"] - prev["t"]
+        rate = f" | {(total['ok'] - prev['ok']) / dt:.1f} projects/s" if dt > 0 else ""
+    req_per = total["requests"] / total["ok"] if total["ok"] else 0.0
+    print(f"Units: done {units(DONE)}/{int(total['units'])}, leased {units(LEASED)}, pending {units(PENDING)}, "
+          f"failed {units(FAILED)} | projects ok={int(total['ok'])} failed={int(total['failed'])} "
+          f"| req={int(total['requests'])} ({req_per:.2f}/project){rate}", flush=True)
+    now = _now()
+    for u in queue.leases():
+        until = u.get("lease_until")
+        if until is not None and until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc)  # pymongo без tz_aware отдаёт naive UTC
+        left = (until - now).total_seconds() if until else 0.0
+        st = u.get("stats") or {}
+        print(f"  {u['_id']:<22} {u.get('owner', '?'):<28} attempt {u.get('attempts', 0)} "
+              f"ok={st.get('ok', 0)} lease {'expired' if left < 0 else f'{left:.0f}s'}", flush=True)
+    return total
+
+
+def coordinate(queue: WorkQueue, interval: float = 10.0, once: bool = False) -> Dict[str, Dict[str, float]]:
+    """Раз в interval: возвращает в очередь единицы с истёкшей арендой и печатает прогресс; до опустошения очереди."""
+    prev = None
+    while True:
+        queue.expire()
+        prev = report(queue, prev)
+        if once or not queue.active():
+            break
+        time.sleep(interval)
+    owners = queue.by_owner()
+    if owners:
+        print("По воркерам (завершённые единицы):")
+        for o in owners:
+            rate = o["ok"] / o["seconds"] if o["seconds"] else 0.0
+            print(f"  {o['_id']:<28} units={o['units']:<5} ok={o['ok']:<8} failed={o['failed']:<5} "
+                  f"req={o['requests']:<8} {rate:.1f} projects/s")
+    return queue.summary()
@@ -0,0 +1 @@
+# бенчмарки (запуск: python -m bench.<name>)
@@ -0,0 +1,117 @@
+"""
+Время и пиковая память каждого скрипта графиков на синтетических наборах разного размера.
+
+Для каждого размера набор генерируется один раз (bench.synthetic) и переиспользуется между
+прогонами; каждый скрипт запускается отдельным процессом, пиковый RSS берётся из rusage
+именно этого процесса (os.wait4). Результаты пишутся в JSON, чтобы сравнивать между коммитами.
+
+    python -m bench.analytics --sizes 100000,1000000,5000000 --json /app/outputs/bench_analytics.json
+    python -m bench.analytics --source mongo --sizes 100000 --scripts medians_stars,trends
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.synthetic import DATA_DIR
+
+# имя -> (модуль, аргументы); {out} — временный каталог прогона
+SCRIPTS = {
+    "lang_distribution": ("scripts.lang_distribution_chart", ["--out", "{out}/lang_top20.png"]),
+    "lang_pie": ("scripts.lang_pie_chart", ["--out", "{out}/lang_pie.png", "--seed", "1"]),
+    "langs_per_project": ("scripts.languages_per_project_hist", ["--out", "{out}/languages_per_project.png"]),
+    "median_forks": ("scripts.median_forks_by_language", ["--out", "{out}/median_forks.png"]),
+    "median_stars": ("scripts.median_stars_by_language", ["--out", "{out}/median_stars.png"]),
+    "project_scale": ("scripts.project_size_by_language", ["--out", "{out}/project_scale.png"]),
+    "clusters": ("scripts.project_language_clusters", ["--out", "{out}/clusters.png", "--max-projects", "{size}"]),
+    "trends": ("scripts.language_trends", ["--out", "{out}"]),
+    "cooccurrence": ("scripts.language_cooccurrence", ["--out", "{out}/language_cooccurrence.png"]),
+    "backtest": ("scripts.language_backtest", ["--out", "{out}", "--models", "{out}/forecast_models.json"]),
+}
+WORKERS_SCRIPTS = {"lang_distribution", "lang_pie", "langs_per_project", "median_forks", "median_stars", "cooccurrence", "backtest"}
+
+
+def run_measured(cmd: list[str], env: dict) -> dict:
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # stderr читаем до wait4, иначе большой лог забьёт pipe и процесс встанет
+    err = proc.stderr.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - t0
+    res = {
+        "wall_s": round(wall, 2),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),  # Linux: килобайты
+        "returncode": proc.returncode,
+    }
+    if proc.returncode:
+        res["error"] = err.decode(errors="replace")[-2000:]
+    return res
+
+
+def ensure_dataset(size: int, source: str, seed: int, data_dir: str, db_prefix: str) -> dict:
+    """Готовит набор и возвращает env для дочерних процессов."""
+    env = dict(os.environ)
+    if source == "snapshot":
+        path = Path(data_dir) / f"synthetic-{size}-s{seed}"
+        if not (path / "meta.json").exists():
+            print(f"generate snapshot {path} ...", flush=True)
+            subprocess.run([sys.executable, "-m", "bench.synthetic", "--projects", str(size), "--seed", str(seed),
+                            "--target", "snapshot", "--out", str(path)], check=True)
+        env["BENCH_SNAPSHOT"] = str(path)
+    else:
+        env["MONGO_DB"] = f"{db_prefix}_{size}"
+        print(f"generate mongo {env['MONGO_DB']} ...", flush=True)
+        subprocess.run([sys.executable, "-m", "bench.synthetic", "--projects", str(size), "--seed", str(seed),
+                        "--target", "mongo", "--drop"], env=env, check=True)
+    return env
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк скриптов аналитики на синтетических данных")
+    ap.add_argument("--sizes", type=str, default="100000,1000000,5000000", help="Размеры наборов через запятую")
+    ap.add_argument("--scripts", type=str, default=",".join(SCRIPTS), help="Какие скрипты мерить")
+    ap.add_argument("--source", choices=["snapshot", "mongo"], default="snapshot")
+    ap.add_argument("--workers", type=int, default=1, help="--workers для скриптов, которые его поддерживают")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--data-dir", type=str, default=DATA_DIR, help="Где хранить сгенерированные снапшоты")
+    ap.add_argument("--db-prefix", type=str, default="gitlab_stats_bench", help="Префикс MONGO_DB для --source mongo")
+    ap.add_argument("--json", type=str, default=None, help="Куда сохранить результаты (JSON)")
+    args = ap.parse_args()
+
+    names = [s for s in args.scripts.split(",") if s]
+    unknown = set(names) - set(SCRIPTS)
+    if unknown:
+        ap.error(f"unknown scripts: {', '.join(sorted(unknown))}")
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        env = ensure_dataset(size, args.source, args.seed, args.data_dir, args.db_prefix)
+        for name in names:
+            module, extra = SCRIPTS[name]
+            with tempfile.TemporaryDirectory() as out:
+                cmd = [sys.executable, "-m", module] + [a.format(out=out, size=size) for a in extra]
+                cmd += ["--source", args.source]
+                if args.source == "snapshot":
+                    cmd += ["--snapshot", env["BENCH_SNAPSHOT"]]
+                if name in WORKERS_SCRIPTS and args.workers > 1:
+                    cmd += ["--workers", str(args.workers)]
+                res = run_measured(cmd, env)
+            row = {"script": name, "rows": size, "source": args.source, "workers": args.workers, **res}
+            results.append(row)
+            status = "ok" if not res["returncode"] else f"FAILED ({res['returncode']})"
+            print(f"{name:<18} rows={size:<9} {res['wall_s']:>8.2f}s  rss={res['peak_rss_mb']:>8.1f}MB  {status}", flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Результаты: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Бенчмарк краулера против локального mock GitLab (bench.mock_gitlab): projects/s,
+запросов на проект, p50/p99 задержки запросов и пиковый RSS для синхронного и
+асинхронного клиента при разных CONCURRENCY / SYNC_WORKERS.
+
+Каждый прогон — отдельный процесс (чистые SETTINGS из env и честный пиковый RSS).
+По умолчанию документы никуда не пишутся (--sink null), чтобы мерить только краулер;
+--sink mongo пишет в настроенную MongoDB как обычный fetch.
+
+    python -m bench.crawl --projects 20000 --limit 2000 --concurrency 8,32,128 --latency lognormal:40:0.5
+
+Проверка, что память краулера не растёт с объёмом (регрессия по пиковому RSS):
+
+    python -m bench.crawl --clients async,sync --projects 200000 --limit 200000 --rss-baseline 5000 --modes fast --latency fixed:1
+
+Масштабирование по числу токенов при квоте на токен (mock отдаёт RateLimit-* и 429 по каждому токену):
+
+    python -m bench.crawl --clients async --concurrency 32 --tokens 1,2,4,8 --rate-limit 200 --rate-window 2 --limit 4000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+from bench.mock_gitlab import add_server_args
+
+
+def _percentiles(latencies: list[float]) -> dict:
+    if not latencies:
+        return {"p50_ms": None, "p99_ms": None}
+    p50, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 99])
+    return {"p50_ms": round(float(p50), 1), "p99_ms": round(float(p99), 1)}
+
+
+def _null_upsert(docs) -> int:
+    return len(docs)
+
+
+# ---------- дочерний процесс: один прогон клиента ----------
+
+def run_async(limit: int, sink: str) -> dict:
+    from app import gitlab_client_async, gitlab_client_graphql
+    from app.config import SETTINGS
+    from app.gitlab_client_async import AsyncGitLabClient
+    from app.gitlab_client_graphql import GraphQLGitLabClient
+
+    if sink == "null":
+        gitlab_client_async.upsert_projects = _null_upsert
+        gitlab_client_async.known_projects = lambda ids: {}
+        gitlab_client_graphql.upsert_projects = _null_upsert
+
+    latencies: list[float] = []
+
+    async def _run():
+        client = GraphQLGitLabClient() if SETTINGS.fetch_backend == "graphql" else AsyncGitLabClient()
+        send = client.client.request
+
+        async def timed(*a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return await send(*a, **kw)
+            finally:
+                latencies.append(time.perf_counter() - t0)
+
+        client.client.request = timed
+        try:
+            return await client.fetch_projects_with_metrics(limit)
+        finally:
+            await client.aclose()
+
+    try:
+        import uvloop
+        uvloop.install()
+    except Exception:
+        pass
+    t0 = time.perf_counter()
+    ok = asyncio.run(_run())
+    return {"ok": ok, "elapsed_s": time.perf_counter() - t0, "latencies": latencies}
+
+
+def run_sync(limit: int, sink: str) -> dict:
+    from app import gitlab_client
+    from app.config import SETTINGS
+    from app.gitlab_client import GitLabClient
+
+    if sink == "null":
+        gitlab_client.upsert_projects = _null_upsert
+        gitlab_client.known_projects = lambda ids: {}
+
+    latencies: list[float] = []
+    client = GitLabClient(base_url=SETTINGS.gitlab_base_url, rps=SETTINGS.requests_per_second)
+    send = client.session.request
+
+    def timed(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return send(*a, **kw)
+        finally:
+            # list.append атомарен под GIL — безопасно из потоков SYNC_WORKERS
+            latencies.append(time.perf_counter() - t0)
+
+    client.session.request = timed
+    t0 = time.perf_counter()
+    try:
+        ok = client.fetch_projects_with_metrics(limit)
+    finally:
+        client.close()
+    return {"ok": ok, "elapsed_s": time.perf_counter() - t0, "latencies": latencies}
+
+
+def child_main(args):
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+
+    run = run_async if args.client == "async" else run_sync
+    res = run(args.limit, args.sink)
+    lat = res.pop("latencies")
+    res.update(_percentiles(lat))
+    res["requests_seen"] = len(lat)
+    # ru_maxrss в Linux — килобайты
+    res["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(json.dumps(res))
+
+
+# ---------- родитель: mock-сервер и серия прогонов ----------
+
+def _get_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=5) as r:
+        return json.load(r)
+
+
+def start_server(args) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "bench.mock_gitlab", "--port", str(args.port),
+        "--projects", str(args.projects), "--latency", args.latency,
+        "--p429", str(args.p429), "--p5xx", str(args.p5xx),
+        "--rate-limit", str(args.rate_limit), "--rate-window", str(args.rate_window),
+        "--offset-limit", str(args.offset_limit), "--seed", str(args.seed),
+        "--graphql-max-complexity", str(args.graphql_max_complexity),
+        "--reject-tokens", args.reject_tokens,
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    for _ in range(600):
+        try:
+            _get_json(f"http://127.0.0.1:{args.port}/__stats")
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("mock GitLab failed to start")
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("mock GitLab did not come up in time")
+
+
+def bench_tokens(n: int) -> list[str]:
+    # mock считает запросы по первым 8 символам токена — они должны различаться
+    return [f"t{i:02d}-bench-token" for i in range(n)]
+
+
+def run_one(args, client: str, concurrency: int, decode_pool: str = "none", mode: str = "full",
+            limit: int | None = None, tokens: int = 0) -> dict:
+    """client: sync | async | graphql (async-клиент с FETCH_BACKEND=graphql); tokens > 0 — GITLAB_TOKENS из стольких токенов."""
+    limit = limit or args.limit
+    backend = "graphql" if client == "graphql" else "rest"
+    child = "sync" if client == "sync" else "async"
+    base = f"http://127.0.0.1:{args.port}"
+    _get_json(f"{base}/__reset")
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            GITLAB_BASE_URL=f"{base}/api/v4",
+            CONCURRENCY=str(concurrency),
+            SYNC_WORKERS=str(concurrency),
+            USE_ASYNC="1" if child == "async" else "0",
+            REQUESTS_PER_SECOND=str(args.sync_rps),
+            FETCH_PROGRESS_FILE=os.path.join(tmp, "progress.json"),
+            RETRIES=str(args.retries),
+            DECODE_POOL=decode_pool,
+            METRICS_MODE=mode,
+            FETCH_BACKEND=backend,
+            GITLAB_TOKENS=",".join(bench_tokens(tokens) + [t for t in args.reject_tokens.split(",") if t]),
+        )
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.crawl", "--child", "--client", child,
+             "--limit", str(limit), "--sink", args.sink],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+    res = json.loads(out.strip().splitlines()[-1])
+    stats = _get_json(f"{base}/__stats")
+    requests_total = sum(v for k, v in stats.items() if k.startswith("req:"))
+    ok = res["ok"] or 0
+    return {
+        "client": client,
+        "concurrency": concurrency,
+        "decode_pool": decode_pool,
+        "mode": mode,
+        "projects": ok,
+        "elapsed_s": round(res["elapsed_s"], 2),
+        "projects_per_s": round(ok / res["elapsed_s"], 1) if res["elapsed_s"] > 0 else None,
+        "requests": requests_total,
+        "requests_per_project": round(requests_total / ok, 2) if ok else None,
+        "by_endpoint": {k[4:]: v for k, v in stats.items() if k.startswith("req:")},
+        "by_status": {k[7:]: v for k, v in stats.items() if k.startswith("status:")},
+        "tokens": tokens,
+        "by_token": {k[6:]: v for k, v in stats.items() if k.startswith("token:")},
+        "p50_ms": res["p50_ms"],
+        "p99_ms": res["p99_ms"],
+        "peak_rss_mb": res["peak_rss_mb"],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк краулера против mock GitLab")
+    ap.add_argument("--port", type=int, default=8089)
+    add_server_args(ap)
+    ap.add_argument("--limit", type=int, default=2000, help="FETCH_LIMIT для каждого прогона")
+    ap.add_argument("--clients", type=str, default="sync,async", help="Какие клиенты гонять: sync,async,graphql")
+    ap.add_argument("--concurrency", type=str, default="8,32,128", help="Уровни CONCURRENCY для async")
+    ap.add_argument("--sync-workers", type=str, default="1", help="Уровни SYNC_WORKERS для sync")
+    ap.add_argument("--decode-pools", type=str, default="none", help="DECODE_POOL для async: none,thread,process")
+    ap.add_argument("--modes", type=str, default="full", help="METRICS_MODE прогонов: full,fast")
+    ap.add_argument("--tokens", type=str, default="0",
+                    help="Сколько токенов в GITLAB_TOKENS (уровни через запятую; 0 = анонимно). С --rate-limit квота на каждый")
+    ap.add_argument("--sync-rps", type=float, default=1000.0, help="REQUESTS_PER_SECOND для sync (по умолчанию без тормоза)")
+    ap.add_argument("--retries", type=int, default=5)
+    ap.add_argument("--sink", choices=["null", "mongo"], default="null", help="Куда писать документы")
+    ap.add_argument("--rss-baseline", type=int, default=0,
+                    help="Проверка памяти: дополнительно прогнать каждый вариант с таким limit и сравнить пиковый RSS")
+    ap.add_argument("--max-rss-growth-mb", type=float, default=25.0,
+                    help="Допустимый рост пикового RSS от --rss-baseline до --limit (иначе код возврата 1)")
+    ap.add_argument("--json", type=str, default=None, help="Куда сохранить результаты (JSON)")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--client", choices=["sync", "async"], default="async", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child_main(args)
+        return
+
+    server = start_server(args)
+    results = []
+    try:
+        for client in [c for c in args.clients.split(",") if c]:
+            levels = [int(c) for c in args.sync_workers.split(",") if c] if client == "sync" else \
+                [int(c) for c in args.concurrency.split(",") if c]
+            pools = [p for p in args.decode_pools.split(",") if p] if client == "async" else ["none"]
+            # у GraphQL нет отдельных запросов деталей — режимы full/fast для него одинаковы
+            modes = [m for m in args.modes.split(",") if m] if client != "graphql" else ["full"]
+            token_levels = [int(t) for t in args.tokens.split(",") if t]
+            for conc, pool, mode, ntok in [(c, p, m, t) for c in levels for p in pools for m in modes for t in token_levels]:
+                row = run_one(args, client, conc, pool, mode, tokens=ntok)
+                results.append(row)
+                print(f"{client:<7} {mode:<4} conc={row['concurrency']:<4} pool={pool:<7} tokens={ntok:<3} {row['projects_per_s']:>9} projects/s  "
+                      f"req/project={row['requests_per_project']}  p50={row['p50_ms']}ms p99={row['p99_ms']}ms  "
+                      f"rss={row['peak_rss_mb']}MB", flush=True)
+                if args.rss_baseline:
+                    base = run_one(args, client, conc, pool, mode, args.rss_baseline, ntok)
+                    row["rss_baseline_mb"] = base["peak_rss_mb"]
+                    row["rss_growth_mb"] = round(row["peak_rss_mb"] - base["peak_rss_mb"], 1)
+                    row["rss_ok"] = row["rss_growth_mb"] <= args.max_rss_growth_mb
+                    print(f"      rss {base['projects']} -> {row['projects']} projects: {base['peak_rss_mb']} -> "
+                          f"{row['peak_rss_mb']}MB (+{row['rss_growth_mb']}MB) {'OK' if row['rss_ok'] else 'FAIL'}", flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Результаты: {args.json}")
+
+    if any(r.get("rss_ok") is False for r in results):
+        sys.exit(f"Пиковый RSS вырос больше чем на {args.max_rss_growth_mb}MB")
+
+
+if __name__ == "__main__":
+    main()
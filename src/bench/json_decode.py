@@ -0,0 +1,95 @@
+"""
+Микробенчмарк декодирования ответов /projects/:id: время и выделения памяти
+для r.json() (stdlib, весь объект) и бэкендов app.decode (stdlib/orjson/msgspec в компактную схему).
+
+Полезные нагрузки по умолчанию — синтетические ответы mock GitLab (форма как в data/data_set.txt);
+можно подать и записанные ответы: --payloads file.ndjson (один JSON-ответ на строку).
+
+    python -m bench.json_decode --n 20000 --json /app/outputs/bench_json_decode.json
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from app.decode import DECODERS
+from bench.mock_gitlab import ProjectFactory
+
+
+def load_payloads(path: str | None, n: int) -> list[bytes]:
+    if path:
+        with open(path, "rb") as f:
+            return [line.rstrip(b"\n") for line in f if line.strip()][:n]
+    factory = ProjectFactory(n)
+    return [json.dumps(factory.details(pid, "https://gitlab.example", statistics=True)).encode() for pid in range(1, n + 1)]
+
+
+def bench_time(decode, payloads: list[bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        for p in payloads:
+            decode(p)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_alloc(decode, payloads: list[bytes]) -> tuple[float, float]:
+    """(пик выделений, удерживаемая память) при декодировании с сохранением результатов — как в батче fetch."""
+    gc.collect()
+    tracemalloc.start()
+    kept = [decode(p) for p in payloads]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return peak / 2**20, current / 2**20
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк декодирования JSON ответов GitLab")
+    ap.add_argument("--n", type=int, default=10000, help="Сколько ответов декодировать")
+    ap.add_argument("--payloads", type=str, default=None, help="NDJSON с записанными ответами /projects/:id")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--alloc-sample", type=int, default=2000, help="Сколько ответов держать в памяти при замере выделений")
+    ap.add_argument("--json", type=str, default=None, help="Куда сохранить результаты (JSON)")
+    args = ap.parse_args()
+
+    payloads = load_payloads(args.payloads, args.n)
+    total_mb = sum(map(len, payloads)) / 2**20
+    print(f"{len(payloads)} payloads, {total_mb:.1f} MB, avg {1024 * total_mb / len(payloads):.1f} KB")
+
+    candidates = {"r.json() (stdlib, full)": json.loads}
+    for name, cls in DECODERS.items():
+        try:
+            candidates[f"{name} -> compact"] = cls().details
+        except ImportError as e:
+            print(f"[skip] {name}: {e}")
+
+    results = []
+    for label, decode in candidates.items():
+        sec = bench_time(decode, payloads, args.repeat)
+        peak, kept = bench_alloc(decode, payloads[: args.alloc_sample])
+        row = {
+            "decoder": label,
+            "payloads": len(payloads),
+            "us_per_payload": round(1e6 * sec / len(payloads), 2),
+            "mb_per_s": round(total_mb / sec, 1),
+            "alloc_peak_mb": round(peak, 2),
+            "retained_mb": round(kept, 2),
+            "alloc_sample": min(args.alloc_sample, len(payloads)),
+        }
+        results.append(row)
+        print(f"{label:<26} {row['us_per_payload']:>8.2f} us/payload {row['mb_per_s']:>8.1f} MB/s  "
+              f"peak={row['alloc_peak_mb']:.1f}MB retained={row['retained_mb']:.1f}MB (per {row['alloc_sample']})")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Результаты: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+"""
+Локальная замена GitLab API для бенчмарков краулера (без расхода квоты gitlab.com).
+
+Эндпоинты (префикс /api/v4):
+    GET /projects                 — offset (page/per_page) и keyset (pagination=keyset, id_after) пагинация
+    GET /projects/:id             — подробный объект проекта (форма как в data/data_set.txt)
+    GET /projects/:id/languages   — {"Python": 82.1, ...}
+    POST /api/graphql             — запрос projects(first, after, sort) с курсорной пагинацией,
+                                    queryComplexity и отказом при превышении --graphql-max-complexity
+Служебные:
+    GET /__stats                  — счётчики запросов по эндпоинтам/статусам/токенам
+    GET /__reset                  — сбросить счётчики
+
+Проекты синтетические и детерминированные (зависят только от id и --seed): Zipf-популярность
+языков, 0–5 языков на проект, тяжёлые хвосты звёзд/форков. Есть задержки по распределению,
+инъекция 429/5xx и лимиты с заголовками RateLimit-* на каждый токен (или анонимного клиента);
+токены из --reject-tokens получают 401 (как отозванные).
+
+    python -m bench.mock_gitlab --port 8089 --projects 200000 --latency lognormal:40:0.5 --p429 0.01 --p5xx 0.005
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+API_PREFIX = "/api/v4"
+GRAPHQL_PATH = "/api/graphql"
+
+LANGUAGES = [
+    "JavaScript", "HTML", "Python", "Shell", "CSS", "Dockerfile", "Makefile", "Java", "C", "C++",
+    "TypeScript", "PHP", "C#", "Go", "Ruby", "Vue", "Kotlin", "Jupyter Notebook", "CMake", "Rust",
+    "SCSS", "Nix", "Lua", "Dart", "Swift", "Perl", "Scala", "TeX", "Haskell", "Elixir",
+    "Groovy", "Objective-C", "R", "MATLAB", "PowerShell", "Batchfile", "Assembly", "Clojure", "OCaml", "Julia",
+]
+
+ISSUES_TEMPLATE = (
+    "<!-- Please report new issues at https://example.org/report; this tracker is for staff-confirmed issues only. -->\r\n\r\n"
+    "#### Steps to reproduce:\r\n\r\n- open the app\r\n- ...\r\n\r\n#### What happened?\r\n\r\n...\r\n\r\n"
+    "#### What should have happened?\r\n\r\n...\r\n\r\n#### Version and Operating System:\r\n\r\n- Version: ...\r\n- OS: ...\r\n"
+)
+
+ACCESS_LEVEL_FIELDS = [
+    "issues_access_level", "repository_access_level", "merge_requests_access_level", "forking_access_level",
+    "wiki_access_level", "builds_access_level", "snippets_access_level", "pages_access_level",
+    "analytics_access_level", "container_registry_access_level", "security_and_compliance_access_level",
+    "releases_access_level", "environments_access_level", "feature_flags_access_level",
+    "infrastructure_access_level", "monitor_access_level", "model_experiments_access_level",
+    "model_registry_access_level", "package_registry_access_level",
+]
+
+
+# ---------- распределения задержек ----------
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Спецификация задержки в миллисекундах:
+      fixed:20 | uniform:10:50 | exp:30 (среднее) | lognormal:40:0.5 (медиана, sigma)
+    Возвращает функцию rng -> секунды.
+    """
+    kind, *args = spec.split(":")
+    vals = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda rng: vals[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(vals[0], vals[1]) / 1000
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / vals[0]) / 1000
+    if kind == "lognormal":
+        mu = math.log(vals[0])
+        return lambda rng: rng.lognormvariate(mu, vals[1]) / 1000
+    raise ValueError(f"unknown latency spec: {spec}")
+
+
+# ---------- синтетические проекты ----------
+
+class ProjectFactory:
+    def __init__(self, n: int, seed: int = 42, zipf_s: float = 1.1):
+        self.n = n
+        self.seed = seed
+        weights = [1.0 / (rank ** zipf_s) for rank in range(1, len(LANGUAGES) + 1)]
+        total = sum(weights)
+        self.lang_weights = [w / total for w in weights]
+        self.base = datetime(2012, 1, 1, tzinfo=timezone.utc)
+        # порядок для order_by=star_count (desc), как в GitLab: при равенстве — по id desc
+        stars = [self._scalars(pid)[0] for pid in range(1, n + 1)]
+        self.by_stars = sorted(range(1, n + 1), key=lambda pid: (stars[pid - 1], pid), reverse=True)
+
+    def _rng(self, pid: int) -> random.Random:
+        return random.Random(pid * 1_000_003 + self.seed)
+
+    def _scalars(self, pid: int) -> Tuple[int, int, int]:
+        rng = self._rng(pid)
+        stars = int(rng.paretovariate(1.1)) - 1
+        forks = int(stars * rng.uniform(0.05, 0.6) + rng.paretovariate(2.0)) - 1
+        issues = int(rng.paretovariate(1.6)) - 1
+        return stars, max(forks, 0), issues
+
+    def languages(self, pid: int) -> Dict[str, float]:
+        rng = random.Random(pid * 7_000_003 + self.seed)
+        if rng.random() < 0.1:
+            return {}  # пустой репозиторий
+        k = min(5, 1 + int(rng.expovariate(0.9)))
+        chosen = []
+        while len(chosen) < k:
+            lang = rng.choices(LANGUAGES, weights=self.lang_weights)[0]
+            if lang not in chosen:
+                chosen.append(lang)
+        shares = sorted((rng.random() ** 2 for _ in chosen), reverse=True)
+        total = sum(shares) or 1.0
+        return {lang: round(100 * s / total, 2) for lang, s in zip(chosen, shares)}
+
+    def _dates(self, pid: int) -> Tuple[str, str]:
+        rng = random.Random(pid * 3_000_017 + self.seed)
+        created = self.base + timedelta(seconds=rng.randint(0, 13 * 365 * 86400))
+        last = created + timedelta(seconds=int(rng.expovariate(1 / (400 * 86400))))
+        now = datetime.now(timezone.utc)
+        last = min(last, now)
+        fmt = "%Y-%m-%dT%H:%M:%S.000Z"
+        return created.strftime(fmt), last.strftime(fmt)
+
+    def simple(self, pid: int, base_url: str) -> dict:
+        group = f"group-{pid % 9973}"
+        path = f"project-{pid}"
+        created, last = self._dates(pid)
+        return {
+            "id": pid,
+            "description": f"Synthetic project {pid}",
+            "name": path,
+            "name_with_namespace": f"{group} / {path}",
+            "path": path,
+            "path_with_namespace": f"{group}/{path}",
+            "created_at": created,
+            "default_branch": "main",
+            "tag_list": [],
+            "topics": [],
+            "ssh_url_to_repo": f"git@gitlab.example:{group}/{path}.git",
+            "http_url_to_repo": f"{base_url}/{group}/{path}.git",
+            "web_url": f"{base_url}/{group}/{path}",
+            "readme_url": f"{base_url}/{group}/{path}/-/blob/main/README.md",
+            "forks_count": self._scalars(pid)[1],
+            "avatar_url": None,
+            "star_count": self._scalars(pid)[0],
+            "last_activity_at": last,
+            "namespace": {
+                "id": pid % 9973, "name": group, "path": group, "kind": "group",
+                "full_path": group, "parent_id": None, "avatar_url": None,
+                "web_url": f"{base_url}/groups/{group}",
+            },
+        }
+
+    def listing(self, pid: int, base_url: str) -> dict:
+        """Не-simple объект списка /projects: счётчики и даты уже есть, statistics — нет."""
+        doc = self.simple(pid, base_url)
+        stars, forks, issues = self._scalars(pid)
+        doc.update({
+            "visibility": "public",
+            "open_issues_count": issues,
+            "archived": False,
+            "empty_repo": False,
+            "issues_enabled": True,
+            "merge_requests_enabled": True,
+            "wiki_enabled": False,
+            "jobs_enabled": True,
+            "snippets_enabled": False,
+            "updated_at": doc["last_activity_at"],
+        })
+        return doc
+
+    def graphql_node(self, pid: int, base_url: str) -> dict:
+        """Project в GraphQL: camelCase, gid, languages списком {name, share}."""
+        doc = self.listing(pid, base_url)
+        return {
+            "id": f"gid://gitlab/Project/{pid}",
+            "name": doc["name"],
+            "fullPath": doc["path_with_namespace"],
+            "webUrl": doc["web_url"],
+            "description": doc["description"],
+            "topics": doc["topics"],
+            "starCount": doc["star_count"],
+            "forksCount": doc["forks_count"],
+            "openIssuesCount": doc["open_issues_count"],
+            "visibility": doc["visibility"],
+            "archived": doc["archived"],
+            "createdAt": doc["created_at"].replace(".000Z", "Z"),
+            "lastActivityAt": doc["last_activity_at"].replace(".000Z", "Z"),
+            "languages": [{"name": k, "share": v, "color": None} for k, v in self.languages(pid).items()],
+        }
+
+    def details(self, pid: int, base_url: str, statistics: bool) -> dict:
+        doc = self.listing(pid, base_url)
+        api = f"{base_url}{API_PREFIX}/projects/{pid}"
+        doc.update({
+            "container_registry_image_prefix": f"registry.gitlab.example/{doc['path_with_namespace']}",
+            "_links": {
+                "self": api, "issues": f"{api}/issues", "merge_requests": f"{api}/merge_requests",
+                "repo_branches": f"{api}/repository/branches", "labels": f"{api}/labels",
+                "events": f"{api}/events", "members": f"{api}/members", "cluster_agents": f"{api}/cluster_agents",
+            },
+            "marked_for_deletion_at": None,
+            "marked_for_deletion_on": None,
+            "packages_enabled": True,
+            "resolve_outdated_diff_discussions": False,
+            "repository_object_format": "sha1",
+            "container_registry_enabled": False,
+            "service_desk_enabled": None,
+            "can_create_merge_request_in": True,
+            **{f: "enabled" for f in ACCESS_LEVEL_FIELDS},
+            "emails_disabled": False,
+            "emails_enabled": True,
+            "shared_runners_enabled": True,
+            "lfs_enabled": False,
+            "creator_id": pid % 100003,
+            "import_status": "none",
+            "description_html": f'<p data-sourcepos="1:1-1:28" dir="auto">{doc["description"]}</p>',
+            "ci_config_path": "",
+            "public_jobs": True,
+            "shared_with_groups": [],
+            "only_allow_merge_if_pipeline_succeeds": False,
+            "allow_merge_on_skipped_pipeline": False,
+            "request_access_enabled": False,
+            "only_allow_merge_if_all_discussions_are_resolved": True,
+            "remove_source_branch_after_merge": True,
+            "printing_merge_request_link_enabled": True,
+            "merge_method": "ff",
+            "squash_option": "default_off",
+            "suggestion_commit_message": "",
+            "autoclose_referenced_issues": True,
+            "approvals_before_merge": 0,
+            "mirror": False,
+            "compliance_frameworks": [],
+            "issues_template": ISSUES_TEMPLATE,
+            "merge_requests_template": "",
+            "permissions": {"project_access": None, "group_access": None},
+        })
+        if statistics:
+            rng = self._rng(pid)
+            size = int(rng.paretovariate(1.2) * 100_000)
+            doc["statistics"] = {
+                "commit_count": int(rng.paretovariate(1.3) * 10),
+                "storage_size": size, "repository_size": size, "wiki_size": 0,
+                "lfs_objects_size": 0, "job_artifacts_size": 0, "packages_size": 0, "snippets_size": 0,
+            }
+        return doc
+
+
+# ---------- лимиты ----------
+
+class RateLimiter:
+    """Фиксированное окно на токен, как у GitLab.com (RateLimit-* заголовки)."""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.windows: Dict[str, Tuple[float, int]] = {}
+
+    def check(self, key: str) -> Tuple[bool, Dict[str, str]]:
+        if self.limit <= 0:
+            return True, {}
+        now = time.time()
+        start, used = self.windows.get(key, (now, 0))
+        if now - start >= self.window:
+            start, used = now, 0
+        used += 1
+        self.windows[key] = (start, used)
+        reset = start + self.window
+        headers = {
+            "RateLimit-Name": "throttle_authenticated_api" if key else "throttle_unauthenticated_api",
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Observed": str(used),
+            "RateLimit-Remaining": str(max(self.limit - used, 0)),
+            "RateLimit-Reset": str(int(reset)),
+            "RateLimit-ResetTime": formatdate(reset, usegmt=True),
+        }
+        if used > self.limit:
+            headers["Retry-After"] = str(max(1, math.ceil(reset - now)))
+            return False, headers
+        return True, headers
+
+
+# ---------- сервер ----------
+
+class MockGitLab:
+    def __init__(
+        self,
+        projects: int = 100_000,
+        latency: str = "fixed:0",
+        p429: float = 0.0,
+        p5xx: float = 0.0,
+        rate_limit: int = 0,
+        rate_window: float = 60.0,
+        offset_limit: int = 0,
+        graphql_max_complexity: int = 250,
+        reject_tokens: Iterable[str] = (),
+        seed: int = 42,
+        host: str = "127.0.0.1",
+        port: int = 8089,
+    ):
+        self.factory = ProjectFactory(projects, seed=seed)
+        self.latency = parse_latency(latency)
+        self.p429 = p429
+        self.p5xx = p5xx
+        self.limiter = RateLimiter(rate_limit, rate_window)
+        self.offset_limit = offset_limit
+        self.graphql_max_complexity = graphql_max_complexity
+        self.reject_tokens = set(reject_tokens)
+        self.host = host
+        self.port = port
+        self.rng = random.Random(seed)
+        self.stats: Counter = Counter()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def api_url(self) -> str:
+        return self.base_url + API_PREFIX
+
+    # --- маршрутизация ---
+
+    def _route(self, path: str, query: Dict[str, List[str]]) -> Tuple[str, int, object, Dict[str, str]]:
+        """-> (endpoint, status, body, headers)"""
+        q = {k: v[-1] for k, v in query.items()}
+        if not path.startswith(API_PREFIX):
+            return "other", 404, {"message": "404 Not Found"}, {}
+        parts = path[len(API_PREFIX):].strip("/").split("/")
+        if parts == ["projects"]:
+            return self._list_projects(q)
+        if len(parts) >= 2 and parts[0] == "projects" and parts[1].isdigit():
+            pid = int(parts[1])
+            if not 1 <= pid <= self.factory.n:
+                return "details", 404, {"message": "404 Project Not Found"}, {}
+            if len(parts) == 2:
+                stats = q.get("statistics", "").lower() in ("1", "true")
+                return "details", 200, self.factory.details(pid, self.base_url, stats), {}
+            if parts[2:] == ["languages"]:
+                return "languages", 200, self.factory.languages(pid), {}
+        return "other", 404, {"message": "404 Not Found"}, {}
+
+    def _list_projects(self, q: Dict[str, str]):
+        per_page = max(1, min(int(q.get("per_page", 20)), 100))
+        simple = q.get("simple", "").lower() in ("1", "true")
+        render = self.factory.simple if simple else self.factory.listing
+        headers = {}
+
+        if q.get("pagination") == "keyset":
+            if q.get("order_by", "id") != "id":
+                return "list", 400, {"error": "keyset pagination supports only order_by=id"}, {}
+            after = int(q.get("id_after", 0))
+            ids = list(range(after + 1, min(after + per_page, self.factory.n) + 1))
+            if ids and ids[-1] < self.factory.n:
+                nxt = dict(q, id_after=ids[-1])
+                headers["Link"] = f'<{self.api_url}/projects?{urlencode(nxt)}>; rel="next"'
+        else:
+            page = max(1, int(q.get("page", 1)))
+            start = (page - 1) * per_page
+            if self.offset_limit and start + per_page > self.offset_limit:
+                return "list", 405, {"error": f"Offset pagination has a maximum allowed offset of {self.offset_limit} "
+                                              "for requests that return objects of type Project. "
+                                              "Remove the page parameter to use keyset pagination."}, {}
+            if q.get("order_by") == "star_count":
+                order = self.factory.by_stars
+                ids = order[start:start + per_page] if q.get("sort", "desc") == "desc" else order[::-1][start:start + per_page]
+            else:
+                ids = list(range(start + 1, min(start + per_page, self.factory.n) + 1))
+            headers["X-Page"] = str(page)
+            headers["X-Per-Page"] = str(per_page)
+            if start + per_page < self.factory.n:
+                headers["X-Next-Page"] = str(page + 1)
+        return "list", 200, [render(pid, self.base_url) for pid in ids], headers
+
+    def _graphql(self, payload: bytes):
+        """
+        Упрощённый GraphQL: понимает только projects(first, after, sort) с выбором полей узла.
+        Сложность как у GitLab по порядку величины: 1 за поле, поля узла умножаются на first.
+        """
+        try:
+            req = json.loads(payload or b"{}")
+            query, variables = req.get("query") or "", req.get("variables") or {}
+        except ValueError:
+            return "graphql", 400, {"errors": [{"message": "Invalid JSON"}]}, {}
+        m = re.search(r"nodes\s*{((?:[^{}]|{[^{}]*})*)}", query)
+        if "projects" not in query or not m:
+            return "graphql", 200, {"errors": [{"message": "Only the projects query is supported"}]}, {}
+        selected = set(re.findall(r"[A-Za-z_]\w*", m.group(1)))
+        first = min(int(variables.get("first") or 20), 100)
+        score = 6 + first * len(selected)
+        limit = self.graphql_max_complexity
+        if limit and score > limit:
+            return "graphql", 200, {"errors": [{
+                "message": f"Query has complexity of {score}, which exceeds max complexity of {limit}",
+            }]}, {}
+
+        after = variables.get("after")
+        start = int(base64.b64decode(after)) if after else 0
+        sort = variables.get("sort") or "id_asc"
+        if sort in ("stars_desc", "star_count_desc"):
+            ids = self.factory.by_stars[start:start + first]
+        else:
+            ids = list(range(start + 1, min(start + first, self.factory.n) + 1))
+        end = start + len(ids)
+        nodes = []
+        for pid in ids:
+            node = self.factory.graphql_node(pid, self.base_url)
+            nodes.append({k: v for k, v in node.items() if k in selected})
+        data = {"projects": {
+            "pageInfo": {"hasNextPage": end < self.factory.n, "endCursor": base64.b64encode(str(end).encode()).decode()},
+            "nodes": nodes,
+        }}
+        if "queryComplexity" in query:
+            data["queryComplexity"] = {"limit": limit, "score": score}
+        return "graphql", 200, {"data": data}, {}
+
+    async def handle(self, method: str, target: str, headers: Dict[str, str], payload: bytes = b"") -> Tuple[int, bytes, Dict[str, str]]:
+        url = urlsplit(target)
+        if url.path == "/__stats":
+            return 200, json.dumps(dict(self.stats)).encode(), {}
+        if url.path == "/__reset":
+            self.stats.clear()
+            return 200, b"{}", {}
+
+        token = headers.get("private-token") or headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if url.path == GRAPHQL_PATH and method == "POST":
+            endpoint, status, body, extra = self._graphql(payload)
+        else:
+            endpoint, status, body, extra = self._route(url.path, parse_qs(url.query))
+        self.stats[f"req:{endpoint}"] += 1
+        self.stats[f"token:{token[:8] or 'anonymous'}"] += 1
+
+        await asyncio.sleep(self.latency(self.rng))
+        if token in self.reject_tokens:
+            self.stats["status:401"] += 1
+            return 401, json.dumps({"message": "401 Unauthorized"}).encode(), {}
+
+        allowed, rl_headers = self.limiter.check(token)
+        extra = {**extra, **rl_headers}
+        if not allowed:
+            status, body = 429, {"message": "429 Too Many Requests"}
+        elif self.rng.random() < self.p429:
+            status, body = 429, {"message": "429 Too Many Requests"}
+            extra["Retry-After"] = "1"
+        elif self.rng.random() < self.p5xx:
+            status, body = self.rng.choice([500, 502, 503]), {"message": "Internal Server Error"}
+        self.stats[f"status:{status}"] += 1
+        return status, json.dumps(body).encode(), extra
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = lines[0].split(" ", 2)
+                hdrs = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        hdrs[k.strip().lower()] = v.strip()
+                length = int(hdrs.get("content-length", 0) or 0)
+                payload = await reader.readexactly(length) if length else b""
+
+                status, body, extra = await self.handle(method, target, hdrs, payload)
+                out = [f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}",
+                       "Content-Type: application/json",
+                       f"Content-Length: {len(body)}"]
+                out += [f"{k}: {v}" for k, v in extra.items()]
+                writer.write(("\r\n".join(out) + "\r\n\r\n").encode("latin-1") + body)
+                await writer.drain()
+                if hdrs.get("connection", "").lower() == "close":
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._client, self.host, self.port, backlog=1024)
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self) -> "MockGitLab":
+        """Запуск в фоновом потоке (для сценариев, где сервер и клиент в одном процессе)."""
+        ready = threading.Event()
+
+        def _run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._server = loop.run_until_complete(asyncio.start_server(self._client, self.host, self.port, backlog=1024))
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=_run, name="mock-gitlab", daemon=True).start()
+        ready.wait()
+        return self
+
+
+def add_server_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--projects", type=int, default=100_000, help="Сколько синтетических проектов отдавать")
+    ap.add_argument("--latency", type=str, default="lognormal:40:0.5",
+                    help="Задержка, мс: fixed:20 | uniform:10:50 | exp:30 | lognormal:40:0.5")
+    ap.add_argument("--p429", type=float, default=0.0, help="Доля случайных 429")
+    ap.add_argument("--p5xx", type=float, default=0.0, help="Доля случайных 5xx")
+    ap.add_argument("--rate-limit", type=int, default=0, help="Запросов на токен за окно (0 = без лимита)")
+    ap.add_argument("--rate-window", type=float, default=60.0, help="Окно лимита, секунды")
+    ap.add_argument("--offset-limit", type=int, default=0, help="Максимальный offset для page/per_page (0 = без лимита)")
+    ap.add_argument("--graphql-max-complexity", type=int, default=250, help="Лимит сложности GraphQL-запроса (0 = без лимита)")
+    ap.add_argument("--reject-tokens", type=str, default="", help="Токены через запятую, которым отвечать 401")
+    ap.add_argument("--seed", type=int, default=42)
+
+
+def server_from_args(args, host: str = "127.0.0.1", port: int = 8089) -> MockGitLab:
+    return MockGitLab(
+        projects=args.projects, latency=args.latency, p429=args.p429, p5xx=args.p5xx,
+        rate_limit=args.rate_limit, rate_window=args.rate_window, offset_limit=args.offset_limit,
+        graphql_max_complexity=args.graphql_max_complexity, seed=args.seed, host=host, port=port,
+        reject_tokens=[t for t in args.reject_tokens.split(",") if t],
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Mock GitLab API для бенчмарков краулера")
+    ap.add_argument("--host", type=str, default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    add_server_args(ap)
+    args = ap.parse_args()
+
+    server = server_from_args(args, host=args.host, port=args.port)
+    print(f"mock GitLab: {server.api_url} ({args.projects} projects, latency={args.latency})", flush=True)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Бенчмарк ввода-вывода MongoDB: docs/s на загрузке (bulk upsert) и на полном
+проецированном скане при разных настройках клиента (сжатие, write concern).
+
+Пишет во временную коллекцию (по умолчанию bench_projects), боевые данные не трогает.
+
+    python -m bench.mongo_io --docs 200000 --compressors none,zstd --modes safe,fast,unacked
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, MongoClient, UpdateOne
+
+from app.config import SETTINGS
+from app.db import INGEST_WRITE_CONCERNS, READ_PREFERENCES, client_options
+
+LANGS = [
+    "JavaScript", "HTML", "Python", "Shell", "CSS", "Dockerfile", "Makefile", "Java",
+    "C", "C++", "TypeScript", "PHP", "C#", "Go", "Ruby", "Kotlin", "Rust", "Vue",
+]
+SCAN_PROJECTION = {"languages": 1, "star_count": 1, "forks_count": 1, "open_issues_count": 1}
+
+
+def make_docs(n: int, seed: int = 42) -> list[dict]:
+    """Документы по форме близкие к тем, что пишет fetch (без тяжёлых details)."""
+    rng = random.Random(seed)
+    base = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    docs = []
+    for pid in range(1, n + 1):
+        k = rng.randint(1, 5)
+        shares = [rng.random() for _ in range(k)]
+        total = sum(shares)
+        langs = {lang: round(100 * s / total, 2) for lang, s in zip(rng.sample(LANGS, k), shares)}
+        created = base + timedelta(days=rng.randint(0, 3500))
+        docs.append({
+            "project_id": pid,
+            "name": f"project-{pid}",
+            "path_with_namespace": f"group-{pid % 997}/project-{pid}",
+            "web_url": f"https://gitlab.example/group-{pid % 997}/project-{pid}",
+            "star_count": int(rng.paretovariate(1.2)) - 1,
+            "forks_count": int(rng.paretovariate(1.4)) - 1,
+            "open_issues_count": int(rng.paretovariate(1.5)) - 1,
+            "visibility": "public",
+            "created_at": created.isoformat(),
+            "last_activity_at": (created + timedelta(days=rng.randint(0, 900))).isoformat(),
+            "details": {"description": "x" * rng.randint(0, 300), "topics": rng.sample(LANGS, 2)},
+            "languages": langs,
+        })
+    return docs
+
+
+def bench_ingest(client: MongoClient, coll_name: str, docs: list[dict], mode: str, batch: int) -> float:
+    coll = client[SETTINGS.mongo_db][coll_name]
+    coll.drop()
+    coll.create_index([("project_id", ASCENDING)], unique=True)
+    wc = INGEST_WRITE_CONCERNS[mode]
+    target = coll.with_options(write_concern=wc) if wc is not None else coll
+
+    t0 = time.perf_counter()
+    for i in range(0, len(docs), batch):
+        ops = [UpdateOne({"project_id": d["project_id"]}, {"$set": d}, upsert=True) for d in docs[i:i + batch]]
+        target.bulk_write(ops, ordered=False)
+    if mode == "unacked":
+        # при w=0 bulk_write возвращается сразу — ждём, пока сервер реально всё применит
+        while coll.estimated_document_count() < len(docs):
+            time.sleep(0.01)
+    return len(docs) / (time.perf_counter() - t0)
+
+
+def bench_scan(client: MongoClient, coll_name: str, read_preference: str, batch: int) -> float:
+    coll = client[SETTINGS.mongo_db].get_collection(coll_name, read_preference=READ_PREFERENCES[read_preference])
+    t0 = time.perf_counter()
+    n = 0
+    for _ in coll.find({}, SCAN_PROJECTION).batch_size(batch):
+        n += 1
+    return n / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк Mongo: загрузка и проецированный скан")
+    ap.add_argument("--docs", type=int, default=100000, help="Сколько синтетических документов писать")
+    ap.add_argument("--batch", type=int, default=1000, help="Размер bulk_write / batch_size курсора")
+    ap.add_argument("--compressors", type=str, default="none,zstd,snappy", help="Список через запятую (none = без сжатия)")
+    ap.add_argument("--modes", type=str, default="safe,fast,unacked", help="Режимы загрузки: safe,fast,unacked")
+    ap.add_argument("--pool-size", type=int, default=None, help="maxPoolSize (по умолчанию из MONGO_MAX_POOL_SIZE)")
+    ap.add_argument("--read-preference", type=str, default=SETTINGS.mongo_read_preference)
+    ap.add_argument("--coll", type=str, default="bench_projects", help="Временная коллекция")
+    ap.add_argument("--json", type=str, default=None, help="Куда сохранить результаты (JSON)")
+    args = ap.parse_args()
+
+    docs = make_docs(args.docs)
+    modes = [m for m in args.modes.split(",") if m]
+    results = []
+
+    for comp in [c for c in args.compressors.split(",") if c]:
+        opts = client_options(max_pool_size=args.pool_size, compressors="" if comp == "none" else comp)
+        try:
+            client = MongoClient(SETTINGS.mongo_uri, **opts)
+            client.admin.command("ping")
+        except Exception as e:
+            # например, не установлен python-snappy
+            print(f"[skip] compressors={comp}: {e}")
+            continue
+
+        try:
+            for mode in modes:
+                rate = bench_ingest(client, args.coll, docs, mode, args.batch)
+                results.append({"op": "ingest", "compressors": comp, "mode": mode, "docs": len(docs), "docs_per_s": round(rate, 1)})
+                print(f"ingest  compressors={comp:<7} mode={mode:<8} {rate:>12,.0f} docs/s")
+
+            rate = bench_scan(client, args.coll, args.read_preference, args.batch)
+            results.append({"op": "scan", "compressors": comp, "read_preference": args.read_preference, "docs": len(docs), "docs_per_s": round(rate, 1)})
+            print(f"scan    compressors={comp:<7} read={args.read_preference:<8} {rate:>12,.0f} docs/s")
+        finally:
+            client[SETTINGS.mongo_db][args.coll].drop()
+            client.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Результаты: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
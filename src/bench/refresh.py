@@ -0,0 +1,200 @@
+"""
+Симуляция пересбора на синтетическом наборе (bench.synthetic): свежесть копий на потраченный запрос
+у адаптивного планировщика (app.refresh) против равномерного обхода по кругу.
+
+У каждого проекта две скрытые пуассоновские скорости: изменений last_activity_at (около 1 / простой,
+с логнормальным шумом) и новых звёзд (около звёзд за жизнь / возраст, тоже с шумом). Копия свежая,
+пока ни то ни другое не изменилось. Пересбор стоит 1 запрос + 1, если сменился last_activity_at (языки).
+
+Политики при одном и том же дневном бюджете запросов и одной и той же истории изменений:
+    uniform   — все проекты по кругу, сколько влезает в бюджет;
+    adaptive  — app.refresh: оценки скоростей по наблюдениям, план раз в день, очередь по приоритету;
+    oracle    — то же с настоящими скоростями (верхняя граница для оценок).
+
+    python -m bench.refresh --projects 100000 --days 60 --budgets 0.01,0.02,0.05,0.1
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.refresh import (
+    activity_rate, frequencies, plan_requests, stale_priority, star_velocity, weights,
+)
+from bench.synthetic import DAY_MS, END, generate
+
+
+def load(n: int, seed: int, noise: float):
+    """Проекты синтетики и их скрытые скорости изменений (в день)."""
+    chunks = list(generate(n, seed))
+    stars = np.concatenate([c.star_count for c in chunks]).astype(float)
+    age = np.concatenate([(END - c.created_at) / np.timedelta64(DAY_MS, "ms") for c in chunks])
+    idle = np.concatenate([(END - c.last_activity_at) / np.timedelta64(DAY_MS, "ms") for c in chunks])
+    rng = np.random.default_rng([seed, 1, 0])
+    act_true = np.minimum(np.exp(rng.normal(0.0, noise, n)) / (idle + 1.0), 3.0)
+    star_true = stars / np.maximum(age, 1.0) * np.exp(rng.normal(0.0, noise, n))
+    return stars, np.maximum(age, 1.0), np.maximum(idle, 0.0), act_true, star_true
+
+
+def simulate(policy: str, data, requests_per_day: float, days: int, steps_per_day: int, warmup: int,
+             min_interval: float, max_interval: float, seed: int) -> dict:
+    stars0, age0, idle0, act_true, star_true = data
+    n = len(stars0)
+    dt = 1.0 / steps_per_day
+    w = weights(stars0)
+
+    # старт — как после долгого равномерного обхода: возраст копий равномерен в пределах круга,
+    # часть копий уже устарела (одинаково для всех политик)
+    rng = np.random.default_rng([seed, 2, 0])
+    last = -rng.uniform(0.0, n / requests_per_day, n)
+    true_act = np.zeros(n, dtype=np.int64)
+    true_stars = stars0.astype(np.int64)
+    stored_act = true_act - (rng.random(n) < -np.expm1(act_true * last))
+    stored_stars = true_stars - rng.poisson(star_true * -last)
+    # наблюдения планировщика
+    checks, changed, observed, gained = (np.zeros(n) for _ in range(4))
+    next_at = np.zeros(n)
+    rate = np.zeros(n)
+    mu, max_iv = 0.0, max_interval
+    pointer = 0
+    allowance = 0.0
+
+    fresh_sum = wfresh_sum = 0.0
+    measured = 0
+    spent = spent_measured = 0
+    t = 0.0
+
+    def estimates():
+        if policy == "oracle":
+            return act_true, star_true
+        return (activity_rate(checks, changed, observed, idle0 + t),
+                star_velocity(gained, observed, stars0, age0 + t))
+
+    for step in range(days * steps_per_day):
+        t = (step + 1) * dt
+        # одна и та же история изменений для всех политик
+        rng = np.random.default_rng([seed, step])
+        true_act += rng.random(n) < -np.expm1(-act_true * dt)
+        true_stars += rng.poisson(star_true * dt)
+
+        if policy != "uniform" and step % steps_per_day == 0:
+            act, st = estimates()
+            freq, mu, _, max_iv = plan_requests(act, st, w, requests_per_day, min_interval, max_interval)
+            rate = act + st
+            next_at = last + 1.0 / freq
+
+        allowance = min(allowance + requests_per_day * dt, requests_per_day)
+        if policy == "uniform":
+            k = min(int(allowance), n)
+            order = (pointer + np.arange(k)) % n
+        else:
+            due = np.flatnonzero(next_at <= t)
+            order = due[np.argsort(-stale_priority(rate[due], w[due], t - last[due]), kind="stable")]
+        moved = stored_act[order] != true_act[order]
+        cost = 1 + moved
+        take = int(np.searchsorted(np.cumsum(cost), allowance, side="right"))
+        sel, moved = order[:take], moved[:take]
+        if policy == "uniform":
+            pointer = (pointer + take) % n
+        used = int(cost[:take].sum())
+        allowance -= used
+        spent += used
+
+        # наблюдения при пересборе — как Batch.fold в app.refresh
+        checks[sel] += 1
+        changed[sel] += moved
+        observed[sel] += t - last[sel]
+        gained[sel] += np.maximum(true_stars[sel] - stored_stars[sel], 0)
+        stored_act[sel] = true_act[sel]
+        stored_stars[sel] = true_stars[sel]
+        last[sel] = t
+        if policy != "uniform" and len(sel):
+            # reschedule с mu последнего плана
+            if policy == "oracle":
+                a, s = act_true[sel], star_true[sel]
+            else:
+                a = activity_rate(checks[sel], changed[sel], observed[sel], idle0[sel] + t)
+                s = star_velocity(gained[sel], observed[sel], stars0[sel], age0[sel] + t)
+            rate[sel] = a + s
+            next_at[sel] = t + 1.0 / frequencies(rate[sel], w[sel], mu, min_interval, max_iv)
+
+        if t > warmup:
+            fresh = (stored_act == true_act) & (stored_stars == true_stars)
+            fresh_sum += fresh.mean()
+            wfresh_sum += np.average(fresh, weights=w)
+            measured += 1
+            spent_measured += used
+
+    measured_days = max(measured * dt, 1e-9)
+    return {
+        "policy": policy,
+        "budget": requests_per_day,
+        "requests_per_day": round(spent_measured / measured_days, 1),
+        "freshness": round(fresh_sum / max(measured, 1), 4),
+        "weighted_freshness": round(wfresh_sum / max(measured, 1), 4),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Симуляция адаптивного пересбора против равномерного на синтетике")
+    ap.add_argument("--projects", type=int, default=100_000)
+    ap.add_argument("--days", type=int, default=60, help="Длина симуляции, дней")
+    ap.add_argument("--warmup", type=int, default=14, help="Первые дни не считаются (оценки скоростей ещё пустые)")
+    ap.add_argument("--steps-per-day", type=int, default=4)
+    ap.add_argument("--budgets", type=str, default="0.01,0.02,0.05,0.1",
+                    help="Бюджеты запросов в день: доли числа проектов (<1) или абсолютные значения")
+    ap.add_argument("--policies", type=str, default="uniform,adaptive,oracle")
+    ap.add_argument("--noise", type=float, default=1.0, help="Логнормальный шум скрытых скоростей вокруг априорных")
+    ap.add_argument("--min-interval-hours", type=float, default=6.0)
+    ap.add_argument("--max-interval-days", type=float, default=90.0)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", type=str, default=None, help="Куда сохранить результаты")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    data = load(args.projects, args.seed, args.noise)
+    rate = data[3] + data[4]
+    print(f"Проектов: {args.projects}, медианная скорость изменений {np.median(rate):.4f}/день, "
+          f"90-й перцентиль {np.percentile(rate, 90):.3f}/день; синтетика за {time.perf_counter() - t0:.1f}s")
+
+    budgets = [float(b) for b in args.budgets.split(",") if b.strip()]
+    budgets = [b * args.projects if b < 1 else b for b in budgets]
+    policies = [p.strip() for p in args.policies.split(",") if p.strip()]
+    results = []
+    print(f"{'политика':<10} {'бюджет/день':>12} {'запросов/день':>14} {'свежесть':>9} {'взвеш.':>8} {'время':>7}")
+    for budget in budgets:
+        for policy in policies:
+            t1 = time.perf_counter()
+            res = simulate(policy, data, budget, args.days, args.steps_per_day, args.warmup,
+                           args.min_interval_hours / 24, args.max_interval_days, args.seed)
+            res["seconds"] = round(time.perf_counter() - t1, 1)
+            results.append(res)
+            print(f"{policy:<10} {budget:>12.0f} {res['requests_per_day']:>14.0f} {res['freshness']:>9.4f} "
+                  f"{res['weighted_freshness']:>8.4f} {res['seconds']:>6.1f}s", flush=True)
+
+    # сколько запросов нужно равномерному обходу для той же свежести, что у адаптивного
+    uni = sorted((r["requests_per_day"], r["weighted_freshness"]) for r in results if r["policy"] == "uniform")
+    if len(uni) >= 2 and "adaptive" in policies:
+        print("\nРавномерному обходу для той же взвешенной свежести нужно:")
+        for r in results:
+            if r["policy"] != "adaptive":
+                continue
+            x, y = zip(*uni)
+            if y[0] <= r["weighted_freshness"] <= y[-1]:
+                need = float(np.interp(r["weighted_freshness"], y, x))
+                print(f"  {r['weighted_freshness']:.4f}: {need:.0f} запросов/день вместо {r['requests_per_day']:.0f} "
+                      f"(x{need / max(r['requests_per_day'], 1):.1f})")
+            else:
+                print(f"  {r['weighted_freshness']:.4f}: больше {x[-1]:.0f} запросов/день (вне проверенных бюджетов)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"projects": args.projects, "days": args.days, "warmup": args.warmup,
+                       "steps_per_day": args.steps_per_day, "noise": args.noise, "results": results}, f, indent=2)
+        print(f"Результаты: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Recall@k и задержка индекса похожих проектов (app.similar) против полного перебора.
+
+Берётся случайная выборка проектов из индекса; для каждого считается точный топ-k перебором
+и ответ LSH. Recall учитывает ничьи: найденный проект засчитывается, если его косинус не ниже
+k-го точного (проектов «100% Python» сотни тысяч, и любой из них — верный ответ).
+
+    python -m app similar-index --snapshot /app/cache/bench_data/synthetic-1000000 --out /tmp/similar
+    python -m bench.similar --index /tmp/similar --queries 500 --k 20 --probes 0,2,4,8
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.similar import SimilarIndex
+
+
+def recall(found: list, exact: list, eps: float = 1e-5) -> float:
+    if not exact:
+        return 1.0
+    kth = exact[-1][1]
+    return min(sum(score >= kth - eps for _, score in found), len(exact)) / len(exact)
+
+
+def measure(index: SimilarIndex, pids: np.ndarray, k: int, probes: int, max_bucket: int, truth: dict) -> dict:
+    rec, lat = [], []
+    for pid in pids:
+        t0 = time.perf_counter()
+        found = index.query(int(pid), k, probes, max_bucket)
+        lat.append(time.perf_counter() - t0)
+        rec.append(recall(found, truth[int(pid)]))
+    lat = np.array(lat) * 1000
+    return {
+        "probes": probes,
+        "recall": round(float(np.mean(rec)), 4),
+        "recall_p10": round(float(np.percentile(rec, 10)), 4),
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p99_ms": round(float(np.percentile(lat, 99)), 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Recall@k и задержка LSH-индекса похожих проектов против перебора")
+    ap.add_argument("--index", type=str, default=None, help="Каталог индекса (по умолчанию SIMILAR_INDEX_DIR)")
+    ap.add_argument("--queries", type=int, default=300, help="Размер выборки запросов")
+    ap.add_argument("--k", type=int, default=20)
+    ap.add_argument("--probes", type=str, default="0,2,4,8", help="Список значений probes через запятую")
+    ap.add_argument("--max-bucket", type=int, default=2000, help="Максимум кандидатов из одного бакета")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", type=str, default=None, help="Куда сохранить результаты")
+    args = ap.parse_args()
+
+    index = SimilarIndex(args.index)
+    rng = np.random.default_rng(args.seed)
+    pids = rng.choice(np.asarray(index.project_ids), size=min(args.queries, len(index)), replace=False)
+    print(f"Индекс: {len(index)} проектов, {index.tables} таблиц x {index.bits} бит; запросов: {len(pids)}, k={args.k}")
+
+    t0 = time.perf_counter()
+    truth = {int(pid): index.exact(int(pid), args.k) for pid in pids}
+    brute_ms = (time.perf_counter() - t0) * 1000 / max(len(pids), 1)
+    print(f"Перебор: {brute_ms:.1f} ms на запрос")
+
+    results = []
+    for probes in [int(x) for x in args.probes.split(",") if x.strip()]:
+        res = measure(index, pids, args.k, probes, args.max_bucket, truth)
+        res["speedup"] = round(brute_ms / max(res["p50_ms"], 1e-6), 1)
+        results.append(res)
+        print(f"  probes={probes:<3} recall@{args.k}={res['recall']:.3f} (p10 {res['recall_p10']:.2f})  "
+              f"p50={res['p50_ms']:.2f} ms  p99={res['p99_ms']:.2f} ms  x{res['speedup']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"index": index.meta | {"languages": len(index.names)}, "queries": len(pids), "k": args.k,
+                       "brute_ms": round(brute_ms, 2), "results": results}, f, indent=2)
+        print(f"Результаты: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
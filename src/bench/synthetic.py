@@ -0,0 +1,249 @@
+"""
+Детерминированный генератор синтетических проектов для нагрузочных прогонов аналитики.
+
+Распределения близки к реальным данным: популярность языков по Zipf, 1–5 языков на проект
+(основной язык с наибольшей долей), тяжёлые хвосты звёзд/форков/issues, created_at в 2012–2025
+и last_activity_at с экспоненциальным «хвостом» после создания.
+
+Генерация идёт фиксированными кусками по CHUNK проектов, у каждого куска свой seed,
+поэтому первые 100k проектов набора на 1M совпадают с набором на 100k.
+
+    python -m bench.synthetic --projects 1000000 --target snapshot --out /app/cache/bench_data/synthetic-1000000
+    MONGO_DB=gitlab_stats_bench python -m bench.synthetic --projects 1000000 --target mongo --drop
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from bench.mock_gitlab import LANGUAGES
+
+CHUNK = 100_000
+MAX_LANGS = 5
+START = np.datetime64("2012-01-01T00:00:00", "ms")
+END = np.datetime64("2025-06-01T00:00:00", "ms")
+DAY_MS = 86_400_000
+DATA_DIR = "/app/cache/bench_data"  # не SNAPSHOT_DIR: иначе latest_snapshot() подхватит синтетику
+
+
+@dataclass
+class SyntheticChunk:
+    project_id: np.ndarray        # int64
+    star_count: np.ndarray        # int64
+    forks_count: np.ndarray       # int64
+    open_issues_count: np.ndarray # int64
+    created_at: np.ndarray        # datetime64[ms]
+    last_activity_at: np.ndarray  # datetime64[ms]
+    lang_count: np.ndarray        # int16
+    lang_idx: np.ndarray          # int16, индекс в LANGUAGES, плоский (lang_count строк на проект)
+    lang_pct: np.ndarray          # float32
+
+    def __len__(self) -> int:
+        return len(self.project_id)
+
+
+def _chunk(start: int, n: int, seed: int, zipf_s: float) -> SyntheticChunk:
+    rng = np.random.default_rng([seed, start // CHUNK])
+    L = len(LANGUAGES)
+
+    pid = np.arange(start + 1, start + n + 1, dtype=np.int64)
+    stars = np.minimum(np.floor(rng.pareto(1.1, n)), 500_000).astype(np.int64)
+    forks = np.floor(stars * rng.uniform(0.05, 0.6, n) + rng.pareto(2.0, n)).astype(np.int64)
+    issues = np.minimum(np.floor(rng.pareto(1.6, n)), 50_000).astype(np.int64)
+
+    span = int((END - START) / np.timedelta64(1, "ms"))
+    created = START + rng.integers(0, span, n).astype("timedelta64[ms]")
+    idle = (rng.exponential(400 * DAY_MS, n)).astype(np.int64).astype("timedelta64[ms]")
+    last = np.minimum(created + idle, END)
+
+    # 1–5 различных языков: top-k по Гумбелю = выборка без возвращения с весами Zipf
+    k = np.minimum(rng.geometric(0.45, n), MAX_LANGS)
+    log_w = -zipf_s * np.log(np.arange(1, L + 1))
+    keys = log_w + rng.gumbel(size=(n, L))
+    top = np.argpartition(-keys, MAX_LANGS - 1, axis=1)[:, :MAX_LANGS]
+    top = np.take_along_axis(top, np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1), axis=1)
+
+    shares = rng.random((n, MAX_LANGS)) ** 2
+    slot = np.arange(MAX_LANGS)
+    shares[slot >= k[:, None]] = 0.0
+    shares = -np.sort(-shares, axis=1)
+    shares = np.round(100 * shares / shares.sum(axis=1, keepdims=True), 2)
+
+    used = slot < k[:, None]
+    return SyntheticChunk(
+        project_id=pid,
+        star_count=stars,
+        forks_count=forks,
+        open_issues_count=issues,
+        created_at=created,
+        last_activity_at=last,
+        lang_count=k.astype(np.int16),
+        lang_idx=top[used].astype(np.int16),
+        lang_pct=shares[used].astype(np.float32),
+    )
+
+
+def generate(n: int, seed: int = 42, zipf_s: float = 1.1) -> Iterator[SyntheticChunk]:
+    for start in range(0, n, CHUNK):
+        yield _chunk(start, min(CHUNK, n - start), seed, zipf_s)
+
+
+# ---------- запись ----------
+
+def write_snapshot(out: str | Path, n: int, seed: int = 42, zipf_s: float = 1.1, rows_per_part: int = 250_000) -> Path:
+    """Каталог в формате app.snapshot (читается scripts --source snapshot --snapshot <out>)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from app.snapshot import LANGUAGES_SCHEMA, PROJECTS_SCHEMA
+
+    out = Path(out)
+    tmp = out.with_name(f".tmp-{out.name}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    (tmp / "projects").mkdir(parents=True)
+    (tmp / "languages").mkdir(parents=True)
+
+    names = pa.array(LANGUAGES, pa.string())
+    lang_type = LANGUAGES_SCHEMA.field("language").type
+    part = rows = lang_rows = 0
+    pending: list[SyntheticChunk] = []
+
+    def flush():
+        nonlocal part, rows, lang_rows
+        if not pending:
+            return
+        cols = {f: np.concatenate([getattr(c, f) for c in pending]) for f in SyntheticChunk.__dataclass_fields__}
+        projects = pa.Table.from_arrays([
+            pa.array(cols["project_id"]),
+            pa.array(cols["star_count"]),
+            pa.array(cols["forks_count"]),
+            pa.array(cols["open_issues_count"]),
+            pa.array(cols["created_at"]).cast(PROJECTS_SCHEMA.field("created_at").type),
+            pa.array(cols["last_activity_at"]).cast(PROJECTS_SCHEMA.field("last_activity_at").type),
+            pa.array(cols["lang_count"]),
+        ], schema=PROJECTS_SCHEMA)
+        languages = pa.Table.from_arrays([
+            pa.array(np.repeat(cols["project_id"], cols["lang_count"])),
+            pa.DictionaryArray.from_arrays(pa.array(cols["lang_idx"]), names).cast(lang_type),
+            pa.array(cols["lang_idx"].astype(np.uint16)),
+            pa.array(cols["lang_pct"]),
+        ], schema=LANGUAGES_SCHEMA)
+        name = f"part-{part:05d}.parquet"
+        pq.write_table(projects, tmp / "projects" / name, compression="zstd")
+        pq.write_table(languages, tmp / "languages" / name, compression="zstd")
+        rows += projects.num_rows
+        lang_rows += languages.num_rows
+        part += 1
+        pending.clear()
+
+    for chunk in generate(n, seed, zipf_s):
+        pending.append(chunk)
+        if sum(len(c) for c in pending) >= rows_per_part:
+            flush()
+    flush()
+
+    with open(tmp / "vocab.json", "w") as f:
+        json.dump({name: i for i, name in enumerate(LANGUAGES)}, f)
+    with open(tmp / "meta.json", "w") as f:
+        json.dump({
+            "created_at": time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()),
+            "projects": rows, "languages": lang_rows, "parts": part,
+            "source": {"synthetic": {"projects": n, "seed": seed, "zipf_s": zipf_s}},
+        }, f, indent=2)
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return out
+
+
+def _iso(values: np.ndarray) -> list[str]:
+    # тот же формат, что отдаёт GitLab API и пишет fetch
+    return [s + "Z" for s in np.datetime_as_string(values, unit="ms").tolist()]
+
+
+def write_mongo(n: int, seed: int = 42, zipf_s: float = 1.1, batch: int = 10_000, drop: bool = False) -> int:
+    """Пишет документы в SETTINGS.mongo_db/projects (вместе с lang_ids/lang_pct из словаря языков)."""
+    from app.config import SETTINGS
+    from app.db import backfill_language_ids, ensure_indexes, get_db, ingest_collection, language_ids
+
+    db = get_db()
+    coll = db[SETTINGS.mongo_coll_projects]
+    if drop:
+        coll.drop()
+    elif coll.estimated_document_count():
+        raise SystemExit(f"{SETTINGS.mongo_db}.{coll.name} is not empty; use --drop or another MONGO_DB")
+    ensure_indexes()
+    # индекс генератора -> постоянный id словаря (обычно совпадают на пустой базе)
+    to_vocab = np.asarray(language_ids(LANGUAGES), dtype=np.int64)
+    target = ingest_collection()
+
+    written = 0
+    for chunk in generate(n, seed, zipf_s):
+        created, last = _iso(chunk.created_at), _iso(chunk.last_activity_at)
+        offsets = np.zeros(len(chunk) + 1, dtype=np.int64)
+        np.cumsum(chunk.lang_count, out=offsets[1:])
+        idx = chunk.lang_idx.tolist()
+        pct = [round(p, 2) for p in chunk.lang_pct.tolist()]
+        vid = to_vocab[chunk.lang_idx].tolist()
+        pids, stars, forks, issues = (a.tolist() for a in (chunk.project_id, chunk.star_count, chunk.forks_count, chunk.open_issues_count))
+
+        docs = []
+        for i, pid in enumerate(pids):
+            lo, hi = offsets[i], offsets[i + 1]
+            docs.append({
+                "project_id": pid,
+                "name": f"project-{pid}",
+                "path_with_namespace": f"group-{pid % 9973}/project-{pid}",
+                "web_url": f"https://gitlab.example/group-{pid % 9973}/project-{pid}",
+                "star_count": stars[i],
+                "forks_count": forks[i],
+                "open_issues_count": issues[i],
+                "visibility": "public",
+                "created_at": created[i],
+                "last_activity_at": last[i],
+                "languages": {LANGUAGES[j]: p for j, p in zip(idx[lo:hi], pct[lo:hi])},
+                "lang_ids": vid[lo:hi],
+                "lang_pct": pct[lo:hi],
+            })
+            if len(docs) >= batch:
+                target.insert_many(docs, ordered=False)
+                written += len(docs)
+                docs = []
+        if docs:
+            target.insert_many(docs, ordered=False)
+            written += len(docs)
+        print(f"  mongo: {written}/{n}", flush=True)
+
+    # все документы уже с lang_ids — помечаем словарь как полный
+    backfill_language_ids()
+    return written
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Синтетический набор проектов для бенчмарков аналитики")
+    ap.add_argument("--projects", type=int, default=100_000, help="Сколько проектов сгенерировать")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--zipf", type=float, default=1.1, help="Показатель Zipf популярности языков")
+    ap.add_argument("--target", choices=["snapshot", "mongo", "both"], default="snapshot")
+    ap.add_argument("--out", type=str, default=None, help=f"Каталог снапшота (по умолчанию {DATA_DIR}/synthetic-<N>)")
+    ap.add_argument("--drop", action="store_true", help="Очистить коллекцию projects перед записью в Mongo")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    if args.target in ("snapshot", "both"):
+        out = args.out or os.path.join(DATA_DIR, f"synthetic-{args.projects}")
+        path = write_snapshot(out, args.projects, args.seed, args.zipf)
+        print(f"snapshot: {path} ({time.perf_counter() - t0:.1f}s)")
+    if args.target in ("mongo", "both"):
+        n = write_mongo(args.projects, args.seed, args.zipf, drop=args.drop)
+        print(f"mongo: {n} projects ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Проверка распределённого сбора (app.workqueue) на одной машине против mock GitLab (bench.mock_gitlab).
+
+Сценарии:
+    crawl  — несколько воркеров (потоки, у каждого свой event loop и клиент) проходят общую очередь,
+             а «мёртвый» воркер захватывает единицу и пропадает: его аренда истекает, единицу проходит
+             другой. Каждый проект диапазона очереди должен быть записан ровно один раз;
+    fail   — API недоступен: единица возвращается в очередь и после WORK_MAX_ATTEMPTS захватов — failed;
+    steal  — аренду перехватывают посреди прохода: воркер бросает единицу на ближайшем heartbeat.
+
+Любое нарушение — ненулевой код выхода. Пишет в настроенную MongoDB (коллекции projects и
+work_units должны быть пустыми, см. --drop) или, с --mongomock, в память процесса.
+
+    MONGO_DB=gitlab_stats_bench_wq python -m bench.workqueue --workers 3 --kind pages --drop
+    python -m bench.workqueue --mongomock --kind ids --projects 3000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from bench.mock_gitlab import MockGitLab
+
+PER_PAGE = 100  # страница /projects у fetch_unit
+
+
+def setup(args):
+    """Окружение до импорта app: SETTINGS читаются из env один раз."""
+    os.environ.update(
+        GITLAB_BASE_URL=f"http://127.0.0.1:{args.port}/api/v4",
+        METRICS_MODE=args.mode,
+        CONCURRENCY=str(args.concurrency),
+        RETRIES="1",
+        WORK_LEASE_SECONDS=str(args.lease),
+        WORK_HEARTBEAT_SECONDS=str(args.lease / 5),
+        WORK_MAX_ATTEMPTS=str(args.max_attempts),
+        METRICS_PORT="0",
+    )
+    from app import db
+    from app.config import SETTINGS
+    if args.mongomock:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("--mongomock: pip install mongomock")
+        db._db = mongomock.MongoClient()[SETTINGS.mongo_db]
+    database = db.get_db()
+    for name in (SETTINGS.mongo_coll_projects, SETTINGS.mongo_coll_work_units):
+        if args.drop:
+            database[name].drop()
+        elif database[name].estimated_document_count():
+            raise SystemExit(f"{SETTINGS.mongo_db}.{name} is not empty; use --drop or another MONGO_DB")
+    return database
+
+
+def count_writes():
+    """project_id -> сколько раз проект ушёл в upsert_projects из fetch_unit."""
+    from app import gitlab_client_async
+    writes: Counter = Counter()
+    lock = threading.Lock()
+    upsert = gitlab_client_async.upsert_projects
+
+    def counting(docs):
+        docs = list(docs)
+        with lock:
+            writes.update(d.get("project_id", d.get("id")) for d in docs)
+        return upsert(docs)
+
+    gitlab_client_async.upsert_projects = counting
+    return writes
+
+
+def check(name: str, ok: bool, detail: str = "") -> bool:
+    print(f"  [{'ok' if ok else 'FAIL'}] {name}{': ' + detail if detail else ''}", flush=True)
+    return ok
+
+
+def scenario_crawl(args, server: MockGitLab, database) -> bool:
+    from app.config import SETTINGS
+    from app.workqueue import DONE, WorkQueue, coordinate, work
+
+    print(f"crawl: {args.workers} workers + 1 dead, kind={args.kind}", flush=True)
+    writes = count_writes()
+    queue = WorkQueue()
+    if args.kind == "pages":
+        pages = -(-args.limit // PER_PAGE)
+        span = (1, pages + 1, args.unit_size)
+        expected = set(server.factory.by_stars[: pages * PER_PAGE])
+    else:
+        span = (1, args.projects + 1, args.unit_size * PER_PAGE)
+        expected = set(range(1, args.projects + 1))
+    seeded = queue.seed(args.kind, *span)
+    reseeded = queue.seed(args.kind, *span)
+    dead = queue.claim("dead:1")
+
+    outcomes = {}
+
+    def run(name):
+        outcomes[name] = asyncio.run(work(WorkQueue(), name, poll=args.lease / 5))
+
+    threads = [threading.Thread(target=run, args=(f"bench:{i}",)) for i in range(args.workers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    coordinate(queue, interval=args.interval)
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    units = database[SETTINGS.mongo_coll_work_units]
+    summary = queue.summary()
+    dead_unit = units.find_one({"_id": dead["_id"]})
+    missed = expected - set(writes)
+    twice = {pid: n for pid, n in writes.items() if n > 1}
+    stored = database[SETTINGS.mongo_coll_projects].count_documents({})
+    print(f"  {len(writes)} projects in {elapsed:.1f}s, workers: {outcomes}", flush=True)
+    return all([
+        check("units seeded once", reseeded == 0, f"{seeded} units"),
+        check("all units done", set(summary) == {DONE}, str({k: int(v["units"]) for k, v in summary.items()})),
+        check("dead worker's unit re-leased", dead_unit["status"] == DONE and dead_unit["owner"] != "dead:1"
+              and dead_unit["attempts"] == 2, f"{dead_unit['_id']} owner={dead_unit['owner']} attempts={dead_unit['attempts']}"),
+        check("no project missed", not missed, f"{len(missed)} missed" if missed else f"{len(expected)} expected"),
+        check("no project written twice", not twice, str(dict(list(twice.items())[:5])) if twice else ""),
+        check("projects stored", stored == len(expected), f"{stored} documents"),
+    ])
+
+
+def scenario_fail(args) -> bool:
+    from app.config import SETTINGS
+    from app.workqueue import FAILED, WorkQueue, work
+
+    print(f"fail: API unreachable, WORK_MAX_ATTEMPTS={args.max_attempts}", flush=True)
+    queue = WorkQueue()
+    queue.reset()
+    queue.seed("pages", 1, 2, 1)
+    # порт без сервера: каждая попытка — ошибка соединения
+    base = SETTINGS.gitlab_base_url
+    object.__setattr__(SETTINGS, "gitlab_base_url", f"http://127.0.0.1:{args.port + 1}/api/v4")
+    try:
+        outcomes = asyncio.run(work(WorkQueue(), "bench:fail", poll=0.1))
+    finally:
+        object.__setattr__(SETTINGS, "gitlab_base_url", base)
+    unit = queue.coll.find_one({})
+    return all([
+        check("unit failed after max attempts", unit["status"] == FAILED and unit["attempts"] == args.max_attempts,
+              f"status={unit['status']} attempts={unit['attempts']} outcomes={outcomes}"),
+        check("error recorded", bool(unit.get("error")), (unit.get("error") or "")[:60]),
+    ])
+
+
+def scenario_steal(args) -> bool:
+    from app.workqueue import LEASED, WorkQueue, work
+
+    print("steal: lease taken over mid-unit", flush=True)
+    queue = WorkQueue()
+    queue.reset()
+    pages = -(-args.projects // PER_PAGE)
+    queue.seed("pages", 1, pages + 1, pages)  # одна длинная единица: успеть перехватить до конца
+
+    def steal():
+        while queue.coll.find_one({"status": LEASED}) is None:
+            time.sleep(0.01)
+        queue.coll.update_one({"status": LEASED}, {"$set": {"lease": "stolen"}})
+
+    thief = threading.Thread(target=steal)
+    thief.start()
+    outcomes = asyncio.run(work(WorkQueue(), "bench:victim", poll=0.1, max_units=1))
+    thief.join()
+    unit = queue.coll.find_one({})
+    return all([
+        check("worker abandoned the unit", outcomes == {"lost": 1}, str(outcomes)),
+        check("unit left to the new lease holder", unit["status"] == LEASED and unit["lease"] == "stolen",
+              f"status={unit['status']}"),
+    ])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Проверка очереди app worker: аренды, перехват, отказы (mock GitLab)")
+    ap.add_argument("--scenarios", type=str, default="crawl,fail,steal")
+    ap.add_argument("--kind", choices=["pages", "ids"], default="pages")
+    ap.add_argument("--projects", type=int, default=5000, help="Проектов в mock GitLab")
+    ap.add_argument("--limit", type=int, default=2000, help="kind=pages: сколько самых звёздных проектов собрать")
+    ap.add_argument("--unit-size", type=int, default=2, help="Страниц по 100 проектов на единицу")
+    ap.add_argument("--workers", type=int, default=3)
+    ap.add_argument("--mode", choices=["full", "fast"], default="fast", help="METRICS_MODE воркеров")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--latency", type=str, default="fixed:5", help="Задержка mock GitLab (см. bench.mock_gitlab)")
+    ap.add_argument("--lease", type=float, default=5.0,
+                    help="WORK_LEASE_SECONDS; heartbeat — 1/5 аренды. Аренда короче записи страницы в Mongo даёт повторы")
+    ap.add_argument("--max-attempts", type=int, default=3, help="WORK_MAX_ATTEMPTS")
+    ap.add_argument("--interval", type=float, default=1.0, help="Период отчёта координатора, секунды")
+    ap.add_argument("--port", type=int, default=8097)
+    ap.add_argument("--mongomock", action="store_true", help="Очередь и проекты в памяти (пакет mongomock) вместо MongoDB")
+    ap.add_argument("--drop", action="store_true", help="Очистить projects и work_units перед прогоном")
+    args = ap.parse_args()
+
+    import logging
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    database = setup(args)
+    server = MockGitLab(projects=args.projects, latency=args.latency, port=args.port).start_in_thread()
+
+    scenarios = {
+        "crawl": lambda: scenario_crawl(args, server, database),
+        "fail": lambda: scenario_fail(args),
+        "steal": lambda: scenario_steal(args),
+    }
+    results = {name: scenarios[name.strip()]() for name in args.scenarios.split(",") if name.strip()}
+    print("Итог: " + ", ".join(f"{k} {'ok' if v else 'FAIL'}" for k, v in results.items()))
+    sys.exit(0 if all(results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Бэктест прогнозов популярности языков (rolling origin).
+
+Для каждой точки отсчёта t модель видит только месяцы [0, t) и прогнозирует t .. t + horizon - 1;
+ошибки усредняются по точкам отсчёта и горизонту. Метрики на язык:
+    MAPE — средняя |ошибка| / факт, %, только по месяцам с фактом > 0;
+    MASE — средняя |ошибка| / средняя |y_t - y_{t-1}| на обучающей части (наивный прогноз = 1).
+
+Каждая конфигурация (семейство модели + параметры) считает сразу все языки и все точки
+отсчёта матрично: окна для OLS / затухающего тренда — sliding_window_view, состояния
+сглаживания Холта — один проход по месяцам. Сетка конфигураций раздаётся пулу процессов.
+Лучшая конфигурация на язык (по MASE) сохраняется в JSON и подхватывается графиками прогноза.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import product
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import json
+import multiprocessing
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from scripts.common.plot_forcast import (
+    batch_holt_forecast, batch_linear_forecast, batch_rolling_forecast, holt_project, holt_states,
+)
+from scripts.common.profiling import phase
+
+MODELS_FILE = "/app/cache/forecast_models.json"
+
+# семейство -> сетка параметров
+GRID: Dict[str, Dict[str, Sequence]] = {
+    "rolling_ols": {"window_size": (4, 6, 8, 12)},
+    "damped": {"window": (3, 6, 12), "damping": (0.3, 0.6, 0.9)},
+    "linear": {"window": (3, 6, 12), "damping": (1.0,)},
+    "ses": {"alpha": (0.2, 0.4, 0.6, 0.8, 1.0)},
+    "holt": {"alpha": (0.2, 0.5, 0.8), "beta": (0.1, 0.3), "phi": (0.8, 0.9, 0.98)},
+}
+DEFAULT_MODEL = ("rolling_ols", {"window_size": 8})  # то, что графики делали до бэктеста
+
+
+def configs(families: Optional[Sequence[str]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    out = []
+    for family in families or GRID:
+        grid = GRID[family]
+        for values in product(*grid.values()):
+            out.append((family, dict(zip(grid, values))))
+    return out
+
+
+def label(family: str, params: Dict[str, Any]) -> str:
+    return family + "(" + ", ".join(f"{k}={v}" for k, v in params.items()) + ")"
+
+
+def min_history(family: str, params: Dict[str, Any]) -> int:
+    return max(params.get("window_size", 0), params.get("window", 0), 2)
+
+
+def forecast(family: str, params: Dict[str, Any], Y: np.ndarray, steps: int) -> np.ndarray:
+    """Прогноз одной конфигурации для всех строк Y (языки × месяцы)."""
+    if family == "rolling_ols":
+        return batch_rolling_forecast(Y, steps, **params)
+    if family in ("damped", "linear"):
+        return batch_linear_forecast(Y, steps, **params)
+    if family == "ses":
+        return batch_holt_forecast(Y, steps, alpha=params["alpha"], trend=False)
+    if family == "holt":
+        return batch_holt_forecast(Y, steps, **params)
+    raise ValueError(f"Unknown model family: {family}")
+
+
+def origin_forecasts(family: str, params: Dict[str, Any], Y: np.ndarray, origins: np.ndarray, horizon: int) -> np.ndarray:
+    """Прогнозы из всех точек отсчёта сразу: (языки × точки × горизонт)."""
+    L, O = len(Y), len(origins)
+    if family in ("ses", "holt"):
+        trend = family == "holt"
+        phi = params.get("phi", 1.0)
+        level, slope = holt_states(Y, params["alpha"], params.get("beta", 0.0), phi, trend)
+        # состояние после месяца t - 1 — всё, что модель знает в точке отсчёта t
+        return holt_project(level[:, origins - 1], slope[:, origins - 1], horizon, phi)
+    w = params.get("window_size", params.get("window"))
+    windows = sliding_window_view(Y, w, axis=1)[:, origins - w]  # (L, O, w)
+    return forecast(family, params, windows.reshape(L * O, w), horizon).reshape(L, O, horizon)
+
+
+def evaluate(family: str, params: Dict[str, Any], Y: np.ndarray, origins: np.ndarray, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(MAPE, MASE) на язык для одной конфигурации."""
+    pred = origin_forecasts(family, params, Y, origins, horizon)
+    idx = origins[:, None] + np.arange(horizon)
+    actual = Y[:, idx]                                       # (L, O, h)
+    err = np.abs(pred - actual)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ape = np.where(actual > 0, err / actual, np.nan)
+        mape = 100 * np.nanmean(ape.reshape(len(Y), -1), axis=1)
+        # масштаб MASE: средний модуль месячного приращения на обучающей части — через префиксные суммы
+        cum = np.concatenate([np.zeros((len(Y), 1)), np.cumsum(np.abs(np.diff(Y, axis=1)), axis=1)], axis=1)
+        scale = cum[:, origins - 1] / np.maximum(origins - 1, 1)
+        mase = np.nanmean(np.where(scale[:, :, None] > 0, err / scale[:, :, None], np.nan).reshape(len(Y), -1), axis=1)
+    return mape, mase
+
+
+# --- пул процессов: ряды передаются один раз через initializer, задачи — только конфигурации ---
+
+_STATE: Dict[str, Any] = {}
+
+
+def _init(Y: np.ndarray, origins: np.ndarray, horizon: int) -> None:
+    _STATE.update(Y=Y, origins=origins, horizon=horizon)
+
+
+def _evaluate_config(cfg: Tuple[str, Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    family, params = cfg
+    return evaluate(family, params, _STATE["Y"], _STATE["origins"], _STATE["horizon"])
+
+
+def run_backtest(Y: np.ndarray, horizon: int = 6, n_origins: int = 12, families: Optional[Sequence[str]] = None,
+                 workers: int = 1) -> Dict[str, Any]:
+    """
+    Сетка конфигурация × язык × точка отсчёта. Возвращает configs, origins и массивы
+    mape/mase формы (конфигурации × языки).
+    """
+    Y = np.asarray(Y, dtype=float)
+    cfgs = configs(families)
+    first = max(min_history(f, p) for f, p in cfgs) + 1
+    last = Y.shape[1] - horizon
+    origins = np.arange(max(first, last - n_origins + 1), last + 1)
+    if not len(origins):
+        raise ValueError(f"Series too short for backtest: {Y.shape[1]} months, need > {first + horizon - 1}")
+
+    with phase("backtest"):
+        if workers <= 1:
+            _init(Y, origins, horizon)
+            parts = [_evaluate_config(c) for c in cfgs]
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init,
+                                     initargs=(Y, origins, horizon)) as ex:
+                parts = list(ex.map(_evaluate_config, cfgs))
+    return {
+        "configs": cfgs,
+        "origins": origins,
+        "mape": np.stack([p[0] for p in parts]),
+        "mase": np.stack([p[1] for p in parts]),
+    }
+
+
+def best_models(names: Sequence[str], result: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Язык -> лучшая конфигурация по MASE (языки без оценки пропускаются)."""
+    mase, mape = result["mase"], result["mape"]
+    out = {}
+    for j, name in enumerate(names):
+        col = mase[:, j]
+        if np.isnan(col).all():
+            continue
+        i = int(np.nanargmin(col))
+        family, params = result["configs"][i]
+        out[name] = {"model": family, "params": params, "mase": round(float(col[i]), 4),
+                     "mape": None if np.isnan(mape[i, j]) else round(float(mape[i, j]), 2)}
+    return out
+
+
+def save_models(models: Dict[str, Dict[str, Any]], path: str, **meta) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc = {"created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), **meta, "languages": models}
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=1)
+    tmp.replace(path)
+    return path
+
+
+def load_models(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    if not path or not Path(path).exists():
+        return {}
+    with open(path) as f:
+        return json.load(f).get("languages", {})
+
+
+def model_forecaster(models: Dict[str, Dict[str, Any]]) -> Callable[[Sequence[str], np.ndarray, int], np.ndarray]:
+    """forecaster для графиков: строки группируются по выбранной конфигурации, каждая группа — одним вызовом."""
+
+    def run(names: Sequence[str], Y: np.ndarray, steps: int) -> np.ndarray:
+        Y = np.atleast_2d(np.asarray(Y, dtype=float))
+        out = np.empty((len(Y), steps))
+        groups: Dict[str, List[int]] = {}
+        chosen = {}
+        for i, name in enumerate(names):
+            m = models.get(name)
+            family, params = (m["model"], m["params"]) if m else DEFAULT_MODEL
+            if Y.shape[1] < min_history(family, params):
+                family, params = DEFAULT_MODEL
+            key = label(family, params)
+            groups.setdefault(key, []).append(i)
+            chosen[key] = (family, params)
+        for key, rows in groups.items():
+            family, params = chosen[key]
+            out[rows] = forecast(family, params, Y[rows], steps)
+        return out
+
+    return run
@@ -0,0 +1,205 @@
+"""
+Колоночное представление пачки проектов для быстрых сканов.
+
+Курсор отдаёт сырые BSON-батчи (find_raw_batches), они декодируются одним вызовом
+bson.decode_all (C-расширение), после чего из батча сразу строятся numpy-колонки.
+Языки разворачиваются в плоские массивы (lang_ids, lang_pct) со смещениями
+lang_offsets: языки i-го проекта — это срез [lang_offsets[i], lang_offsets[i + 1]).
+Если документы уже содержат lang_ids/lang_pct (словарь языков из app.db), строки
+названий вообще не декодируются.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+from bson import decode_all
+from bson.codec_options import CodecOptions
+
+METRIC_FIELDS = ("star_count", "forks_count", "open_issues_count")
+MISSING = -1  # метрики неотрицательные, -1 = поле отсутствует или невалидно
+
+_CODEC = CodecOptions(tz_aware=False)
+
+
+class LanguageVocab:
+    """
+    Язык -> маленький целый id. Обычно инициализируется сохранённым словарём
+    (app.db.load_language_vocab), новые языки получают локальные id после максимального.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for name in names:
+            self.intern(name)
+
+    @classmethod
+    def from_ids(cls, ids: Dict[str, int]) -> "LanguageVocab":
+        vocab = cls()
+        size = max(ids.values(), default=-1) + 1
+        # пропуски в нумерации (гонки при выделении id) — заглушки, у них никогда нет данных
+        vocab.names = [f"#{i}" for i in range(size)]
+        for name, idx in ids.items():
+            vocab.names[idx] = name
+        vocab.ids = dict(ids)
+        return vocab
+
+    def update(self, ids: Dict[str, int], size: int = 0) -> None:
+        """
+        Дописать id, выделенные после загрузки словаря (параллельный сбор, refresh, replay).
+        Занятые id не трогает; недостающие до size — заглушки, как в from_ids.
+        """
+        size = max(size, max(ids.values(), default=-1) + 1)
+        if size > len(self.names):
+            self.names.extend(f"#{i}" for i in range(len(self.names), size))
+        for name, idx in ids.items():
+            if name not in self.ids and self.ids.get(self.names[idx]) != idx:
+                self.names[idx] = name
+                self.ids[name] = idx
+
+    def intern(self, name: str) -> int:
+        idx = self.ids.get(name)
+        if idx is None:
+            idx = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return idx
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+@dataclass
+class ProjectBatch:
+    project_id: np.ndarray                     # int64
+    lang_offsets: np.ndarray                   # int64, длина n + 1
+    lang_ids: np.ndarray                       # uint16, id в словаре vocab
+    lang_pct: np.ndarray                       # float32, процент языка в проекте
+    vocab: LanguageVocab
+    metrics: Dict[str, np.ndarray] = field(default_factory=dict)  # имя поля -> int64 (MISSING если нет)
+
+    def __len__(self) -> int:
+        return len(self.project_id)
+
+    @property
+    def lang_counts(self) -> np.ndarray:
+        return np.diff(self.lang_offsets)
+
+    def per_language(self, values: np.ndarray) -> np.ndarray:
+        """Растягивает колонку проекта на его языки (выравнивание с lang_ids)."""
+        return np.repeat(values, self.lang_counts)
+
+    def slice(self, start: int, stop: int) -> "ProjectBatch":
+        lo, hi = self.lang_offsets[start], self.lang_offsets[min(stop, len(self))]
+        return ProjectBatch(
+            project_id=self.project_id[start:stop],
+            lang_offsets=self.lang_offsets[start:stop + 1] - lo,
+            lang_ids=self.lang_ids[lo:hi],
+            lang_pct=self.lang_pct[lo:hi],
+            vocab=self.vocab,
+            metrics={k: v[start:stop] for k, v in self.metrics.items()},
+        )
+
+    def to_csr(self, width: int):
+        """
+        Разреженная матрица проект×язык (значения — проценты) только для проектов с языками.
+        Языки с id >= width (появились после загрузки словаря) отбрасываются.
+        Возвращает (csr_matrix, маска строк батча, попавших в матрицу).
+        """
+        from scipy.sparse import csr_matrix
+
+        keep = self.lang_ids < width
+        row_of = np.repeat(np.arange(len(self)), self.lang_counts)
+        per_row = np.bincount(row_of[keep], minlength=len(self))
+        rows = per_row > 0
+        indptr = np.zeros(int(rows.sum()) + 1, dtype=np.int64)
+        np.cumsum(per_row[rows], out=indptr[1:])
+        X = csr_matrix(
+            (self.lang_pct[keep].astype(np.float64), self.lang_ids[keep].astype(np.int32), indptr),
+            shape=(len(indptr) - 1, width),
+        )
+        return X, rows
+
+
+def _metric(v) -> int:
+    if type(v) is int:
+        return v if v >= 0 else MISSING
+    if isinstance(v, float) and v >= 0:
+        return int(v)
+    return MISSING
+
+
+def decode_batch(raw: bytes, metrics: Sequence[str], vocab: LanguageVocab) -> ProjectBatch:
+    docs = decode_all(raw, _CODEC)
+    n = len(docs)
+
+    project_id = np.fromiter((d.get("project_id") or MISSING for d in docs), dtype=np.int64, count=n)
+    cols = {
+        name: np.fromiter((_metric(d.get(name)) for d in docs), dtype=np.int64, count=n)
+        for name in metrics
+    }
+
+    counts = np.zeros(n, dtype=np.int64)
+    ids: List[int] = []
+    pct: List[float] = []
+    intern = vocab.intern
+    for i, d in enumerate(docs):
+        lang_ids = d.get("lang_ids")
+        if lang_ids is not None:
+            # закодированные языки: без строк и словарей Python
+            counts[i] = len(lang_ids)
+            ids.extend(lang_ids)
+            pct.extend(d.get("lang_pct") or [0.0] * len(lang_ids))
+            continue
+        langs = d.get("languages")
+        if not langs:
+            continue
+        counts[i] = len(langs)
+        for lang, share in langs.items():
+            ids.append(intern(lang))
+            pct.append(share or 0.0)
+
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return ProjectBatch(
+        project_id=project_id,
+        lang_offsets=offsets,
+        lang_ids=np.asarray(ids, dtype=np.uint16),
+        lang_pct=np.asarray(pct, dtype=np.float32),
+        vocab=vocab,
+        metrics=cols,
+    )
+
+
+def reduce_pairs(lang: np.ndarray, value: np.ndarray, count: np.ndarray):
+    """Сворачивает пары (язык, значение) с кратностями в уникальные, отсортированные по (язык, значение)."""
+    if len(lang) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty.astype(np.int32), empty, empty
+    order = np.lexsort((value, lang))
+    lang, value, count = lang[order], value[order], count[order]
+    new = np.ones(len(lang), dtype=bool)
+    new[1:] = (lang[1:] != lang[:-1]) | (value[1:] != value[:-1])
+    starts = np.flatnonzero(new)
+    return lang[starts], value[starts], np.add.reduceat(count, starts)
+
+
+def grouped_medians(lang: np.ndarray, value: np.ndarray, count: np.ndarray):
+    """
+    Точные медианы по группам из свёрнутой гистограммы (выход reduce_pairs).
+    Возвращает (id языков, медианы, число наблюдений) — как statistics.median для каждой группы.
+    """
+    if len(lang) == 0:
+        return lang, np.zeros(0), np.zeros(0, dtype=np.int64)
+    cum = np.cumsum(count)
+    new = np.ones(len(lang), dtype=bool)
+    new[1:] = lang[1:] != lang[:-1]
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], len(lang))
+    base = np.where(starts > 0, cum[starts - 1], 0)
+    n = cum[ends - 1] - base
+    # позиции средних элементов (0-based) внутри группы -> строка гистограммы через searchsorted
+    lo = np.searchsorted(cum, base + (n - 1) // 2, side="right")
+    hi = np.searchsorted(cum, base + n // 2, side="right")
+    medians = (value[lo] + value[hi]) / 2
+    return lang[starts], medians, n
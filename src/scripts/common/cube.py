@@ -0,0 +1,166 @@
+"""
+OLAP-куб язык × месяц × метрика (projects, stars, forks) для трендов.
+
+Хранятся только префиксные суммы по оси месяцев: cum[l, m, k] — сумма метрики k языка l
+за месяцы [0, m). Сумма любого окна [lo, hi] — одна разность cum[:, hi + 1] - cum[:, lo],
+так что итоги, доли и momentum по любому диапазону — O(1) на язык, без пересчёта ряда.
+Месяцы идут подряд без пропусков: месяц без проектов — просто нулевой шаг суммы.
+
+Куб сохраняется каталогом (cum.npy + meta.json) и открывается через np.load(mmap_mode="r").
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import json
+
+import numpy as np
+
+from scripts.common.mongo import language_month_counts
+from scripts.common.profiling import phase
+
+CUBE_METRICS = ("projects", "stars", "forks")
+CUBE_DIR = "/app/cache/language_cube"
+# поле строки language_month_counts для каждой метрики куба
+_ROW_FIELDS = {"projects": "count", "stars": "stars", "forks": "forks"}
+
+
+def month_range(start: np.datetime64, stop: np.datetime64) -> np.ndarray:
+    return np.arange(start, stop + 1, dtype="datetime64[M]")
+
+
+@dataclass
+class LanguageCube:
+    names: List[str]
+    start: np.datetime64        # первый месяц оси, datetime64[M]
+    cum: np.ndarray             # int64 (языки, месяцы + 1, метрики), cum[:, 0] = 0
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "LanguageCube":
+        """Строки language_month_counts -> куб; строки без месяца (нет last_activity_at) пропускаются."""
+        rows = [r for r in rows if r["_id"].get("month")]
+        if not rows:
+            return cls([], np.datetime64("1970-01", "M"), np.zeros((0, 1, len(CUBE_METRICS)), np.int64))
+        names = sorted({r["_id"]["language"] for r in rows})
+        lang = {name: i for i, name in enumerate(names)}
+        li = np.fromiter((lang[r["_id"]["language"]] for r in rows), np.int64, len(rows))
+        mi = np.array([r["_id"]["month"] for r in rows], dtype="datetime64[M]")
+        start = mi.min()
+        mi = (mi - start).astype(np.int64)
+        dense = np.zeros((len(names), int(mi.max()) + 1, len(CUBE_METRICS)), np.int64)
+        for k, metric in enumerate(CUBE_METRICS):
+            vals = np.fromiter((r.get(_ROW_FIELDS[metric]) or 0 for r in rows), np.int64, len(rows))
+            np.add.at(dense[:, :, k], (li, mi), vals)
+        return cls.from_dense(names, start, dense)
+
+    @classmethod
+    def from_dense(cls, names: Sequence[str], start: np.datetime64, dense: np.ndarray) -> "LanguageCube":
+        cum = np.zeros((dense.shape[0], dense.shape[1] + 1, dense.shape[2]), np.int64)
+        np.cumsum(dense, axis=1, out=cum[:, 1:])
+        return cls(list(names), np.datetime64(start, "M"), cum)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "LanguageCube":
+        path = Path(path)
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        if tuple(meta["metrics"]) != CUBE_METRICS:
+            raise ValueError(f"Cube {path} has metrics {meta['metrics']}, expected {CUBE_METRICS}")
+        return cls(meta["languages"], np.datetime64(meta["start"], "M"), np.load(path / "cum.npy", mmap_mode="r"))
+
+    def save(self, path: str | Path) -> Path:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "cum.npy", np.ascontiguousarray(self.cum))
+        meta = {"languages": self.names, "start": str(self.start), "months": self.n_months, "metrics": list(CUBE_METRICS)}
+        with open(path / "meta.json", "w") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return path
+
+    # --- ось месяцев ---
+
+    @property
+    def n_months(self) -> int:
+        return self.cum.shape[1] - 1
+
+    @property
+    def months(self) -> np.ndarray:
+        return month_range(self.start, self.start + self.n_months - 1)
+
+    def index(self, month: Optional[str], default: int) -> int:
+        """YYYY-MM -> индекс месяца (может выходить за ось куба); None -> default."""
+        if not month:
+            return default
+        return int((np.datetime64(month, "M") - self.start).astype(np.int64))
+
+    def span(self, since: Optional[str] = None, until: Optional[str] = None, months: Optional[int] = None) -> tuple[int, int]:
+        """
+        Диапазон [lo, hi] индексов: до until включительно, последние months месяцев или с since.
+        Обрезается до оси куба; диапазон целиком вне её — lo > hi.
+        """
+        hi = min(self.index(until, self.n_months - 1), self.n_months - 1)
+        lo = self.index(since, 0)
+        if months:
+            lo = max(lo, hi - months + 1)
+        return max(lo, 0), max(hi, -1)
+
+    # --- запросы O(1) на язык ---
+
+    def metric(self, name: str) -> int:
+        return CUBE_METRICS.index(name)
+
+    def window(self, lo: int, hi: int, metric: str = "projects") -> np.ndarray:
+        """Сумма метрики за месяцы [lo, hi] для всех языков."""
+        k = self.metric(metric)
+        if hi < lo:
+            return np.zeros(len(self.names), np.int64)
+        return self.cum[:, hi + 1, k] - self.cum[:, lo, k]
+
+    def total(self, lo: int, hi: int, metric: str = "projects") -> int:
+        """Сумма по всем языкам (проект с несколькими языками считается в каждом)."""
+        return int(self.window(lo, hi, metric).sum())
+
+    def share(self, lo: int, hi: int, metric: str = "projects") -> np.ndarray:
+        w = self.window(lo, hi, metric)
+        return w / max(int(w.sum()), 1)
+
+    def momentum(self, hi: int, span: int = 3, metric: str = "projects") -> np.ndarray:
+        """Последние span месяцев / предыдущие span (знаменатель не меньше 1)."""
+        recent = self.window(max(hi - span + 1, 0), hi, metric)
+        prev = self.window(max(hi - 2 * span + 1, 0), hi - span, metric)
+        return recent / np.maximum(prev, 1)
+
+    def series(self, lo: int, hi: int, metric: str = "projects", langs: Optional[np.ndarray] = None) -> np.ndarray:
+        """Помесячные значения (языки × месяцы) за [lo, hi] — разность соседних префиксных сумм."""
+        cum = self.cum[:, lo: hi + 2, self.metric(metric)]
+        if langs is not None:
+            cum = cum[langs]
+        return np.diff(cum, axis=1)
+
+    def top(self, lo: int, hi: int, n: int, metric: str = "projects") -> np.ndarray:
+        """Индексы n языков с наибольшей суммой за [lo, hi] (по убыванию, без нулевых)."""
+        w = self.window(lo, hi, metric)
+        order = np.argsort(-w, kind="stable")[:n]
+        return order[w[order] > 0]
+
+    def lang_index(self, names: Iterable[str]) -> np.ndarray:
+        pos = {name: i for i, name in enumerate(self.names)}
+        missing = [name for name in names if name not in pos]
+        if missing:
+            raise KeyError(f"Unknown languages: {', '.join(missing)}")
+        return np.array([pos[name] for name in names], dtype=np.int64)
+
+
+def build_cube() -> LanguageCube:
+    """Один $group по (язык, месяц) в Mongo (или проход по снапшоту) за всю историю -> куб."""
+    rows = language_month_counts()
+    with phase("accumulate"):
+        return LanguageCube.from_rows(rows)
+
+
+def load_or_build(path: Optional[str]) -> LanguageCube:
+    """Сохранённый куб (mmap), если указан каталог, иначе — свежий из текущего источника."""
+    if path:
+        with phase("fetch"):
+            return LanguageCube.load(path)
+    return build_cube()
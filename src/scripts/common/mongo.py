@@ -1,16 +1,66 @@
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
 from pymongo.collection import Collection
 from collections import Counter
-from pymongo import MongoClient
-from app.db import get_db
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial, reduce
+import multiprocessing
+import numpy as np
 from app.config import SETTINGS
-from app.db import get_db as _get_db  # берём готовое подключение с ретраями/индексами
+from app.db import get_analytics_db, language_ids_complete, load_language_vocab  # подключение с ретраями + read preference для аналитики
+from scripts.common.columnar import LanguageVocab, ProjectBatch, decode_batch, grouped_medians, reduce_pairs
+from scripts.common.profiling import PROFILE, phase
 
 BATCH_SIZE = 1000
+SAMPLES_PER_RANGE = 64  # сколько случайных project_id брать на один диапазон при разбиении
+FOLD_ROWS = 65536  # LanguageSignatures: сколько строк копить до дедупликации
+
+T = TypeVar("T")
+
+# откуда читают скрипты: живая MongoDB или колоночный снапшот (python -m app snapshot)
+_SOURCE: Dict[str, Any] = {"kind": "mongo", "snapshot": None}
+_snapshot_cache: Dict[str, Any] = {}
+
+
+def use_source(kind: str = "mongo", snapshot: Optional[str] = None) -> None:
+    if kind not in ("mongo", "snapshot"):
+        raise ValueError(f"Unknown source: {kind}")
+    if kind == "snapshot" and snapshot is None:
+        from app.snapshot import latest_snapshot
+        snapshot = str(latest_snapshot())
+    _SOURCE.update(kind=kind, snapshot=snapshot)
+
+
+def add_source_args(ap) -> None:
+    ap.add_argument("--source", choices=["mongo", "snapshot"], default=None,
+                    help="Откуда читать проекты: MongoDB (по умолчанию) или Parquet-снапшот (по умолчанию с --snapshot)")
+    ap.add_argument("--snapshot", type=str, default=None,
+                    help="Каталог снапшота (по умолчанию — последний в SNAPSHOT_DIR); сам по себе включает --source snapshot")
+
+
+def apply_source_args(args) -> None:
+    source = args.source or ("snapshot" if args.snapshot else "mongo")
+    if source == "mongo" and args.snapshot:
+        raise SystemExit("--snapshot противоречит --source mongo")
+    use_source(source, args.snapshot)
+    if source == "snapshot":
+        print(f"[source] snapshot: {_SOURCE['snapshot']}")
+
+
+def from_snapshot() -> bool:
+    return _SOURCE["kind"] == "snapshot"
+
+
+def snapshot():
+    path = _SOURCE["snapshot"]
+    if path not in _snapshot_cache:
+        from scripts.common.snapshot import Snapshot  # pyarrow нужен только в этом режиме
+        _snapshot_cache[path] = Snapshot(path)
+    return _snapshot_cache[path]
 
 
 def get_db():
-    return _get_db()
+    return get_analytics_db()
 
 
 def projects_coll() -> Collection:
@@ -22,82 +72,238 @@ def lang_dist_coll() -> Collection:
 
 
 def load_lang_distribution(top: Optional[int] = None) -> List[Dict[str, Any]]:
-    cur = lang_dist_coll().find().sort("project_count", -1)
-    if top:
-        cur = cur.limit(top)
-    return list(cur)
+    with phase("fetch"):
+        if from_snapshot():
+            rows = snapshot().lang_distribution()
+            return rows[:top] if top else rows
+        cur = lang_dist_coll().find().sort("project_count", -1)
+        if top:
+            cur = cur.limit(top)
+        return list(cur)
 
 
 def iter_projects(
     projection: Optional[Dict[str, int]] = None,
+    query: Optional[Dict[str, Any]] = None,
 ) -> Iterable[Dict[str, Any]]:
-    prj = projects_coll()
     if projection is None:
         projection = {"languages": 1, "details.statistics": 1}
-    yield from prj.find({}, projection)
+    if from_snapshot():
+        docs = snapshot().iter_projects(projection, query)
+    else:
+        docs = projects_coll().find(query or {}, projection)
+    yield from PROFILE.iter(docs, fetch="fetch", consume="accumulate")
 
 
-def compute_lang_distribution_from_projects() -> Dict[str, int]:
+def scan_vocab() -> LanguageVocab:
+    """Словарь языков скана: сохранённый (lang_vocab в Mongo или vocab.json снапшота), чтобы id совпадали между процессами."""
+    if from_snapshot():
+        return snapshot().vocab
+    return LanguageVocab.from_ids(load_language_vocab())
+
+
+def scan_has_ids() -> bool:
     """
-    Считает количество проектов на каждый язык (батчево, без полной выгрузки).
-    Возвращает словарь: {язык: число_проектов}.
+    id языков приходят из источника (lang_ids после `app migrate` или vocab.json снапшота);
+    иначе скан раздаёт их сам по названиям, и словарь заполняется только по ходу скана.
     """
-    db = get_db()
-    projects = db["projects"]
+    if from_snapshot():
+        return snapshot().has_ids
+    return language_ids_complete()
 
-    counter: Counter[str] = Counter()
-    cursor = projects.find({}, {"languages": 1}, no_cursor_timeout=True).batch_size(BATCH_SIZE)
 
-    try:
-        for idx, doc in enumerate(cursor, start=1):
-            # диагностический вывод раз в 100k (безопасно)
-            if idx % 100000 == 0:
-                print(f"[scan] processed {idx} documents...")
+def iter_project_batches(
+    metrics: Iterable[str] = (),
+    query: Optional[Dict[str, Any]] = None,
+    vocab: Optional[LanguageVocab] = None,
+) -> Iterable[ProjectBatch]:
+    """
+    Быстрый скан: сырые BSON-батчи -> колонки numpy (project_id, метрики, плоские языки).
+    Все батчи одного скана разделяют словарь языков vocab (по умолчанию — scan_vocab()).
+    """
+    metrics = tuple(metrics)
+    vocab = vocab if vocab is not None else scan_vocab()
+    # scan = fetch + decode, accumulate = код скрипта между батчами (см. scripts.common.profiling)
+    yield from PROFILE.iter(_iter_project_batches(metrics, query, vocab), fetch="scan", consume="accumulate")
 
-            langs = doc.get("languages")
-            if not langs:
-                continue
 
-            # учитываем проект по одному разу для каждого языка
-            for lang in (langs or {}).keys():
-                counter[lang] += 1
+def _iter_project_batches(metrics, query, vocab) -> Iterable[ProjectBatch]:
+    if from_snapshot():
+        batches = iter(snapshot().iter_batches(metrics, query, vocab))
+        while True:
+            with phase("fetch"):
+                batch = next(batches, None)
+            if batch is None:
+                return
+            yield batch
+    # после `app migrate` у всех проектов есть lang_ids/lang_pct — названия языков не читаем вовсе
+    lang_fields = {"lang_ids": 1, "lang_pct": 1} if language_ids_complete() else {"languages": 1}
+    projection = {"_id": 0, "project_id": 1, **lang_fields, **{m: 1 for m in metrics}}
+    cursor = projects_coll().find_raw_batches(query or {}, projection, no_cursor_timeout=True).batch_size(BATCH_SIZE)
+    raws = iter(cursor)
+    seen = 0
+    try:
+        while True:
+            with phase("fetch"):
+                raw = next(raws, None)
+            if raw is None:
+                break
+            with phase("decode"):
+                batch = decode_batch(raw, metrics, vocab)
+                if len(batch.lang_ids) and int(batch.lang_ids.max()) >= len(vocab):
+                    # id выделены уже после загрузки словаря (сбор идёт параллельно) — дочитываем его
+                    vocab.update(load_language_vocab(), size=int(batch.lang_ids.max()) + 1)
+            # диагностический вывод раз в 100k (безопасно)
+            if (seen + len(batch)) // 100000 > seen // 100000:
+                print(f"[scan] processed {seen + len(batch)} documents...")
+            seen += len(batch)
+            yield batch
     finally:
         try:
             cursor.close()
         except Exception:
             pass
 
+
+# ---------- параллельный скан по диапазонам project_id ----------
+
+def split_project_ranges(n: int) -> List[Dict[str, Any]]:
+    """
+    Делит коллекцию на n диапазонов project_id по точкам разбиения из $sample.
+    Возвращает фильтры Mongo; крайние диапазоны открыты, так что покрытие полное.
+    """
+    if n <= 1:
+        return [{}]
+    if from_snapshot():
+        # в снапшоте колонка project_id дешёвая — берём точные квантили
+        ids = sorted(set(snapshot().project_ids().tolist()))
+    else:
+        pipeline = [
+            {"$sample": {"size": n * SAMPLES_PER_RANGE}},
+            {"$project": {"_id": 0, "project_id": 1}},
+        ]
+        ids = sorted({d["project_id"] for d in projects_coll().aggregate(pipeline) if d.get("project_id") is not None})
+    if len(ids) < n:
+        return [{}]
+
+    splits = sorted({ids[len(ids) * i // n] for i in range(1, n)})
+    bounds = [None] + splits + [None]
+    ranges = []
+    for lo, hi in zip(bounds, bounds[1:]):
+        cond = {}
+        if lo is not None:
+            cond["$gte"] = lo
+        if hi is not None:
+            cond["$lt"] = hi
+        ranges.append({"project_id": cond})
+    return ranges
+
+
+def parallel_scan(scan: Callable[[Dict[str, Any]], T], merge: Callable[[T, T], T], workers: int = 1) -> T:
+    """
+    Запускает scan(query) на каждом диапазоне project_id в пуле процессов и сливает
+    частичные аккумуляторы через merge. scan должен быть функцией уровня модуля
+    (или functools.partial от неё) — она передаётся в процессы через pickle.
+    При workers <= 1 всё считается в текущем процессе одним курсором.
+    """
+    if workers <= 1:
+        return scan({})
+    ranges = split_project_ranges(workers)
+    print(f"[scan] {len(ranges)} ranges of project_id, {workers} workers")
+    # spawn: у каждого процесса своё подключение к Mongo (MongoClient не переживает fork);
+    # источник (mongo/snapshot) передаём явно — глобальные настройки в новый процесс не переходят
+    ctx = multiprocessing.get_context("spawn")
+    with phase("scan"), ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                            initializer=use_source, initargs=(_SOURCE["kind"], _SOURCE["snapshot"])) as ex:
+        parts = list(ex.map(scan, ranges))
+    with phase("merge"):
+        return reduce(merge, parts)
+
+
+def merge_counters(a: Counter, b: Counter) -> Counter:
+    a.update(b)
+    return a
+
+
+@dataclass
+class LangValueCounts:
+    """
+    Частичный аккумулятор для медиан по языкам: разреженная гистограмма (язык, значение) -> число проектов.
+    Значения (звёзды, форки) целые и сильно скошенные, так что уникальных пар мало, и она точно сливается.
+    """
+    seen: int = 0
+    valid: int = 0
+    names: List[str] = field(default_factory=list)
+    lang: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+    value: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    count: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+
+    def add(self, lang: np.ndarray, value: np.ndarray, count: Optional[np.ndarray] = None) -> None:
+        if count is None:
+            count = np.ones(len(lang), dtype=np.int64)
+        self.lang, self.value, self.count = reduce_pairs(
+            np.concatenate([self.lang, lang]),
+            np.concatenate([self.value, value]),
+            np.concatenate([self.count, count]),
+        )
+
+    def merge(self, other: "LangValueCounts") -> "LangValueCounts":
+        self.seen += other.seen
+        self.valid += other.valid
+        # общий словарь даёт одинаковые id, но локально добавленные языки у процессов свои — сводим по названиям
+        vocab = LanguageVocab(self.names)
+        remap = np.array([vocab.intern(n) for n in other.names], dtype=np.int32)
+        self.names = vocab.names
+        if len(other.lang):
+            self.add(remap[other.lang], other.value, other.count)
+        return self
+
+    def medians(self):
+        """[(язык, медиана, число проектов)] по всем языкам."""
+        ids, med, n = grouped_medians(self.lang, self.value, self.count)
+        return [(self.names[i], float(m), int(k)) for i, m, k in zip(ids, med, n)]
+
+
+def _count_languages(query: Dict[str, Any]) -> Counter:
+    # ключи languages уникальны в проекте, так что bincount по id = число проектов на язык
+    vocab = scan_vocab()
+    totals = np.zeros(0, dtype=np.int64)
+    for batch in iter_project_batches(query=query, vocab=vocab):
+        counts = np.bincount(batch.lang_ids, minlength=len(vocab))
+        if len(totals) < len(counts):
+            totals = np.pad(totals, (0, len(counts) - len(totals)))
+        totals += counts
+    return Counter({vocab.names[i]: int(c) for i, c in enumerate(totals) if c})
+
+
+def compute_lang_distribution_from_projects(workers: int = 1) -> Dict[str, int]:
+    """
+    Считает количество проектов на каждый язык (батчево, без полной выгрузки).
+    Возвращает словарь: {язык: число_проектов}.
+    """
+    counter = parallel_scan(_count_languages, merge_counters, workers)
+
     print(f"[diag] unique languages found: {len(counter)}, total language mentions: {sum(counter.values())}")
     return dict(counter)
 
 
-def histogram_languages_per_project_batched(limit: int | None = None) -> dict[int, int]:
+def _count_languages_per_project(query: Dict[str, Any]) -> Counter:
+    totals = np.zeros(1, dtype=np.int64)
+    for batch in iter_project_batches(query=query):
+        counts = np.bincount(batch.lang_counts)
+        if len(totals) < len(counts):
+            totals = np.pad(totals, (0, len(counts) - len(totals)))
+        totals[: len(counts)] += counts
+    # проекты без языков (0) не учитываем
+    return Counter({k: int(v) for k, v in enumerate(totals) if k > 0 and v})
+
+
+def histogram_languages_per_project_batched(limit: int | None = None, workers: int = 1) -> dict[int, int]:
     """
     Считает распределение по количеству языков на проект (батчево, без полной выгрузки).
     Возвращает словарь: {число_языков: количество_проектов}.
     """
-    db = get_db()
-    projects = db["projects"]
-
-    counter = Counter()
-    cursor = projects.find({}, {"languages": 1}, no_cursor_timeout=True).batch_size(BATCH_SIZE)
-
-    try:
-        for idx, doc in enumerate(cursor, start=1):
-            # диагностический вывод раз в 100k (безопасно)
-            if idx % 100000 == 0:
-                print(f"[scan] processed {idx} documents...")
-
-            langs = doc.get("languages")
-            if not langs:
-                continue
-            num_langs = len(langs)
-            counter[num_langs] += 1
-    finally:
-        try:
-            cursor.close()
-        except Exception:
-            pass
+    counter = parallel_scan(_count_languages_per_project, merge_counters, workers)
 
     # сортируем по ключу (число языков)
     items = sorted(counter.items(), key=lambda kv: kv[0])  # (num_langs, count)
@@ -115,3 +321,323 @@ def histogram_languages_per_project_batched(limit: int | None = None) -> dict[in
             result[str(k)] = v
 
     return result
+
+
+def _values_by_language(field_name: str, query: Dict[str, Any]) -> LangValueCounts:
+    vocab = scan_vocab()
+    acc = LangValueCounts(names=vocab.names)
+    langs, values = [], []
+    for batch in iter_project_batches((field_name,), query=query, vocab=vocab):
+        acc.seen += len(batch)
+        value = batch.metrics[field_name]
+        # валидное значение и хотя бы один язык
+        acc.valid += int(np.count_nonzero((value >= 0) & (batch.lang_counts > 0)))
+        per_lang = batch.per_language(value)
+        ok = per_lang >= 0
+        langs.append(batch.lang_ids[ok])
+        values.append(per_lang[ok])
+        # периодически сворачиваем в гистограмму, чтобы память не росла с числом проектов
+        if len(langs) >= 256:
+            acc.add(np.concatenate(langs), np.concatenate(values))
+            langs, values = [], []
+    if langs:
+        acc.add(np.concatenate(langs), np.concatenate(values))
+    # словарь мог дорасти во время скана
+    acc.names = vocab.names
+    return acc
+
+
+def values_by_language(field_name: str, workers: int = 1) -> LangValueCounts:
+    """
+    Для каждого языка — распределение значений числового поля (star_count, forks_count, ...).
+    Проект относится ко всем своим языкам; невалидные/отрицательные значения пропускаются.
+    """
+    return parallel_scan(partial(_values_by_language, field_name), LangValueCounts.merge, workers)
+
+
+def language_month_counts(until: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Число проектов и сумма звёзд/форков по (язык, месяц last_activity_at):
+    [{"_id": {"language": ..., "month": "YYYY-MM"}, "count": ..., "stars": ..., "forks": ...}, ...]
+    """
+    with phase("fetch"):
+        return _language_month_counts(until)
+
+
+def _language_month_counts(until: Optional[str]) -> List[Dict[str, Any]]:
+    if from_snapshot():
+        return snapshot().language_month_counts(until)
+
+    pipeline = []
+
+    if until:
+        pipeline.append({
+            "$match": {
+                "last_activity_at": {
+                    "$lte": f"{until}-31"
+                }
+            }
+        })
+
+    pipeline.extend([
+        {
+            "$project": {
+                "languages": {"$objectToArray": "$languages"},
+                "star_count": 1,
+                "forks_count": 1,
+                "month": {
+                    "$dateToString": {
+                        "format": "%Y-%m",
+                        "date": {"$toDate": "$last_activity_at"}
+                    }
+                }
+            }
+        },
+        {"$unwind": "$languages"},
+        {
+            "$group": {
+                "_id": {
+                    "language": "$languages.k",
+                    "month": "$month"
+                },
+                "count": {"$sum": 1},
+                # $sum пропускает отсутствующие и нечисловые значения
+                "stars": {"$sum": "$star_count"},
+                "forks": {"$sum": "$forks_count"},
+            }
+        },
+        {"$sort": {"_id.month": 1}},
+    ])
+
+    return list(projects_coll().aggregate(pipeline, allowDiskUse=True))
+
+
+# ---------- уникальные языковые сигнатуры (дедупликация для кластеризации) ----------
+
+@dataclass
+class LanguageSignatures:
+    """
+    Уникальные векторы «язык -> процент» с числом проектов на каждый.
+    Строка — отсортированные по id языки проекта, дополненные -1 до общей ширины k;
+    проценты (при bin_pct > 0) округлены до кратных bin_pct.
+    """
+    ids: np.ndarray = field(default_factory=lambda: np.zeros((0, 0), dtype=np.int32))
+    pct: np.ndarray = field(default_factory=lambda: np.zeros((0, 0), dtype=np.float32))
+    count: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    names: List[str] = field(default_factory=list)  # id -> язык
+
+    pending: List[tuple] = field(default_factory=list)
+
+    @property
+    def projects(self) -> int:
+        self.fold()
+        return int(self.count.sum())
+
+    def add(self, ids: np.ndarray, pct: np.ndarray, count: np.ndarray) -> None:
+        self.pending.append((ids, pct, count))
+        # сворачиваем пачками: np.unique на каждый батч скана стоил бы O(батчей * уникальных)
+        if sum(len(c) for _, _, c in self.pending) >= max(FOLD_ROWS, len(self.count)):
+            self.fold()
+
+    def fold(self) -> "LanguageSignatures":
+        if not self.pending:
+            return self
+        parts = [(self.ids, self.pct, self.count)] + self.pending
+        self.pending = []
+        k = max(i.shape[1] for i, _, _ in parts)
+        ids = np.concatenate([_pad(i, k, -1) for i, _, _ in parts])
+        pct = np.concatenate([_pad(p, k, 0) for _, p, _ in parts])
+        count = np.concatenate([c for _, _, c in parts])
+        if not len(count):
+            return self
+        # одинаковые строки (ids, pct) сливаются с суммой счётчиков
+        key = np.ascontiguousarray(np.hstack([ids.astype(np.float64), pct.astype(np.float64)]))
+        uniq, inverse = np.unique(key, axis=0, return_inverse=True)
+        self.ids = uniq[:, :k].astype(np.int32)
+        self.pct = uniq[:, k:].astype(np.float32)
+        self.count = np.bincount(inverse.ravel(), weights=count, minlength=len(uniq)).astype(np.int64)
+        return self
+
+    def add_batch(self, batch: ProjectBatch, bin_pct: float = 0.0) -> None:
+        row_of = np.repeat(np.arange(len(batch)), batch.lang_counts)
+        lang = batch.lang_ids.astype(np.int32)
+        pct = _bin(batch.lang_pct, bin_pct)
+        per_row = np.bincount(row_of, minlength=len(batch))
+        rows = np.flatnonzero(per_row)
+        if not len(rows):
+            return
+        # (строка, позиция в строке) после сортировки языков проекта по id
+        order = np.lexsort((lang, row_of))
+        row_of, lang, pct = row_of[order], lang[order], pct[order]
+        starts = np.zeros(len(batch) + 1, dtype=np.int64)
+        np.cumsum(per_row, out=starts[1:])
+        pos = np.arange(len(lang)) - starts[row_of]
+        local = np.searchsorted(rows, row_of)
+        k = int(per_row.max())
+        ids_m = np.full((len(rows), k), -1, dtype=np.int32)
+        pct_m = np.zeros((len(rows), k), dtype=np.float32)
+        ids_m[local, pos] = lang
+        pct_m[local, pos] = pct
+        self.add(ids_m, pct_m, np.ones(len(rows), dtype=np.int64))
+
+    def merge(self, other: "LanguageSignatures") -> "LanguageSignatures":
+        other.fold()
+        # локально добавленные языки у процессов свои — сводим по названиям и заново сортируем строки по id
+        vocab = LanguageVocab(self.names)
+        remap = np.array([vocab.intern(n) for n in other.names] or [0], dtype=np.int32)
+        self.names = vocab.names
+        ids = np.where(other.ids >= 0, remap[np.maximum(other.ids, 0)], -1)
+        order = np.argsort(np.where(ids >= 0, ids, np.iinfo(np.int32).max), axis=1, kind="stable")
+        self.add(np.take_along_axis(ids, order, axis=1), np.take_along_axis(other.pct, order, axis=1), other.count)
+        return self.fold()
+
+    def to_csr(self, width: Optional[int] = None):
+        """Матрица сигнатура×язык; ширина по умолчанию — весь словарь names."""
+        from scipy.sparse import csr_matrix
+
+        self.fold()
+        width = len(self.names) if width is None else width
+        present = self.ids >= 0
+        indptr = np.zeros(len(self.count) + 1, dtype=np.int64)
+        np.cumsum(present.sum(axis=1), out=indptr[1:])
+        return csr_matrix(
+            (self.pct[present].astype(np.float64), self.ids[present], indptr),
+            shape=(len(self.count), width),
+        )
+
+
+def _pad(a: np.ndarray, k: int, fill) -> np.ndarray:
+    if a.shape[1] >= k:
+        return a
+    return np.pad(a, ((0, 0), (0, k - a.shape[1])), constant_values=fill)
+
+
+def _bin(pct: np.ndarray, bin_pct: float) -> np.ndarray:
+    if bin_pct <= 0:
+        return pct.astype(np.float32)
+    return (np.round(pct / bin_pct) * bin_pct).astype(np.float32)
+
+
+def _scan_signatures(bin_pct: float, query: Dict[str, Any]) -> LanguageSignatures:
+    acc = LanguageSignatures()
+    vocab = scan_vocab()
+    for batch in iter_project_batches(query=query, vocab=vocab):
+        acc.add_batch(batch, bin_pct)
+    # словарь берём после скана: в нём и языки, добавленные по ходу
+    acc.names = list(vocab.names)
+    return acc.fold()
+
+
+def _group_signatures(bin_pct: float) -> LanguageSignatures:
+    """$group в Mongo по отсортированной сигнатуре [{l: id, p: процент}, ...] — наружу уходят только уникальные."""
+    pct = {"$arrayElemAt": ["$lang_pct", "$$i"]}
+    if bin_pct > 0:
+        pct = {"$multiply": [{"$round": [{"$divide": [pct, bin_pct]}, 0]}, bin_pct]}
+    pipeline = [
+        {"$match": {"lang_ids.0": {"$exists": True}}},
+        {"$project": {"_id": 0, "sig": {"$sortArray": {
+            "input": {"$map": {
+                "input": {"$range": [0, {"$size": "$lang_ids"}]},
+                "as": "i",
+                "in": {"l": {"$arrayElemAt": ["$lang_ids", "$$i"]}, "p": pct},
+            }},
+            "sortBy": {"l": 1},
+        }}}},
+        {"$group": {"_id": "$sig", "n": {"$sum": 1}}},
+    ]
+    acc = LanguageSignatures()
+    ids, pcts, counts = [], [], []
+
+    def flush():
+        if not counts:
+            return
+        k = max(len(r) for r in ids)
+        acc.add(
+            np.array([r + [-1] * (k - len(r)) for r in ids], dtype=np.int32).reshape(len(ids), k),
+            np.array([r + [0.0] * (k - len(r)) for r in pcts], dtype=np.float32).reshape(len(ids), k),
+            np.asarray(counts, dtype=np.int64),
+        )
+        ids.clear()
+        pcts.clear()
+        counts.clear()
+
+    max_id = -1
+    for doc in PROFILE.iter(projects_coll().aggregate(pipeline, allowDiskUse=True, batchSize=10000), fetch="fetch"):
+        sig = doc["_id"]
+        if not sig:
+            continue
+        max_id = max(max_id, sig[-1]["l"])
+        ids.append([s["l"] for s in sig])
+        pcts.append([s["p"] or 0.0 for s in sig])
+        counts.append(doc["n"])
+        if len(counts) >= 100_000:
+            flush()
+    flush()
+    # словарь читаем после группировки: id, выделенные за это время параллельным сбором, в нём уже есть
+    vocab = scan_vocab()
+    vocab.update({}, size=max_id + 1)
+    acc.names = list(vocab.names)
+    return acc.fold()
+
+
+def language_signatures(bin_pct: float = 0.0, workers: int = 1) -> LanguageSignatures:
+    """
+    Уникальные языковые векторы проектов с числом проектов на каждый (для кластеризации с sample_weight).
+    После `app migrate` группировка идёт в Mongo ($group по lang_ids), иначе и для снапшота — сканом
+    с дедупликацией в numpy. Признаки — names результата.
+    """
+    if not from_snapshot() and language_ids_complete():
+        return _group_signatures(bin_pct)
+    return parallel_scan(partial(_scan_signatures, bin_pct), LanguageSignatures.merge, workers)
+
+
+# ---------- совместная встречаемость языков ----------
+
+@dataclass
+class LanguageCooccurrence:
+    """
+    counts[i, j] — число проектов, где есть и язык i, и язык j (диагональ — проектов с языком i);
+    projects — проектов хотя бы с одним языком. Размер — квадрат словаря, от числа проектов не зависит.
+    """
+    names: List[str] = field(default_factory=list)
+    counts: np.ndarray = field(default_factory=lambda: np.zeros((0, 0), dtype=np.int64))
+    projects: int = 0
+
+    def grow(self, width: int) -> None:
+        if width > len(self.counts):
+            pad = width - len(self.counts)
+            self.counts = np.pad(self.counts, ((0, pad), (0, pad)))
+
+    def merge(self, other: "LanguageCooccurrence") -> "LanguageCooccurrence":
+        # локально добавленные языки у процессов свои — сводим по названиям
+        vocab = LanguageVocab(self.names)
+        remap = np.array([vocab.intern(n) for n in other.names], dtype=np.int64)
+        self.names = vocab.names
+        self.grow(len(self.names))
+        self.counts[np.ix_(remap, remap)] += other.counts
+        self.projects += other.projects
+        return self
+
+
+def _cooccurrence(query: Dict[str, Any]) -> LanguageCooccurrence:
+    vocab = scan_vocab()
+    acc = LanguageCooccurrence()
+    for batch in iter_project_batches(query=query, vocab=vocab):
+        # словарь растёт по ходу скана (языки без lang_ids, id от параллельного сбора) — матрица вместе с ним
+        width = len(vocab)
+        acc.grow(width)
+        X, _ = batch.to_csr(width)
+        if not X.shape[0]:
+            continue
+        # бинарная матрица проект×язык: XᵀX по чанку — попарные счётчики проектов
+        X.data[:] = 1.0
+        acc.counts += (X.T @ X).astype(np.int64).toarray()
+        acc.projects += X.shape[0]
+    acc.grow(len(vocab))
+    acc.names = list(vocab.names)
+    return acc
+
+
+def language_cooccurrence(workers: int = 1) -> LanguageCooccurrence:
+    """Матрица совместной встречаемости языков по всем проектам (параллельно по диапазонам project_id)."""
+    return parallel_scan(_cooccurrence, LanguageCooccurrence.merge, workers)
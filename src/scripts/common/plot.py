@@ -6,6 +6,7 @@ matplotlib.use("Agg")  # headless
 import matplotlib.pyplot as plt
 import colorsys
 import random
+from scripts.common.profiling import profiled
 
 
 def ensure_parent_dir(path: str | Path) -> Path:
@@ -33,6 +34,7 @@ def unique_colors(n: int, seed: Optional[int] = None) -> list[tuple[float, float
     return colors
 
 
+@profiled("plot")
 def bar_chart(labels: Sequence[str], values: Sequence[float], out_path: str | Path, title: str = "", xlabel: str = "", ylabel: str = "", rotate_x: int = 45) -> Path:
     out_p = ensure_parent_dir(out_path)
     fig = plt.figure(figsize=(12, 6))
@@ -50,6 +52,7 @@ def bar_chart(labels: Sequence[str], values: Sequence[float], out_path: str | Pa
     return out_p
 
 
+@profiled("plot")
 def barh_chart(labels: Sequence[str], values: Sequence[float], out_path: str | Path, title: str = "", xlabel: str = "", ylabel: str = "") -> Path:
     out_p = ensure_parent_dir(out_path)
     fig = plt.figure(figsize=(12, 0.5 * max(6, len(labels))))
@@ -65,6 +68,7 @@ def barh_chart(labels: Sequence[str], values: Sequence[float], out_path: str | P
     return out_p
 
 
+@profiled("plot")
 def pie_chart(labels: Sequence[str], values: Sequence[float], out_path: str | Path, title: str = "", random_colors: bool = False, seed: Optional[int] = None) -> Path:
     out_p = ensure_parent_dir(out_path)
     if not labels or not values or sum(values) <= 0:
@@ -85,3 +89,31 @@ def pie_chart(labels: Sequence[str], values: Sequence[float], out_path: str | Pa
     fig.savefig(out_p, dpi=130, bbox_inches="tight")
     plt.close(fig)
     return out_p
+
+
+@profiled("plot")
+def heatmap(matrix, labels: Sequence[str], out_path: str | Path, title: str = "", cbar_label: str = "", center: Optional[float] = None, cmap: str = "RdBu_r") -> Path:
+    """Квадратная тепловая карта; center — значение посередине шкалы (0 для PMI, 1 для lift)."""
+    import numpy as np
+    from matplotlib.colors import TwoSlopeNorm
+
+    out_p = ensure_parent_dir(out_path)
+    n = len(labels)
+    fig = plt.figure(figsize=(max(8, 0.35 * n + 3), max(7, 0.35 * n + 2)))
+    m = np.ma.masked_invalid(np.asarray(matrix, dtype=float))
+    norm = None
+    if center is not None and m.count():
+        lo, hi = float(m.min()), float(m.max())
+        if lo < center < hi:
+            norm = TwoSlopeNorm(vcenter=center, vmin=lo, vmax=hi)
+    im = plt.imshow(m, cmap=cmap, norm=norm, interpolation="nearest")
+    cb = plt.colorbar(im, fraction=0.046, pad=0.04)
+    if cbar_label:
+        cb.set_label(cbar_label)
+    plt.xticks(range(n), labels, rotation=90, fontsize=8)
+    plt.yticks(range(n), labels, fontsize=8)
+    plt.title(title)
+    plt.tight_layout()
+    fig.savefig(out_p, dpi=130)
+    plt.close(fig)
+    return out_p
@@ -1,8 +1,11 @@
 from scripts.common.plot import barh_chart
 import matplotlib.pyplot as plt
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scripts.common.profiling import profiled
 
 
+@profiled("plot")
 def plot_trends(trends, out):
     trends = sorted(trends, key=lambda x: x["trend"], reverse=True)
     labels = [t["language"] for t in trends]
@@ -16,16 +19,27 @@ def plot_trends(trends, out):
         xlabel="Рост / спад"
     )
 
-def plot_timeseries_absolute(series, months, out, forecast=0):
-    fig = plt.figure(figsize=(12, 8))
+TOTAL = "__total__"  # имя строки итога месяца в plot_timeseries_share
+
 
-    last_month = months[-1]
+def _default_forecaster(names, Y, steps):
+    return batch_rolling_forecast(Y, steps)
 
-    for lang, ys in series.items():
+
+@profiled("plot")
+def plot_timeseries_absolute(names, series, months, out, forecast=0, forecaster=None):
+    """
+    series — массив языки × месяцы (строки куба в порядке names).
+    forecaster(names, Y, steps) -> прогнозы; по умолчанию rolling OLS для всех (см. scripts.common.backtest).
+    """
+    fig = plt.figure(figsize=(12, 8))
+
+    forecaster = forecaster or _default_forecaster
+    futures = forecaster(names, series, forecast) if forecast > 0 and len(months) >= 4 else None
+    for lang, ys, y_future in zip(names, series, futures if futures is not None else [None] * len(names)):
         plt.plot(months, ys, label=lang)
 
-        if forecast > 0 and len(ys) >= 4:
-            y_future = rolling_forecast(ys, forecast)
+        if y_future is not None:
             future_months = [
                 f"+{i+1}" for i in range(forecast)
             ]
@@ -47,23 +61,26 @@ def plot_timeseries_absolute(series, months, out, forecast=0):
     plt.close(fig)
 
 
-def plot_timeseries_share(series, months, out, forecast=0):
+@profiled("plot")
+def plot_timeseries_share(names, series, totals, months, out, forecast=0, forecaster=None):
+    """Доля каждого языка от totals (сумма по всем языкам месяца); прогноз — отдельно для рядов и для итога."""
     fig = plt.figure(figsize=(12, 8))
 
-    data = np.array(list(series.values()))
+    data = np.asarray(series, dtype=float)
+    totals = np.asarray(totals, dtype=float)
 
     if forecast > 0:
-        futures = []
-        for ys in data:
-            futures.append(rolling_forecast(ys, forecast))
-        data = np.hstack([data, np.array(futures)])
+        # ряды языков и итог месяца — одной пачкой
+        futures = (forecaster or _default_forecaster)(list(names) + [TOTAL], np.vstack([data, totals]), forecast)
+        data = np.hstack([data, futures[:-1]])
+        totals = np.concatenate([totals, futures[-1]])
 
-    totals = data.sum(axis=0)
-    shares = data / totals
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(totals > 0, data / totals, 0.0)
 
     all_months = months + [f"+{i+1}" for i in range(forecast)]
 
-    for i, lang in enumerate(series.keys()):
+    for i, lang in enumerate(names):
         plt.plot(all_months[:len(months)], shares[i][:len(months)], label=lang)
         if forecast > 0:
             plt.plot(
@@ -83,34 +100,89 @@ def plot_timeseries_share(series, months, out, forecast=0):
     plt.close(fig)
 
 
-def linear_forecast(y, steps, window=6, damping=0.6):
-    y = np.array(y[-window:])
-
-    # локальные изменения
-    deltas = np.diff(y)
-    avg_delta = deltas.mean()
-
-    forecast = []
-    last = y[-1]
-    delta = avg_delta
+def ols_weights(window: int) -> np.ndarray:
+    """c_i = x_i - mean(x) для x = 0..window-1: наклон OLS = (c · y) / (c · c)."""
+    return np.arange(window) - (window - 1) / 2
+
+
+def ols_slopes(Y) -> np.ndarray:
+    """Наклоны OLS (как np.polyfit(x, y, 1)[0]) для всех строк (языки × месяцы) одним матричным умножением."""
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    c = ols_weights(Y.shape[1])
+    return Y @ c / max(float(c @ c), 1e-12)
+
+
+def rolling_slopes(Y, window: int) -> np.ndarray:
+    """Наклоны по всем скользящим окнам сразу: (языки × (месяцы - window + 1))."""
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    c = ols_weights(window)
+    return sliding_window_view(Y, window, axis=1) @ c / max(float(c @ c), 1e-12)
+
+
+def batch_linear_forecast(Y, steps, window=6, damping=0.6):
+    """
+    linear_forecast для всех строк сразу. Среднее приращение по окну телескопируется в
+    (y[-1] - y[-window]) / (window - 1), затухающий импульс — геометрическая прогрессия.
+    damping=1 — обычная линейная экстраполяция.
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))[:, -window:]
+    last = Y[:, -1:]
+    avg_delta = (Y[:, -1:] - Y[:, :1]) / max(Y.shape[1] - 1, 1) if Y.shape[1] > 1 else np.full_like(last, np.nan)
+    decay = np.cumsum(damping ** np.arange(1, steps + 1))
+    return np.maximum(last + avg_delta * decay, 0)
+
+
+def batch_rolling_forecast(Y, steps, window_size=8):
+    """
+    rolling_forecast для всех строк сразу. Прогноз OLS по последним window_size точкам на шаг вперёд —
+    линейный фильтр h окна: ȳ + slope·(w + 1)/2; шаги рекурсивны (прогноз входит в следующее окно),
+    так что цикл идёт по steps, а не по языкам.
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    w = min(window_size, Y.shape[1])
+    c = ols_weights(w)
+    h = 1 / w + c * (w + 1) / 2 / max(float(c @ c), 1e-12)
+    out = np.empty((Y.shape[0], steps))
+    window = Y[:, -w:].copy()
+    for i in range(steps):
+        out[:, i] = window @ h
+        window = np.concatenate([window[:, 1:], out[:, i:i + 1]], axis=1)
+    return out
+
+
+def holt_states(Y, alpha, beta=0.0, phi=1.0, trend=True):
+    """
+    Экспоненциальное сглаживание (Холт с затуханием тренда) для всех строк сразу; цикл — по месяцам.
+    Возвращает (level, slope) после каждого месяца: (языки × месяцы) каждое.
+    beta=0 и trend=False — простое экспоненциальное сглаживание (SES).
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    level = np.empty_like(Y)
+    slope = np.empty_like(Y)
+    l = Y[:, 0].copy()
+    b = (Y[:, 1] - Y[:, 0]) if trend and Y.shape[1] > 1 else np.zeros(len(Y))
+    level[:, 0], slope[:, 0] = l, b
+    for t in range(1, Y.shape[1]):
+        prev = l
+        l = alpha * Y[:, t] + (1 - alpha) * (prev + phi * b)
+        b = beta * (l - prev) + (1 - beta) * phi * b
+        level[:, t], slope[:, t] = l, b
+    return level, slope
+
+
+def holt_project(level, slope, steps, phi=1.0):
+    """Прогноз из состояния: level + (phi + ... + phi^h) * slope, не ниже нуля."""
+    decay = np.cumsum(phi ** np.arange(1, steps + 1))
+    return np.maximum(level[..., None] + slope[..., None] * decay, 0)
+
+
+def batch_holt_forecast(Y, steps, alpha=0.5, beta=0.0, phi=1.0, trend=True):
+    level, slope = holt_states(Y, alpha, beta, phi, trend)
+    return holt_project(level[:, -1], slope[:, -1], steps, phi)
 
-    for _ in range(steps):
-        delta *= damping          # затухание импульса
-        last = last + delta
-        forecast.append(max(last, 0))
 
-    return np.array(forecast)
+def linear_forecast(y, steps, window=6, damping=0.6):
+    return batch_linear_forecast(y, steps, window, damping)[0]
 
 def rolling_forecast(y, steps, window_size=8):
-    forecast = []
-    series = list(y)
-    for i in range(steps):
-        x_window = np.arange(len(series) - window_size, len(series))
-        y_window = np.array(series[-window_size:])
-        coef = np.polyfit(x_window, y_window, 1)
-        y_next = np.polyval(coef, len(series))
-        forecast.append(y_next)
-        series.append(y_next)
-    return np.array(forecast)
-
-
+    return batch_rolling_forecast(y, steps, window_size)[0]
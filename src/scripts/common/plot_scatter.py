@@ -4,7 +4,9 @@ matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.patches as mpatches
+from scripts.common.profiling import profiled
 
+@profiled("plot")
 def scatter_clusters(X, labels, out, title="", cluster_names=None):
 
     Path(out).parent.mkdir(parents=True, exist_ok=True)
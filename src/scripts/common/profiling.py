@@ -0,0 +1,240 @@
+"""
+Профилирование скриптов аналитики (--profile).
+
+Время делится на фазы: fetch (курсор Mongo / чтение снапшота), decode (BSON -> колонки),
+accumulate (код скрипта между батчами), plot (отрисовка) плюс фазы, которые скрипт размечает
+сам (with phase("kmeans_fit"): ...). Фазы могут быть вложенными, время и пик tracemalloc в отчёте — включительные.
+Фоновый поток сэмплирует RSS и запоминает пик по текущей фазе.
+
+Режимы:
+    --profile                фазы + RSS
+    --profile tracemalloc    + пик выделений Python по фазам и топ мест выделения
+    --profile cprofile       + cProfile всего прогона (.prof рядом с отчётом)
+
+Отчёт — JSON в --profile-out (по умолчанию /app/outputs/profile/<скрипт>-<время>.json).
+При --workers > 1 скан идёт в дочерних процессах: fetch/decode/accumulate видны только
+как общая фаза scan родителя.
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+PROFILE_DIR = "/app/outputs/profile"
+RSS_SAMPLE_INTERVAL = 0.05
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.mode = "phases"
+        self.out: Optional[Path] = None
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.peak_rss: Dict[str, int] = {}
+        self.peak_traced: Dict[str, int] = {}
+        self._traced_open: Dict[str, int] = {}  # открытые фазы -> пик выделений с их начала
+        self.stack: List[str] = []
+        self.t0 = 0.0
+        self._cprofile = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # --- разметка ---
+
+    def add(self, name: str, seconds: float, calls: int = 1):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled or name in self.stack:
+            # вложенная фаза с тем же именем (plot внутри plot) уже считается внешней
+            yield
+            return
+        self.stack.append(name)
+        if self.mode == "tracemalloc":
+            import tracemalloc
+            self._fold_traced_peak()
+            tracemalloc.reset_peak()
+            self._traced_open[name] = 0
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t)
+            if self.mode == "tracemalloc":
+                self._fold_traced_peak()
+                peak = self._traced_open.pop(name)
+                self.peak_traced[name] = max(self.peak_traced.get(name, 0), peak)
+            self.stack.pop()
+
+    def _fold_traced_peak(self):
+        """Пик tracemalloc с последнего сброса — во все открытые фазы: вложенная фаза сбрасывает общий пик."""
+        import tracemalloc
+        peak = tracemalloc.get_traced_memory()[1]
+        for name, prev in self._traced_open.items():
+            self._traced_open[name] = max(prev, peak)
+
+    def iter(self, it: Iterable[T], fetch: str = "fetch", consume: str = "accumulate") -> Iterator[T]:
+        """
+        Оборачивает итератор: время внутри next() идёт в фазу fetch, время между
+        выдачей элемента и следующим запросом (код потребителя) — в consume.
+        """
+        if not self.enabled:
+            yield from it
+            return
+        it = iter(it)
+        t_fetch = t_consume = 0.0
+        n = 0
+        try:
+            while True:
+                t = time.perf_counter()
+                self.stack.append(fetch)
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                finally:
+                    self.stack.pop()
+                    t_fetch += time.perf_counter() - t
+                n += 1
+                t = time.perf_counter()
+                self.stack.append(consume)
+                try:
+                    yield item
+                finally:
+                    self.stack.pop()
+                    t_consume += time.perf_counter() - t
+        finally:
+            # и при досрочном выходе потребителя (break -> GeneratorExit)
+            self.add(fetch, t_fetch, n)
+            self.add(consume, t_consume, n)
+
+    # --- жизненный цикл ---
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            rss = _rss_bytes()
+            name = self.stack[-1] if self.stack else "other"
+            if rss > self.peak_rss.get(name, 0):
+                self.peak_rss[name] = rss
+
+    def start(self, mode: str, out: Optional[str], script: str):
+        self.enabled = True
+        self.mode = mode
+        ts = time.strftime("%Y%m%dT%H%M%S")
+        self.out = Path(out) if out else Path(PROFILE_DIR) / f"{script}-{ts}.json"
+        self.script = script
+        if mode == "tracemalloc":
+            import tracemalloc
+            tracemalloc.start(25)
+        elif mode == "cprofile":
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._sampler = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._sampler.start()
+        self.t0 = time.perf_counter()
+        atexit.register(self.finish)
+
+    def finish(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        wall = time.perf_counter() - self.t0
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        self._stop.set()
+
+        report = {
+            "script": self.script,
+            "argv": sys.argv[1:],
+            "mode": self.mode,
+            "wall_s": round(wall, 3),
+            "peak_rss_mb": round(max(self.peak_rss.values(), default=_rss_bytes()) / 2**20, 1),
+            "phases": {
+                name: {
+                    "seconds": round(sec, 3),
+                    "share": round(sec / wall, 3) if wall > 0 else None,
+                    "calls": self.calls.get(name, 0),
+                    "peak_rss_mb": round(self.peak_rss[name] / 2**20, 1) if name in self.peak_rss else None,
+                    **({"peak_traced_mb": round(self.peak_traced[name] / 2**20, 1)} if name in self.peak_traced else {}),
+                }
+                for name, sec in sorted(self.seconds.items(), key=lambda kv: -kv[1])
+            },
+        }
+        self.out.parent.mkdir(parents=True, exist_ok=True)
+        if self.mode == "tracemalloc":
+            import tracemalloc
+            snap = tracemalloc.take_snapshot()
+            report["top_allocations"] = [
+                {"where": str(s.traceback[0]), "size_mb": round(s.size / 2**20, 2), "blocks": s.count}
+                for s in snap.statistics("lineno")[:20]
+            ]
+            tracemalloc.stop()
+        if self._cprofile is not None:
+            import pstats
+            prof_path = self.out.with_suffix(".prof")
+            self._cprofile.dump_stats(prof_path)
+            report["cprofile"] = str(prof_path)
+            with open(self.out.with_suffix(".txt"), "w") as f:
+                pstats.Stats(str(prof_path), stream=f).sort_stats("cumulative").print_stats(40)
+
+        with open(self.out, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+        print(f"[profile] wall={wall:.2f}s peak_rss={report['peak_rss_mb']}MB -> {self.out}")
+        for name, p in report["phases"].items():
+            print(f"[profile]   {name:<16} {p['seconds']:>9.3f}s  {100 * (p['share'] or 0):5.1f}%  calls={p['calls']}")
+
+
+PROFILE = Profiler()
+
+
+def phase(name: str):
+    return PROFILE.phase(name)
+
+
+def profiled(name: str):
+    """Декоратор: весь вызов функции — фаза name (например, plot)."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with PROFILE.phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def add_profile_args(ap) -> None:
+    ap.add_argument("--profile", nargs="?", const="phases", default=None,
+                    choices=["phases", "tracemalloc", "cprofile"],
+                    help="Профилирование: время по фазам и RSS (+ tracemalloc или cProfile)")
+    ap.add_argument("--profile-out", type=str, default=None,
+                    help=f"JSON-отчёт профиля (по умолчанию {PROFILE_DIR}/<скрипт>-<время>.json)")
+
+
+def apply_profile_args(args) -> None:
+    if getattr(args, "profile", None):
+        script = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else "script"
+        PROFILE.start(args.profile, args.profile_out, script)
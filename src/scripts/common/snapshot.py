@@ -0,0 +1,161 @@
+"""
+Чтение колоночного снапшота (см. app.snapshot) вместо живой MongoDB.
+Файлы открываются через memory_map, так что повторные прогоны не грузят Mongo и дают одинаковый результат.
+"""
+
+from pathlib import Path
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from scripts.common.columnar import MISSING, LanguageVocab, ProjectBatch
+
+
+def _range_mask(pid: np.ndarray, query: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """Поддерживается только то, что генерирует parallel_scan: диапазон по project_id."""
+    if not query:
+        return None
+    if set(query) != {"project_id"}:
+        raise ValueError(f"snapshot source supports only project_id range filters, got: {query}")
+    mask = np.ones(len(pid), dtype=bool)
+    for op, bound in query["project_id"].items():
+        if op == "$gte":
+            mask &= pid >= bound
+        elif op == "$gt":
+            mask &= pid > bound
+        elif op == "$lt":
+            mask &= pid < bound
+        elif op == "$lte":
+            mask &= pid <= bound
+        else:
+            raise ValueError(f"unsupported operator in snapshot filter: {op}")
+    return mask
+
+
+def _lang_ids(column: pa.ChunkedArray, vocab: LanguageVocab) -> np.ndarray:
+    # словарь у каждого чанка свой — переводим его индексы в id общего словаря скана
+    parts = []
+    for chunk in column.chunks:
+        remap = np.array([vocab.intern(name) for name in chunk.dictionary.to_pylist()], dtype=np.uint16)
+        idx = chunk.indices.to_numpy(zero_copy_only=False)
+        parts.append(remap[idx] if len(remap) else np.zeros(0, dtype=np.uint16))
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint16)
+
+
+class Snapshot:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.parts = sorted((self.path / "projects").glob("part-*.parquet"))
+        if not self.parts:
+            raise FileNotFoundError(f"Empty or broken snapshot: {self.path}")
+        vocab_path = self.path / "vocab.json"
+        if vocab_path.exists():
+            with open(vocab_path) as f:
+                self.vocab = LanguageVocab.from_ids(json.load(f))
+            self._has_ids = True
+        else:
+            self.vocab = LanguageVocab()
+            self._has_ids = False
+
+    @property
+    def has_ids(self) -> bool:
+        """Колонка lang_id согласована с vocab.json снапшота."""
+        return self._has_ids
+
+    def _ids(self, part: Path, vocab: LanguageVocab) -> np.ndarray:
+        # колонка lang_id совпадает с собственным словарём снапшота — берём как есть
+        if vocab is self.vocab and self._has_ids:
+            return self._read("languages", part, ["lang_id"])["lang_id"].to_numpy()
+        return _lang_ids(self._read("languages", part, ["language"])["language"], vocab)
+
+    def _read(self, table: str, part: Path, columns: Sequence[str]) -> pa.Table:
+        return pq.read_table(self.path / table / part.name, columns=list(columns), memory_map=True)
+
+    def project_ids(self) -> np.ndarray:
+        return np.concatenate([self._read("projects", p, ["project_id"])["project_id"].to_numpy() for p in self.parts])
+
+    def iter_batches(
+        self,
+        metrics: Sequence[str] = (),
+        query: Optional[Dict[str, Any]] = None,
+        vocab: Optional[LanguageVocab] = None,
+    ) -> Iterable[ProjectBatch]:
+        vocab = vocab if vocab is not None else self.vocab
+        for part in self.parts:
+            prj = self._read("projects", part, ["project_id", "lang_count", *metrics])
+
+            pid = prj["project_id"].to_numpy()
+            counts = prj["lang_count"].to_numpy().astype(np.int64)
+            cols = {m: pc.fill_null(prj[m], MISSING).to_numpy() for m in metrics}
+            ids = self._ids(part, vocab)
+            pct = self._read("languages", part, ["pct"])["pct"].to_numpy().astype(np.float32, copy=False)
+
+            mask = _range_mask(pid, query)
+            if mask is not None:
+                lang_mask = np.repeat(mask, counts)
+                pid, counts = pid[mask], counts[mask]
+                cols = {m: v[mask] for m, v in cols.items()}
+                ids, pct = ids[lang_mask], pct[lang_mask]
+            if not len(pid):
+                continue
+
+            offsets = np.zeros(len(pid) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            yield ProjectBatch(project_id=pid, lang_offsets=offsets, lang_ids=ids, lang_pct=pct, vocab=vocab, metrics=cols)
+
+    def iter_projects(self, projection: Optional[Dict[str, int]] = None, query: Optional[Dict[str, Any]] = None) -> Iterable[Dict[str, Any]]:
+        """Документы в форме Mongo (project_id, метрики из projection, languages) — для скриптов на словарях."""
+        metrics = [f for f in ("star_count", "forks_count", "open_issues_count") if projection and f in projection]
+        for batch in self.iter_batches(metrics, query):
+            names = batch.vocab.names
+            off = batch.lang_offsets
+            ids = batch.lang_ids.tolist()
+            pct = batch.lang_pct.tolist()
+            values = {m: batch.metrics[m].tolist() for m in metrics}
+            for i, pid in enumerate(batch.project_id.tolist()):
+                doc = {"project_id": pid, "languages": {names[ids[j]]: pct[j] for j in range(off[i], off[i + 1])}}
+                for m in metrics:
+                    v = values[m][i]
+                    doc[m] = v if v != MISSING else None
+                yield doc
+
+    def lang_distribution(self) -> List[Dict[str, Any]]:
+        vocab = self.vocab
+        totals = np.zeros(0, dtype=np.int64)
+        for part in self.parts:
+            ids = self._ids(part, vocab)
+            counts = np.bincount(ids, minlength=len(vocab))
+            totals = np.pad(totals, (0, len(counts) - len(totals))) + counts
+        rows = [{"language": vocab.names[i], "project_count": int(c)} for i, c in enumerate(totals) if c]
+        return sorted(rows, key=lambda r: r["project_count"], reverse=True)
+
+    def language_month_counts(self, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """То же, что $group по (язык, месяц last_activity_at) в language_trends, но по снапшоту."""
+        vocab = self.vocab
+        keys, stars, forks = [], [], []
+        for part in self.parts:
+            prj = self._read("projects", part, ["lang_count", "last_activity_at", "star_count", "forks_count"])
+            ids = self._ids(part, vocab)
+            counts = prj["lang_count"].to_numpy().astype(np.int64)
+            months = prj["last_activity_at"].to_numpy(zero_copy_only=False).astype("datetime64[M]")
+            months = np.repeat(months, counts)
+            ok = ~np.isnat(months)
+            if until:
+                ok &= months <= np.datetime64(until, "M")
+            keys.append(np.stack([ids[ok].astype(np.int64), months[ok].astype(np.int64)], axis=1))
+            for out, col in ((stars, "star_count"), (forks, "forks_count")):
+                out.append(np.repeat(pc.fill_null(prj[col], 0).to_numpy(), counts)[ok])
+        if not keys:
+            return []
+        uniq, inverse, counts = np.unique(np.concatenate(keys), axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        star_sum = np.bincount(inverse, weights=np.concatenate(stars), minlength=len(uniq)).astype(np.int64)
+        fork_sum = np.bincount(inverse, weights=np.concatenate(forks), minlength=len(uniq)).astype(np.int64)
+        return [
+            {"_id": {"language": vocab.names[lid], "month": str(np.datetime64(m, "M"))}, "count": int(c), "stars": int(st), "forks": int(fk)}
+            for (lid, m), c, st, fk in zip(uniq.tolist(), counts.tolist(), star_sum.tolist(), fork_sum.tolist())
+        ]
@@ -1,10 +1,12 @@
 """
 Строит столбчатую диаграмму: топ-N языков по числу проектов.
-Берёт данные из коллекции lang_distribution (результат агрегирования).
+Берёт данные из коллекции lang_distribution (результат агрегирования);
+если она пуста — считает по projects.languages (параллельно при --workers > 1).
 """
 import argparse
 from pathlib import Path
-from scripts.common.mongo import load_lang_distribution
+from scripts.common.mongo import add_source_args, apply_source_args, load_lang_distribution, compute_lang_distribution_from_projects
+from scripts.common.profiling import add_profile_args, apply_profile_args
 from scripts.common.plot import bar_chart
 import logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -20,13 +22,24 @@ def parse_args():
         default="/app/outputs/lang_top20.png",
         help="Путь к выходному PNG",
     )
+    p.add_argument("--workers", type=int, default=1, help="Процессов для скана projects, если lang_distribution пуст")
+    add_source_args(p)
+    add_profile_args(p)
     return p.parse_args()
 
 def main():
     args = parse_args()
+    apply_source_args(args)
+    apply_profile_args(args)
     data = load_lang_distribution(top=args.top)
     if not data:
-        print("Коллекция lang_distribution пуста. Сначала запусти сбор и агрегирование:")
+        counts = compute_lang_distribution_from_projects(workers=args.workers)
+        data = [
+            {"language": k, "project_count": v}
+            for k, v in sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[: args.top]
+        ]
+    if not data:
+        print("Нет данных ни в lang_distribution, ни в projects. Сначала запусти сбор и агрегирование:")
         print("  docker compose run --rm app python -m app fetch")
         print("  docker compose run --rm app python -m app aggregate")
         return
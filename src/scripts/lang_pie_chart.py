@@ -7,7 +7,8 @@
 import argparse
 import os
 from typing import List, Tuple
-from scripts.common.mongo import load_lang_distribution, compute_lang_distribution_from_projects
+from scripts.common.mongo import add_source_args, apply_source_args, load_lang_distribution, compute_lang_distribution_from_projects
+from scripts.common.profiling import add_profile_args, apply_profile_args
 from scripts.common.plot import pie_chart
 
 
@@ -27,7 +28,12 @@ def main():
     ap.add_argument("--top", type=int, default=12, help="Оставить топ-N, остальные в 'Other'")
     ap.add_argument("--out", type=str, default="/app/outputs/lang_pie.png", help="PNG выход")
     ap.add_argument("--seed", type=int, default=None, help="Seed для воспроизводимой цветовой палитры")
+    ap.add_argument("--workers", type=int, default=1, help="Процессов для скана projects, если lang_distribution пуст")
+    add_source_args(ap)
+    add_profile_args(ap)
     args = ap.parse_args()
+    apply_source_args(args)
+    apply_profile_args(args)
 
     print(f"[pie] target file: {args.out}")
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
@@ -37,7 +43,7 @@ def main():
         print(f"[pie] lang_distribution rows: {len(rows)}")
     else:
         print("[pie] lang_distribution пуст — считаю по projects.languages …")
-        counts = compute_lang_distribution_from_projects()
+        counts = compute_lang_distribution_from_projects(workers=args.workers)
         rows = sorted(
             [{"language": k, "project_count": v} for k, v in counts.items()],
             key=lambda x: x["project_count"],
@@ -0,0 +1,100 @@
+"""
+Бэктест моделей прогноза для language_trends: rolling origin по помесячным рядам всех языков,
+семейства rolling OLS / затухающий тренд / линейный / SES / Холт, таблицы MAPE и MASE.
+Лучшая модель на язык сохраняется в --models и используется графиками language_trends.
+
+    python -m scripts.language_backtest --horizon 6 --origins 12 --workers 4
+    python -m scripts.language_backtest --cube /app/cache/language_cube --families rolling_ols,holt --out /app/outputs
+"""
+
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from scripts.common.backtest import GRID, MODELS_FILE, best_models, label, run_backtest, save_models
+from scripts.common.cube import load_or_build
+from scripts.common.mongo import add_source_args, apply_source_args
+from scripts.common.profiling import add_profile_args, apply_profile_args, phase
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бэктест прогнозов популярности языков (rolling origin, MAPE/MASE)")
+    ap.add_argument("--horizon", type=int, default=6, help="Горизонт прогноза, месяцев")
+    ap.add_argument("--origins", type=int, default=12, help="Сколько последних точек отсчёта проверять")
+    ap.add_argument("--history", type=int, default=0, help="Сколько месяцев истории брать (0 = всю)")
+    ap.add_argument("--until", type=str, default=None, help="Последний месяц включительно, YYYY-MM")
+    ap.add_argument("--min-volume", type=int, default=100, help="Минимум проектов за историю, чтобы язык участвовал")
+    ap.add_argument("--families", type=str, default=",".join(GRID), help="Семейства моделей через запятую")
+    ap.add_argument("--workers", type=int, default=1, help="Процессов для сетки конфигураций")
+    ap.add_argument("--top", type=int, default=15, help="Сколько языков показать в таблице по языкам")
+    ap.add_argument("--models", type=str, default=MODELS_FILE, help="Куда сохранить лучшую модель на язык")
+    ap.add_argument("--out", type=str, default="/app/outputs", help="Каталог для CSV с полными таблицами")
+    ap.add_argument("--cube", type=str, default=None, help="Готовый куб язык×месяц вместо сборки из источника")
+    add_source_args(ap)
+    add_profile_args(ap)
+    args = ap.parse_args()
+    apply_source_args(args)
+    apply_profile_args(args)
+
+    families = [f.strip() for f in args.families.split(",") if f.strip()]
+    unknown = set(families) - set(GRID)
+    if unknown:
+        ap.error(f"неизвестные семейства: {', '.join(sorted(unknown))}")
+
+    cube = load_or_build(args.cube)
+    lo, hi = cube.span(until=args.until, months=args.history or None)
+    volume = cube.window(lo, hi)
+    langs = np.flatnonzero(volume >= args.min_volume)
+    langs = langs[np.argsort(-volume[langs], kind="stable")]
+    if not len(langs):
+        print("Нет языков с достаточным объёмом. Уменьшите --min-volume или загрузите проекты.")
+        return
+    names = [cube.names[i] for i in langs]
+    Y = cube.series(lo, hi, "projects", langs)
+
+    t0 = time.perf_counter()
+    res = run_backtest(Y, args.horizon, args.origins, families, args.workers)
+    elapsed = time.perf_counter() - t0
+    cfgs, mape, mase = res["configs"], res["mape"], res["mase"]
+    months = cube.months
+    print(f"Языков: {len(names)}, месяцев: {Y.shape[1]} ({months[lo]}..{months[hi]}), точек отсчёта: {len(res['origins'])}, "
+          f"горизонт: {args.horizon}, конфигураций: {len(cfgs)} -> {len(cfgs) * len(names) * len(res['origins'])} прогнозов "
+          f"за {elapsed:.2f}s")
+
+    with phase("report"):
+        best = best_models(names, res)
+        wins = np.bincount(np.nanargmin(np.where(np.isnan(mase), np.inf, mase), axis=0), minlength=len(cfgs))
+        med_mase = np.nanmedian(mase, axis=1)
+        order = np.argsort(med_mase)
+
+        print("\nКонфигурации (медиана по языкам):")
+        print(f"  {'модель':<42} {'MASE':>7} {'MAPE,%':>8} {'побед':>6}")
+        for i in order:
+            print(f"  {label(*cfgs[i]):<42} {med_mase[i]:>7.3f} {np.nanmedian(mape[i]):>8.1f} {wins[i]:>6}")
+
+        print(f"\nЛучшая модель по языкам (топ-{args.top} по объёму):")
+        for name in names[: args.top]:
+            b = best.get(name)
+            if b:
+                mape_s = f"{b['mape']:.1f}" if b["mape"] is not None else "—"
+                print(f"  {name:<18} {label(b['model'], b['params']):<42} MASE={b['mase']:.3f} MAPE={mape_s}%")
+
+        os.makedirs(args.out, exist_ok=True)
+        table = os.path.join(args.out, "backtest_languages.csv")
+        with open(table, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["language", "model", "mase", "mape"])
+            for i, cfg in enumerate(cfgs):
+                for j, name in enumerate(names):
+                    w.writerow([name, label(*cfg), f"{mase[i, j]:.4f}", f"{mape[i, j]:.2f}"])
+
+    path = save_models(best, args.models, horizon=args.horizon, origins=len(res["origins"]),
+                       until=str(months[hi]), families=families)
+    print(f"\nЛучшие модели: {path} ({len(best)} языков); полная таблица: {table}")
+
+
+if __name__ == "__main__":
+    main()
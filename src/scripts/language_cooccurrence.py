@@ -0,0 +1,105 @@
+"""
+Какие языки встречаются вместе: матрица совместной встречаемости проект×язык
+(XᵀX по чанкам скана, память — квадрат словаря) и метрики пар:
+lift = P(a,b) / (P(a)·P(b)), PMI = log2(lift), Jaccard = |a∩b| / |a∪b|.
+Тепловая карта по топ-N языкам упорядочена иерархической кластеризацией,
+так что языки, которые часто живут вместе, стоят рядом.
+"""
+
+import argparse
+
+import numpy as np
+from scipy.cluster.hierarchy import leaves_list, linkage
+from scipy.spatial.distance import squareform
+
+from scripts.common.mongo import add_source_args, apply_source_args, language_cooccurrence
+from scripts.common.plot import heatmap
+from scripts.common.profiling import add_profile_args, apply_profile_args, phase
+
+METRICS = {
+    "lift": ("Lift: P(a,b) / (P(a)·P(b))", 1.0),
+    "pmi": ("PMI, бит", 0.0),
+    "jaccard": ("Jaccard", None),
+}
+
+
+def pair_metrics(counts: np.ndarray, projects: int) -> dict:
+    """Все метрики сразу для всей матрицы; пары без совместных проектов -> nan (lift/PMI) и 0 (Jaccard)."""
+    c = counts.astype(np.float64)
+    single = np.diag(c)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lift = c * projects / np.outer(single, single)
+        lift[c == 0] = np.nan
+        pmi = np.log2(lift)
+        union = single[:, None] + single[None, :] - c
+        jaccard = np.where(union > 0, c / union, 0.0)
+    return {"lift": lift, "pmi": pmi, "jaccard": jaccard}
+
+
+def cluster_order(jaccard: np.ndarray) -> np.ndarray:
+    """Порядок языков для карты: average linkage по расстоянию 1 - Jaccard."""
+    if len(jaccard) < 3:
+        return np.arange(len(jaccard))
+    dist = 1.0 - jaccard
+    np.fill_diagonal(dist, 0.0)
+    return leaves_list(linkage(squareform(dist, checks=False), method="average"))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Совместная встречаемость языков: lift / PMI / Jaccard + тепловая карта")
+    ap.add_argument("--top", type=int, default=30, help="Сколько самых частых языков показать на карте")
+    ap.add_argument("--metric", choices=sorted(METRICS), default="pmi", help="Метрика на тепловой карте")
+    ap.add_argument("--min-pair", type=int, default=20, help="Минимум совместных проектов, чтобы пара попала в топ пар")
+    ap.add_argument("--pairs", type=int, default=20, help="Сколько самых связанных пар напечатать")
+    ap.add_argument("--out", type=str, default="/app/outputs/language_cooccurrence.png", help="PNG выход")
+    ap.add_argument("--workers", type=int, default=1, help="Число процессов для параллельного скана коллекции")
+    add_source_args(ap)
+    add_profile_args(ap)
+    args = ap.parse_args()
+    apply_source_args(args)
+    apply_profile_args(args)
+
+    acc = language_cooccurrence(workers=args.workers)
+    if not acc.projects:
+        print("Нет проектов с языками. Сначала загрузите проекты.")
+        return
+
+    with phase("metrics"):
+        single = np.diag(acc.counts)
+        top = np.argsort(single)[::-1][: args.top]
+        top = top[single[top] > 0]
+        sub = acc.counts[np.ix_(top, top)]
+        m = pair_metrics(sub, acc.projects)
+        order = cluster_order(m["jaccard"])
+
+        # самые связанные пары среди всех языков (верхний треугольник, с минимальной поддержкой)
+        full = pair_metrics(acc.counts, acc.projects)
+        i, j = np.triu_indices(len(acc.counts), k=1)
+        ok = acc.counts[i, j] >= args.min_pair
+        i, j = i[ok], j[ok]
+        best = np.argsort(np.nan_to_num(full[args.metric][i, j], nan=-np.inf))[::-1][: args.pairs]
+
+    print(f"Проектов с языками: {acc.projects}, языков: {int((single > 0).sum())}")
+    print(f"Топ-{len(best)} пар по {args.metric} (не меньше {args.min_pair} совместных проектов):")
+    for k in best:
+        a, b = i[k], j[k]
+        print(f"  {acc.names[a]} + {acc.names[b]}: projects={acc.counts[a, b]} "
+              f"lift={full['lift'][a, b]:.2f} pmi={full['pmi'][a, b]:.2f} jaccard={full['jaccard'][a, b]:.3f}")
+
+    label, center = METRICS[args.metric]
+    values = m[args.metric][np.ix_(order, order)].copy()
+    np.fill_diagonal(values, np.nan)  # диагональ тривиальна и забивает шкалу
+    out = heatmap(
+        values,
+        [acc.names[top[k]] for k in order],
+        args.out,
+        title=f"Совместная встречаемость языков (топ-{len(top)}, {args.metric})",
+        cbar_label=label,
+        center=center,
+        cmap="viridis" if center is None else "RdBu_r",
+    )
+    print(f"Готово: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Куб язык × месяц × метрика (projects, stars, forks) с префиксными суммами: сборка и запросы по диапазонам.
+
+    python -m scripts.language_cube build --out /app/cache/language_cube
+    python -m scripts.language_cube query --since 2024-01 --until 2024-12 --metric stars --top 15
+    python -m scripts.language_cube query --months 3 --stat momentum --langs Python,Go,Rust
+
+Запрос не трогает Mongo: итоги, доли и momentum — разности префиксных сумм (O(1) на язык).
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from scripts.common.cube import CUBE_DIR, CUBE_METRICS, build_cube, LanguageCube
+from scripts.common.mongo import add_source_args, apply_source_args
+from scripts.common.profiling import add_profile_args, apply_profile_args
+
+
+def cmd_build(args):
+    t0 = time.perf_counter()
+    cube = build_cube()
+    path = cube.save(args.out)
+    months = cube.months
+    rng = f"{months[0]}..{months[-1]}" if len(months) else "—"
+    print(f"Куб: {len(cube.names)} языков × {cube.n_months} месяцев ({rng}) × {len(CUBE_METRICS)} метрики "
+          f"за {time.perf_counter() - t0:.1f}s -> {path}")
+
+
+def cmd_query(args):
+    cube = LanguageCube.load(args.cube)
+    t0 = time.perf_counter()
+    lo, hi = cube.span(args.since, args.until, args.months)
+    if hi < lo:
+        print("Пустой диапазон: в кубе нет этих месяцев")
+        return
+    if args.langs:
+        try:
+            langs = cube.lang_index([name.strip() for name in args.langs.split(",") if name.strip()])
+        except KeyError as e:
+            raise SystemExit(f"{e.args[0]}. Языки куба: python -m scripts.language_cube query --top {len(cube.names)}")
+    else:
+        langs = cube.top(lo, hi, args.top, args.metric)
+    window = cube.window(lo, hi, args.metric)
+    share = cube.share(lo, hi, args.metric)
+    span = hi - lo + 1
+    momentum = cube.momentum(hi, span, args.metric)
+    values = {"total": window, "share": share, "momentum": momentum}[args.stat]
+    if not args.langs:
+        langs = langs[np.argsort(-values[langs], kind="stable")]
+    us = (time.perf_counter() - t0) * 1e6
+
+    months = cube.months
+    print(f"{months[lo]}..{months[hi]} ({span} мес.), метрика {args.metric}, всего {int(window.sum())}; "
+          f"momentum = последние {span} мес. / предыдущие {span}")
+    print(f"{'язык':<20} {'total':>12} {'share':>8} {'momentum':>9}")
+    for i in langs:
+        print(f"{cube.names[i]:<20} {int(window[i]):>12} {share[i]:>8.2%} {momentum[i]:>9.2f}")
+    print(f"[{us:.0f} µs]")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Куб язык×месяц: сборка и запросы по произвольным диапазонам месяцев")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="Собрать куб из Mongo или снапшота и сохранить")
+    p_build.add_argument("--out", type=str, default=CUBE_DIR, help="Каталог куба")
+    add_source_args(p_build)
+    add_profile_args(p_build)
+    p_build.set_defaults(func=cmd_build)
+
+    p_query = sub.add_parser("query", help="Итоги / доли / momentum за диапазон месяцев")
+    p_query.add_argument("--cube", type=str, default=CUBE_DIR, help="Каталог куба")
+    p_query.add_argument("--since", type=str, default=None, help="Первый месяц включительно, YYYY-MM")
+    p_query.add_argument("--until", type=str, default=None, help="Последний месяц включительно, YYYY-MM")
+    p_query.add_argument("--months", type=int, default=None, help="Последние N месяцев до --until")
+    p_query.add_argument("--metric", choices=CUBE_METRICS, default="projects")
+    p_query.add_argument("--stat", choices=["total", "share", "momentum"], default="total", help="Порядок строк")
+    p_query.add_argument("--top", type=int, default=20, help="Сколько языков показать (если не задан --langs)")
+    p_query.add_argument("--langs", type=str, default=None, help="Конкретные языки через запятую")
+    p_query.set_defaults(func=cmd_query)
+
+    args = ap.parse_args()
+    if args.cmd == "build":
+        apply_source_args(args)
+        apply_profile_args(args)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
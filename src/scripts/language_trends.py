@@ -1,87 +1,24 @@
-from collections import defaultdict
-from typing import Dict, List
-from app.db import get_db
-from app.config import SETTINGS
-from scripts.common.plot_forcast import plot_trends, plot_timeseries_absolute, plot_timeseries_share
+from typing import List
+from scripts.common.backtest import MODELS_FILE, load_models, model_forecaster
+from scripts.common.cube import LanguageCube, load_or_build
+from scripts.common.mongo import add_source_args, apply_source_args
+from scripts.common.profiling import add_profile_args, apply_profile_args
+from scripts.common.plot_forcast import ols_slopes, plot_trends, plot_timeseries_absolute, plot_timeseries_share
 import os
 import argparse
 import numpy as np
 
 
-def load_language_timeseries(months: int, top: int, until: str | None = None) -> Dict[str, List[int]]:
+def load_language_timeseries(cube: LanguageCube, months: int, top: int, until: str | None = None):
     """
-    Возвращает:
-    {
-      "Python": [12, 15, 18, ...],
-      "Java":   [10,  9,  8,  ...],
-    }
+    Топ языков по сумме проектов за всю историю до until и их помесячные ряды за последние months месяцев:
+    (индексы языков в кубе, [lo, hi] месяцев, массив языки × месяцы).
     """
-    db = get_db()
-    coll = db[SETTINGS.mongo_coll_projects]
-
-    pipeline = []
-
-    if until:
-        pipeline.append({
-            "$match": {
-                "last_activity_at": {
-                    "$lte": f"{until}-31"
-                }
-            }
-        })
-
-    pipeline.extend([
-        {
-            "$project": {
-                "languages": {"$objectToArray": "$languages"},
-                "month": {
-                    "$dateToString": {
-                        "format": "%Y-%m",
-                        "date": {"$toDate": "$last_activity_at"}
-                    }
-                }
-            }
-        },
-        {"$unwind": "$languages"},
-        {
-            "$group": {
-                "_id": {
-                    "language": "$languages.k",
-                    "month": "$month"
-                },
-                "count": {"$sum": 1}
-            }
-        },
-        {"$sort": {"_id.month": 1}},
-    ])
-
-
-    rows = list(coll.aggregate(pipeline, allowDiskUse=True))
+    lo, hi = cube.span(until=until, months=months)
+    langs = cube.top(0, hi, top)
+    return langs, (lo, hi), cube.series(lo, hi, "projects", langs)
 
-    # сгруппировать в language → month → count
-    temp = defaultdict(dict)
-    for r in rows:
-        lang = r["_id"]["language"]
-        month = r["_id"]["month"]
-        temp[lang][month] = r["count"]
-
-    # берём top языков по сумме
-    ranked = sorted(
-        temp.items(),
-        key=lambda kv: sum(kv[1].values()),
-        reverse=True
-    )[:top]
-
-    # унифицируем ось времени
-    all_months = sorted({m for _, d in ranked for m in d.keys()})[-months:]
-
-    series = {}
-    for lang, data in ranked:
-        series[lang] = [data.get(m, 0) for m in all_months]
-
-    return series, all_months
-
-def compute_trends(series: Dict[str, List[int]]) -> List[dict]:
+def compute_trends(cube: LanguageCube, langs: np.ndarray, lo: int, hi: int) -> List[dict]:
     """
     Возвращает список:
     {
@@ -91,33 +28,30 @@ def compute_trends(series: Dict[str, List[int]]) -> List[dict]:
       momentum,
       volume
     }
+    current/momentum/volume — O(1) запросы к префиксным суммам куба.
     """
-    results = []
+    if hi - lo + 1 < 4:
+        return []
 
-    for lang, ys in series.items():
-        if len(ys) < 4:
-            continue
+    ys = cube.series(lo, hi, "projects", langs)
+    current = cube.window(hi, hi)[langs]
+    # momentum: последние 3 месяца / предыдущие 3 (если ряд короче 6 месяцев — делим на 1, как раньше)
+    momentum = cube.momentum(hi, 3)[langs] if hi - lo + 1 >= 6 else cube.window(hi - 2, hi)[langs].astype(float)
+    volume = cube.window(lo, hi)[langs]
 
-        x = np.arange(len(ys))
-        y = np.array(ys)
+    # линейный тренд: наклоны OLS всех языков одним умножением матрицы
+    slopes = ols_slopes(ys)
 
-        # линейный тренд
-        slope = float(np.polyfit(x, y, 1)[0])
-
-        # momentum: последние 3 месяца / предыдущие 3
-        recent = sum(y[-3:])
-        prev = sum(y[-6:-3]) if len(y) >= 6 else 1
-        momentum = recent / max(prev, 1)
-
-        results.append({
-            "language": lang,
-            "trend": slope,
-            "current": y[-1],
-            "momentum": momentum,
-            "volume": int(sum(y)),
-        })
-
-    return results
+    return [
+        {
+            "language": cube.names[li],
+            "trend": float(slopes[i]),
+            "current": int(current[i]),
+            "momentum": float(momentum[i]),
+            "volume": int(volume[i]),
+        }
+        for i, li in enumerate(langs)
+    ]
 
 def main():
     ap = argparse.ArgumentParser("Прогноз популярности языков")
@@ -126,17 +60,43 @@ def main():
     ap.add_argument("--out", type=str, default="/app/outputs")
     ap.add_argument("--until", type=str, default=None, help="Последний месяц включительно, формат YYYY-MM")
     ap.add_argument("--forecast", type=int, default=6, help="Число месяцев прогноза")
+    ap.add_argument("--trend-langs", type=int, default=None,
+                    help="Для скольких языков (по объёму) считать тренды; 0 = все, по умолчанию = --top")
+    ap.add_argument("--cube", type=str, default=None,
+                    help="Готовый куб язык×месяц (python -m scripts.language_cube build); по умолчанию строится из источника")
+    ap.add_argument("--models", type=str, default=MODELS_FILE,
+                    help="Лучшие модели по языкам (python -m scripts.language_backtest); нет файла — rolling OLS для всех")
+    add_source_args(ap)
+    add_profile_args(ap)
 
     args = ap.parse_args()
+    apply_source_args(args)
+    apply_profile_args(args)
 
     os.makedirs(args.out, exist_ok=True)
 
-    series, months = load_language_timeseries(args.months, args.top, args.until)
-    trends = compute_trends(series)
+    cube = load_or_build(args.cube)
+    langs, (lo, hi), series = load_language_timeseries(cube, args.months, args.top, args.until)
+    if not len(langs):
+        print("Нет данных по месяцам. Сначала загрузите проекты.")
+        return
+    trend_langs = langs if args.trend_langs is None else cube.top(0, hi, args.trend_langs or len(cube.names))
+    trends = compute_trends(cube, trend_langs, lo, hi)
+    names = [cube.names[i] for i in langs]
+    months = [str(m) for m in cube.months[lo: hi + 1]]
+    # знаменатель доли — все языки месяца, а не только показанные топ-N
+    totals = cube.series(lo, hi).sum(axis=0)
+
+    models = load_models(args.models)
+    if models:
+        print(f"[forecast] модели по языкам: {args.models} ({len(models)} языков)")
+    forecaster = model_forecaster(models)
 
     plot_trends(trends, f"{args.out}/forecast_trends.png")
-    plot_timeseries_absolute(series, months, f"{args.out}/forecast_timeseries_absolute.png", forecast=args.forecast)
-    plot_timeseries_share(series, months, f"{args.out}/forecast_timeseries_share.png", forecast=args.forecast)
+    plot_timeseries_absolute(names, series, months, f"{args.out}/forecast_timeseries_absolute.png",
+                             forecast=args.forecast, forecaster=forecaster)
+    plot_timeseries_share(names, series, totals, months, f"{args.out}/forecast_timeseries_share.png",
+                          forecast=args.forecast, forecaster=forecaster)
 
     print("Готово")
 
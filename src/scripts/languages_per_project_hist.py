@@ -3,7 +3,8 @@
 """
 import argparse
 import os
-from scripts.common.mongo import histogram_languages_per_project_batched
+from scripts.common.mongo import add_source_args, apply_source_args, histogram_languages_per_project_batched
+from scripts.common.profiling import add_profile_args, apply_profile_args
 from scripts.common.plot import bar_chart
 
 BATCH_SIZE = 1000
@@ -13,11 +14,16 @@ def main():
     ap.add_argument("--out", type=str, default="/app/outputs/languages_per_project.png", help="PNG выход")
     ap.add_argument("--top", type=int, default=None, help="Ограничить максимумом языков (например 20)")
     ap.add_argument("--debug", action="store_true", help="Печатать больше диагностики")
+    ap.add_argument("--workers", type=int, default=1, help="Число процессов для параллельного скана коллекции")
+    add_source_args(ap)
+    add_profile_args(ap)
     args = ap.parse_args()
+    apply_source_args(args)
+    apply_profile_args(args)
 
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
 
-    hist = histogram_languages_per_project_batched(limit=args.top)
+    hist = histogram_languages_per_project_batched(limit=args.top, workers=args.workers)
     if not hist:
         print("Нет данных. Сначала запусти сбор/агрегацию.")
         return
@@ -5,11 +5,10 @@
 """
 
 import argparse
-from collections import defaultdict
-from statistics import median
-from typing import Dict, List, Tuple
+from typing import List, Tuple
 
-from scripts.common.mongo import iter_projects
+from scripts.common.mongo import add_source_args, apply_source_args, values_by_language
+from scripts.common.profiling import add_profile_args, apply_profile_args
 from scripts.common.plot import barh_chart
 
 
@@ -18,39 +17,24 @@ def main():
     ap.add_argument("--top", type=int, default=20, help="Показать топ-N языков по медиане звёзд")
     ap.add_argument("--min-projects", type=int, default=10, help="Минимум проектов на язык для расчёта медианы")
     ap.add_argument("--out", type=str, default="/app/outputs/median_stars_by_language.png", help="PNG выход")
+    ap.add_argument("--workers", type=int, default=1, help="Число процессов для параллельного скана коллекции")
+    add_source_args(ap)
+    add_profile_args(ap)
     args = ap.parse_args()
+    apply_source_args(args)
+    apply_profile_args(args)
 
-    buckets: Dict[str, List[int]] = defaultdict(list)
-    total_seen = 0
-    with_stars = 0
+    # тянем только нужные поля; при --workers > 1 скан идёт параллельно по диапазонам project_id
+    acc = values_by_language("star_count", workers=args.workers)
+    total_seen = acc.seen
+    with_stars = acc.valid
 
-    # читаем только нужные поля
-    for p in iter_projects({"languages": 1, "star_count": 1}):
-        total_seen += 1
-        langs = list((p.get("languages") or {}).keys())
-        stars = p.get("star_count")
-
-        # валидируем star_count
-        if not langs or not isinstance(stars, (int, float)) or stars < 0:
-            continue
-
-        with_stars += 1
-        stars_i = int(stars)
-
-        # один проект учитываем по одному разу на язык
-        for lang in set(langs):
-            buckets[lang].append(stars_i)
-
-    if not buckets:
+    if not len(acc.lang):
         print("Нет данных по звёздам/языкам. Сначала загрузите проекты и их языки.")
         return
 
     # медианы по языкам + фильтр редких
-    medians: List[Tuple[str, float, int]] = []
-    for lang, vals in buckets.items():
-        if len(vals) < args.min_projects:
-            continue
-        medians.append((lang, float(median(vals)), len(vals)))
+    medians: List[Tuple[str, float, int]] = [m for m in acc.medians() if m[2] >= args.min_projects]
 
     if not medians:
         print(f"После фильтра по min-projects={args.min_projects} не осталось языков. Уменьшите порог.")
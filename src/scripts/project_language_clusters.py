@@ -1,16 +1,22 @@
 """
 ML-кластеризация проектов GitLab по использованным языкам
 (батчево, без сохранения в Mongo)
+
+--dedup: вместо всех проектов кластеризуются уникальные языковые векторы
+(сигнатура — отсортированные языки с процентами, округлёнными до --bin-pct)
+с весом = числу проектов; KMeans и PCA получают sample_weight, метки
+раздаются обратно проектам через их сигнатуру.
 """
 
 import argparse
 import numpy as np
-from sklearn.feature_extraction import DictVectorizer
-from sklearn.cluster import MiniBatchKMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.decomposition import IncrementalPCA
 
-from scripts.common.mongo import iter_projects
-from scripts.common.batch import batched
+from scripts.common.mongo import (
+    add_source_args, apply_source_args, iter_project_batches, language_signatures, scan_has_ids, scan_vocab,
+)
+from scripts.common.profiling import add_profile_args, apply_profile_args, phase
 from scripts.common.plot_scatter import scatter_clusters
 
 BATCH = 1000
@@ -84,17 +90,64 @@ def name_cluster(center, feature_names):
     return "Miscellaneous / Experimental"
 
 
-def main():
-    ap = argparse.ArgumentParser(
-        description="ML clustering of projects by languages (RAM-safe)"
-    )
-    ap.add_argument("--clusters", type=int, default=6, help="Number of clusters")
-    ap.add_argument("--max-projects", type=int, default=50000, help="Limit projects")
-    ap.add_argument("--out", type=str, required=True, help="PNG output")
-    args = ap.parse_args()
+def weighted_pca(X, w, n_components=2):
+    """PCA с весами строк: собственные векторы взвешенной ковариации (признаков мало — матрица width×width)."""
+    total = w.sum()
+    mean = np.asarray(X.T @ w).ravel() / total
+    cov = np.asarray((X.T @ X.multiply(w[:, None]).tocsr()).todense()) / total - np.outer(mean, mean)
+    vals, vecs = np.linalg.eigh(cov)
+    comps = vecs[:, np.argsort(vals)[::-1][:n_components]].T
+    # знак как у sklearn (svd_flip): наибольшая по модулю координата положительна
+    signs = np.sign(comps[np.arange(len(comps)), np.abs(comps).argmax(axis=1)])
+    comps *= signs[:, None]
+    return mean, comps
+
+
+def cluster_signatures(args):
+    """KMeans + PCA на уникальных сигнатурах с весами; -> (центры, 2D-точки выборки проектов, их метки, признаки)."""
+    with phase("signatures"):
+        print(f"[1/3] Grouping projects by language signature (bin={args.bin_pct}%)...")
+        sigs = language_signatures(args.bin_pct, workers=args.workers)
+        X = sigs.to_csr()
+        w = sigs.count.astype(np.float64)
+        total = int(w.sum())
+        if not total:
+            raise SystemExit("Нет проектов с языками")
+        print(f"  {total} projects -> {X.shape[0]} unique signatures ({total / X.shape[0]:.0f}x fewer rows)")
+
+    with phase("kmeans_fit"):
+        print("[2/3] Training KMeans on signatures (sample_weight = projects)...")
+        kmeans = KMeans(n_clusters=args.clusters, n_init=4, random_state=RANDOM_STATE)
+        labels = kmeans.fit_predict(X, sample_weight=w)
+        sizes = np.bincount(labels, weights=w, minlength=args.clusters).astype(np.int64)
+        print("  projects per cluster: " + ", ".join(str(v) for v in sizes))
+
+    with phase("pca_fit"):
+        mean, comps = weighted_pca(X, w)
+
+    with phase("project"):
+        print("[3/3] Projecting and plotting...")
+        # выборка проектов: сигнатура с вероятностью, пропорциональной числу её проектов
+        rng = np.random.default_rng(RANDOM_STATE)
+        pick = rng.choice(X.shape[0], size=min(args.max_projects, total), p=w / w.sum())
+        X2 = np.asarray(X[pick] @ comps.T) - mean @ comps.T
+        return kmeans.cluster_centers_, X2, labels[pick].tolist(), sigs.names
+
+
+def cluster_rows(args):
+    """Исходный режим: MiniBatchKMeans и IncrementalPCA по всем проектам."""
+    # признаки — id языков из общего словаря (без DictVectorizer и строковых ключей)
+    vocab = scan_vocab()
+    if not scan_has_ids():
+        # без lang_ids id раздаёт сам скан: ширину признаков узнаём отдельным проходом
+        with phase("vocab"):
+            print("[0/3] Collecting languages...")
+            for _ in iter_project_batches(vocab=vocab):
+                pass
+    width = len(vocab)
+    if not width:
+        raise SystemExit("Нет проектов с языками")
 
-    # === MODELS ===
-    vec = DictVectorizer(sparse=True)
     kmeans = MiniBatchKMeans(
         n_clusters=args.clusters,
         batch_size=BATCH,
@@ -102,89 +155,103 @@ def main():
     )
     ipca = IncrementalPCA(n_components=2, batch_size=BATCH)
 
+    def iter_matrices():
+        for big in iter_project_batches(vocab=vocab):
+            for start in range(0, len(big), BATCH):
+                X, _ = big.slice(start, start + BATCH).to_csr(width)
+                if X.shape[0]:
+                    yield X
+
     # === 1. TRAIN KMEANS (PARTIAL FIT) ===
-    fitted_vec = False
     seen = 0
 
-    print("[1/3] Training MiniBatchKMeans...")
-    next_log = LOG_THRESHOLD
-
-    for batch in batched(iter_projects({"languages": 1}), BATCH):
-        batch = [p for p in batch if p.get("languages")]
-        if not batch:
-            continue
-
-        X = (
-            vec.fit_transform(p["languages"] for p in batch)
-            if not fitted_vec
-            else vec.transform(p["languages"] for p in batch)
-        )
+    with phase("kmeans_fit"):
+        print("[1/3] Training MiniBatchKMeans...")
+        next_log = LOG_THRESHOLD
 
-        kmeans.partial_fit(X)
-        fitted_vec = True
+        for X in iter_matrices():
+            kmeans.partial_fit(X)
 
-        seen += len(batch)
+            seen += X.shape[0]
 
-        if seen >= next_log:
-            print(f"  trained on {seen} projects")
-            next_log += LOG_THRESHOLD
+            if seen >= next_log:
+                print(f"  trained on {seen} projects")
+                next_log += LOG_THRESHOLD
 
     # === 2. FIT PCA ===
-    print("[2/3] Fitting Incremental PCA...")
+    with phase("pca_fit"):
+        print("[2/3] Fitting Incremental PCA...")
 
-    seen = 0
-    next_log = LOG_THRESHOLD
-    for batch in batched(iter_projects({"languages": 1}), BATCH):
-        batch = [p for p in batch if p.get("languages")]
-        if not batch:
-            continue
-
-        X = vec.transform(p["languages"] for p in batch).toarray()
-        ipca.partial_fit(X)
-
-        seen += len(batch)
-        if seen >= args.max_projects:
-            break
-        if seen >= next_log:
-            print(f"  fit {seen} projects")
-            next_log += LOG_THRESHOLD
+        seen = 0
+        next_log = LOG_THRESHOLD
+        for X in iter_matrices():
+            ipca.partial_fit(X.toarray())
+
+            seen += X.shape[0]
+            if seen >= args.max_projects:
+                break
+            if seen >= next_log:
+                print(f"  fit {seen} projects")
+                next_log += LOG_THRESHOLD
 
     # === 3. TRANSFORM + PLOT ===
-    print("[3/3] Projecting and plotting...")
+    with phase("project"):
+        print("[3/3] Projecting and plotting...")
 
-    X_all = []
-    y_all = []
-    seen = 0
-    next_log = LOG_THRESHOLD
+        X_all = []
+        y_all = []
+        seen = 0
+        next_log = LOG_THRESHOLD
+
+        for X in iter_matrices():
+            X = X.toarray()
+            X2 = ipca.transform(X)
+            labels = kmeans.predict(X)
 
-    for batch in batched(iter_projects({"languages": 1}), BATCH):
-        batch = [p for p in batch if p.get("languages")]
-        if not batch:
-            continue
+            X_all.append(X2)
+            y_all.extend(labels.tolist())
 
-        X = vec.transform(p["languages"] for p in batch).toarray()
-        X2 = ipca.transform(X)
-        labels = kmeans.predict(X)
+            seen += X.shape[0]
+            if seen >= args.max_projects:
+                break
+            if seen >= next_log:
+                print(f"  processed {seen} projects")
+                next_log += LOG_THRESHOLD
 
-        X_all.append(X2)
-        y_all.extend(labels.tolist())
+        X_all = np.vstack(X_all)
 
-        seen += len(batch)
-        if seen >= args.max_projects:
-            break
-        if seen >= next_log:
-            print(f"  processed {seen} projects")
-            next_log += LOG_THRESHOLD
+    return kmeans.cluster_centers_, X_all, y_all, vocab.names[:width]
 
-    X_all = np.vstack(X_all)
 
-    features = vec.get_feature_names_out()
+def main():
+    ap = argparse.ArgumentParser(
+        description="ML clustering of projects by languages (RAM-safe)"
+    )
+    ap.add_argument("--clusters", type=int, default=6, help="Number of clusters")
+    ap.add_argument("--max-projects", type=int, default=50000, help="Limit projects")
+    ap.add_argument("--out", type=str, required=True, help="PNG output")
+    ap.add_argument("--dedup", action="store_true",
+                    help="Cluster unique language signatures weighted by project count instead of every project")
+    ap.add_argument("--bin-pct", type=float, default=5.0,
+                    help="--dedup: round language percentages to this step for the signature (0 = exact)")
+    ap.add_argument("--workers", type=int, default=1, help="--dedup without migrated lang_ids or from a snapshot: scan processes")
+    add_source_args(ap)
+    add_profile_args(ap)
+    args = ap.parse_args()
+    apply_source_args(args)
+    apply_profile_args(args)
+
+    # === MODELS ===
+    if args.dedup:
+        centers, X_all, y_all, features = cluster_signatures(args)
+    else:
+        centers, X_all, y_all, features = cluster_rows(args)
 
     print("\n=== Cluster interpretation ===")
 
     cluster_names = {}
 
-    for i, center in enumerate(kmeans.cluster_centers_):
+    for i, center in enumerate(centers):
         name = name_cluster(center, features)
         cluster_names[i] = name
 
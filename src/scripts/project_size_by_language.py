@@ -9,7 +9,8 @@ from statistics import median
 from typing import Dict, List, Tuple
 import logging
 
-from scripts.common.mongo import iter_projects
+from scripts.common.mongo import add_source_args, apply_source_args, iter_projects
+from scripts.common.profiling import add_profile_args, apply_profile_args
 from scripts.common.plot import barh_chart
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -228,7 +229,11 @@ def main():
         help="Путь для сохранения графика"
     )
 
+    add_source_args(parser)
+    add_profile_args(parser)
     args = parser.parse_args()
+    apply_source_args(args)
+    apply_profile_args(args)
 
     # Анализируем масштаб проектов
     metrics_data = analyze_project_scale()